@@ -2,31 +2,159 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+import pytz
 import os
 
-db = SQLAlchemy()
+from app.database import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 login = LoginManager()
-login.login_view = 'auth.login'
+login.login_view = 'main.login'
 login.login_message_category = 'info'
 
-def create_app():
+# Business configuration
+BUSINESS_NAME = "Divine Talks with Zahrah Imani"
+ADMIN_EMAIL = "tkophotography2004@gmail.com"
+TIKTOK_URL = "https://www.tiktok.com/@tkotalks"
+TIMEZONE = pytz.timezone('US/Central')  # CST timezone
+
+# Session pricing (in cents for Stripe)
+SESSION_TYPES = {
+    'quick_guidance': {
+        'name': 'Quick Guidance',
+        'duration': 10,
+        'price': 1700,  # $17.00
+        'description': 'Brief spiritual insights for immediate clarity and daily guidance'
+    },
+    'deep_dive': {
+        'name': 'Deep Dive Session',
+        'duration': 30,
+        'price': 9700,  # $97.00
+        'description': 'Comprehensive spiritual exploration with ancestral wisdom and transformation guidance'
+    },
+    'intensive_healing': {
+        'name': 'Intensive Healing',
+        'duration': 60,
+        'price': 29700,  # $297.00
+        'description': 'Complete spiritual realignment including soul work, trauma clearing, and deep healing'
+    }
+}
+
+def create_app(config=None):
+    """Application factory; `config` overrides settings read from the environment"""
+    from dotenv import load_dotenv
+    load_dotenv()
+
     app = Flask(__name__)
 
     # Configuration
-    app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY') or 'divine-secret-key-change-in-production'
+    app.config['SECRET_KEY'] = (os.environ.get('FLASK_SECRET_KEY') or os.environ.get('SECRET_KEY')
+                                or 'divine-secret-key-change-in-production')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or 'sqlite:///divine_talks.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['WTF_CSRF_ENABLED'] = True
+    app.config['BOOKING_HOLD_MINUTES'] = int(os.environ.get('BOOKING_HOLD_MINUTES', 15))
+
+    # Password hashing: changing the method rehashes each account on its next login
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    app.config['PASSWORD_HASH_QUEUE'] = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+
+    # Stripe configuration
+    app.config['STRIPE_SECRET_KEY'] = os.environ.get('STRIPE_SECRET_KEY')
+    app.config['STRIPE_PUBLISHABLE_KEY'] = os.environ.get('STRIPE_PUBLISHABLE_KEY')
+    app.config['STRIPE_WEBHOOK_SECRET'] = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    app.config['STRIPE_CLIENT'] = os.environ.get('STRIPE_CLIENT', 'live')  # 'fake' for offline development
+
+    # Hedra configuration
+    app.config['HEDRA_API_KEY'] = os.environ.get('HEDRA_API_KEY')
+    app.config['HEDRA_API_URL'] = os.environ.get('HEDRA_API_URL', 'https://api.hedra.com')
+    app.config['HEDRA_AVATAR_ID'] = os.environ.get('HEDRA_AVATAR_ID')
+
+    # Outgoing mail (booking confirmations, session reminders); unset SMTP_HOST keeps it queued
+    app.config['SMTP_HOST'] = os.environ.get('SMTP_HOST')
+    app.config['SMTP_PORT'] = int(os.environ.get('SMTP_PORT', 587))
+    app.config['SMTP_USERNAME'] = os.environ.get('SMTP_USERNAME')
+    app.config['SMTP_PASSWORD'] = os.environ.get('SMTP_PASSWORD')
+    app.config['SMTP_STARTTLS'] = os.environ.get('SMTP_STARTTLS', 'true').lower() in ('1', 'true', 'yes')
+    app.config['MAIL_FROM'] = os.environ.get('MAIL_FROM') or f'{BUSINESS_NAME} <{ADMIN_EMAIL}>'
+
+    # Log requests that run more SQL statements than this; 0 disables the check
+    app.config['QUERY_BUDGET'] = int(os.environ.get('QUERY_BUDGET', 0))
+
+    # Keep stack samples of requests slower than this; 0 leaves the profiler off
+    app.config['PROFILE_SLOW_REQUESTS_MS'] = int(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+
+    # Connection pools sized for the gunicorn worker model (see app/database.py)
+    from app import database
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', database.default_pool_size()))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', database.DEFAULT_MAX_OVERFLOW))
+    app.config['DB_POOL_TIMEOUT'] = int(os.environ.get('DB_POOL_TIMEOUT', database.DEFAULT_POOL_TIMEOUT))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', database.DEFAULT_POOL_RECYCLE))
+
+    # Read replica for read-only views; unset sends everything to the primary
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+
+    # Admission control: concurrent requests per process (its thread count) and
+    # proxies in front of the app whose X-Forwarded-For is trusted for client IPs
+    app.config['ADMISSION_CAPACITY'] = int(os.environ.get('ADMISSION_CAPACITY',
+                                                          os.environ.get('GUNICORN_THREADS', 4)))
+    app.config['ADMISSION_PROXY_HOPS'] = int(os.environ.get('ADMISSION_PROXY_HOPS', 1))
+
+    if config:
+        app.config.update(config)
 
     # Initialize extensions
+    database.configure(app)
     db.init_app(app)
     migrate.init_app(app, db)
     login.init_app(app)
 
+    # Per-request SQL statement counts (X-Query-Count, QUERY_BUDGET warnings)
+    from app import query_counter
+    query_counter.init_app(app)
+
+    # Latency, SQL, template and external-call histograms for /admin/metrics
+    from app import metrics
+    metrics.init_app(app)
+
+    # Rate limits and concurrency caps for login, registration and availability
+    from app import admission
+    admission.init_app(app)
+
+    # Cached user loader: current_user comes from the identity cache, not a query per request
+    from app import identity
+    identity.init_app(app)
+    login.user_loader(identity.load_identity)
+
+    # Shared renderings of public pages for anonymous visitors
+    from app import page_cache
+    page_cache.init_app(app)
+
+    # Fingerprinted static assets and the asset_url() template helper
+    from app import assets
+    assets.init_app(app)
+
     # Register blueprints
     from app.routes import bp as main_bp
     app.register_blueprint(main_bp)
 
-    return app
+    # CLI commands: init-db, seed-admin, audit-query-plans, rebuild-rollups, ...
+    from app import (cli, exports, query_plans, rollups, hedra, notifications, reservations, session_events,
+                     session_log, webhooks)
+    cli.init_app(app)
+    database.init_app(app)
+    exports.init_app(app)
+    query_plans.init_app(app)
+    rollups.init_app(app)
 
-from app import models
+    # Background jobs (started lazily per worker process)
+    reservations.init_app(app)
+    webhooks.init_app(app)
+    session_log.init_app(app)
+    session_events.init_app(app)
+    hedra.init_app(app)
+    notifications.init_app(app)
+
+    return app
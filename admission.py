@@ -0,0 +1,266 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import current_app, g, jsonify, make_response, request
+from flask_login import current_user
+
+from app import auth
+
+DEFAULT_CAPACITY = 4  # concurrent requests per process; gunicorn's default gthread pool
+DEFAULT_MAX_BUCKETS = 100000
+SHED_RETRY_AFTER = 1  # seconds suggested to clients turned away by a full class
+
+
+class Rate:
+    """`count` requests per `seconds`, allowing bursts of up to `burst`"""
+
+    def __init__(self, count, seconds, burst=None):
+        self.per_second = count / seconds
+        self.burst = burst or count
+
+
+class AdmissionClass:
+    """Endpoints admitted under one policy
+
+    Only requests with one of `methods` belong to the class. `share` is the
+    fraction of the process's capacity the class may occupy. Priority classes
+    may use all of it, including the slots held back from everyone else, and
+    are never rate limited.
+    """
+
+    def __init__(self, name, endpoints, share=1.0, priority=False, per_ip=None, per_user=None,
+                 methods=('GET', 'HEAD', 'POST'), json=False):
+        self.name = name
+        self.endpoints = frozenset(endpoints)
+        self.share = share
+        self.priority = priority
+        self.per_ip = per_ip
+        self.per_user = per_user
+        self.methods = frozenset(methods)
+        self.json = json
+
+
+DEFAULT_CLASSES = (
+    AdmissionClass('paid', ('main.payment', 'main.payment_success', 'main.session_room', 'main.stripe_webhook'),
+                   priority=True),
+    # Password hashing is the expensive part; showing the forms is left alone
+    AdmissionClass('auth', ('main.login', 'main.register'), share=0.5,
+                   per_ip=Rate(20, 60), per_user=Rate(5, 60), methods=('POST',)),
+    AdmissionClass('browse', ('main.get_available_times', 'main.get_available_times_range'), share=0.5,
+                   per_ip=Rate(30, 10), per_user=Rate(20, 10), json=True),
+    # Session-room event streams hold their thread for the whole session (see hold())
+    AdmissionClass('events', ('main.session_event_stream',), share=0.5, methods=('GET',)),
+)
+
+
+class AdmissionBackend:
+    """Shared store (e.g. Redis) for token buckets, so rate limits span every worker"""
+
+    def take(self, key, rate):
+        """Spend a token from the bucket at `key`; returns 0 if one was available,
+        otherwise the seconds until one will be"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class InMemoryAdmissionBackend(AdmissionBackend):
+    """Per-process token buckets, bounded to the most recently used `max_buckets` keys
+
+    An evicted bucket comes back full, which only matters to a client that
+    outlasts that many others.
+    """
+
+    def __init__(self, max_buckets=DEFAULT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # key -> (tokens, updated at)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = rate.burst
+            else:
+                tokens = min(rate.burst, bucket[0] + (now - bucket[1]) * rate.per_second)
+                self._buckets.move_to_end(key)
+
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate.per_second
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class AdmissionController:
+    """Decides per request whether to serve it now, throttle it (429) or shed it (503)
+
+    Concurrency is counted per process, since that is where threads run out.
+    Requests outside any class count towards the total but are never refused.
+    """
+
+    def __init__(self, classes=DEFAULT_CLASSES, capacity=DEFAULT_CAPACITY, reserved=None, backend=None):
+        self.capacity = capacity
+        # Held back for priority classes, so paying customers find a free thread
+        self.reserved = max(1, capacity // 4) if reserved is None else reserved
+        self.backend = backend or InMemoryAdmissionBackend()
+        self.by_endpoint = {endpoint: admission_class
+                            for admission_class in classes for endpoint in admission_class.endpoints}
+        self.limits = {admission_class.name: max(1, int(capacity * admission_class.share))
+                       for admission_class in classes}
+        self.in_flight = Counter()
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def classify(self, endpoint, method):
+        admission_class = self.by_endpoint.get(endpoint)
+        if admission_class is not None and method in admission_class.methods:
+            return admission_class
+        return None
+
+    def enter(self, admission_class):
+        """Count a request in; False when it should be shed instead"""
+        name = admission_class.name if admission_class is not None else None
+        with self._lock:
+            if admission_class is not None and not admission_class.priority:
+                if (self.in_flight[name] >= self.limits[name]
+                        or self.total >= self.capacity - self.reserved):
+                    return False
+            self.in_flight[name] += 1
+            self.total += 1
+            return True
+
+    def leave(self, admission_class):
+        name = admission_class.name if admission_class is not None else None
+        with self._lock:
+            self.in_flight[name] -= 1
+            self.total -= 1
+
+    def retry_after(self, admission_class, client_ip, user_key):
+        """0 when the client's buckets allow the request, otherwise seconds to wait"""
+        wait = 0
+        if admission_class.per_ip is not None:
+            wait = self.backend.take(f'{admission_class.name}:ip:{client_ip}', admission_class.per_ip)
+        if not wait and admission_class.per_user is not None and user_key:
+            wait = self.backend.take(f'{admission_class.name}:user:{user_key}', admission_class.per_user)
+        return wait
+
+
+def get_admission():
+    return current_app.extensions.get('admission')
+
+
+def client_ip():
+    """The client's address, trusting X-Forwarded-For for ADMISSION_PROXY_HOPS proxies"""
+    hops = current_app.config.get('ADMISSION_PROXY_HOPS', 0)
+    route = request.access_route if hops else []
+    if len(route) >= hops > 0:
+        return route[-hops]
+    return request.remote_addr
+
+
+def user_key():
+    """Who a request acts for: the signed-in user, or the account a login names"""
+    if current_user.is_authenticated:
+        return current_user.get_id()
+    if request.endpoint == 'main.login' and request.method == 'POST':
+        return auth.normalize_identifier(request.form.get('username')) or None
+    return None
+
+
+class HeldBody:
+    """A streamed response body that keeps its request counted in until it is closed"""
+
+    def __init__(self, body, release):
+        self.body = body
+        self._release = release
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        # The WSGI server closes the body whether or not it was ever iterated
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+def hold(body):
+    """Keep the current request counted in while `body` streams
+
+    Flask tears the request down before a streamed body is sent, which would
+    count a long-lived stream out while it still occupies a thread.
+    """
+    controller = get_admission()
+    if controller is None or '_admission_class' not in g:
+        return body
+    admission_class = g.pop('_admission_class')
+    return HeldBody(body, lambda: controller.leave(admission_class))
+
+
+def refuse(admission_class, status, retry_after, message):
+    if admission_class.json:
+        response = jsonify({'error': message})
+    else:
+        response = make_response(message)
+        response.mimetype = 'text/plain'
+    response.status_code = status
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def init_app(app, backend=None):
+    """Rate-limit and cap login, registration and availability; paid flows go first
+
+    ADMISSION_CAPACITY is the concurrent requests a process serves (its thread
+    count). `backend` (or ADMISSION_BACKEND) shares the token buckets between
+    workers. ADMISSION_ENABLED turns the whole layer off.
+    """
+    if not app.config.get('ADMISSION_ENABLED', True):
+        return
+
+    controller = app.extensions['admission'] = AdmissionController(
+        classes=app.config.get('ADMISSION_CLASSES', DEFAULT_CLASSES),
+        capacity=app.config.get('ADMISSION_CAPACITY', DEFAULT_CAPACITY),
+        reserved=app.config.get('ADMISSION_RESERVED'),
+        backend=backend or app.config.get('ADMISSION_BACKEND'),
+    )
+
+    @app.before_request
+    def admit_request():
+        admission_class = controller.classify(request.endpoint, request.method)
+        if admission_class is not None and not admission_class.priority:
+            wait = controller.retry_after(admission_class, client_ip(), user_key())
+            if wait:
+                return refuse(admission_class, 429, wait, 'Too many requests. Please try again shortly.')
+
+        if not controller.enter(admission_class):
+            return refuse(admission_class, 503, SHED_RETRY_AFTER,
+                          'We are very busy right now. Please try again in a moment.')
+        g._admission_class = admission_class
+
+    @app.teardown_request
+    def release_admission(exc=None):
+        # Only requests that were counted in are counted out; unclassified ones hold None
+        if '_admission_class' in g:
+            controller.leave(g.pop('_admission_class'))
+
+    @app.cli.command('clear-rate-limits')
+    def clear_rate_limits_command():
+        """Refill every token bucket"""
+        controller.backend.clear()
+        print('Rate limits cleared')
@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from flask import current_app, request, send_file, url_for, abort
+
+# Logical name (as referenced by templates) -> source file in the package
+ASSET_SOURCES = {
+    'css/spiritual.css': 'spiritual.css',
+    'js/divine.js': 'main.js',
+}
+
+DIST_DIR = os.path.join('static', 'dist')
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+# Precompressed variants, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# Minification: conservative, whitespace and comments only, so no parser is needed
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_STRING = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+
+
+def minify_css(source):
+    parts = _CSS_STRING.split(_CSS_COMMENT.sub('', source))
+    for i in range(0, len(parts), 2):  # even indexes are outside strings
+        text = re.sub(r'\s+', ' ', parts[i])
+        text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+        # Only the space after ':' is safe to drop ('a :hover' differs from 'a:hover')
+        text = re.sub(r':\s+', ':', text)
+        parts[i] = text.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+# Characters after which '/' starts a regular expression literal rather than a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^\n')
+
+
+def minify_js(source):
+    """Drop comments, indentation and blank lines; line breaks are kept so ASI is untouched"""
+    out = []
+    i, n = 0, len(source)
+    last = '\n'  # last significant character written
+    while i < n:
+        c = source[i]
+        nxt = source[i + 1] if i + 1 < n else ''
+        if c in '\'"`':
+            j = i + 1
+            while j < n and source[j] != c:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            i, last = j + 1, c
+        elif c == '/' and nxt == '/':
+            while i < n and source[i] != '\n':
+                i += 1
+        elif c == '/' and nxt == '*':
+            end = source.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+        elif c == '/' and last in _REGEX_PRECEDERS:
+            j, in_class = i + 1, False
+            while j < n and (in_class or source[j] != '/'):
+                if source[j] == '\\':
+                    j += 1
+                elif source[j] == '[':
+                    in_class = True
+                elif source[j] == ']':
+                    in_class = False
+                j += 1
+            out.append(source[i:j + 1])
+            i, last = j + 1, '/'
+        elif c in ' \t\r':
+            while i < n and source[i] in ' \t\r':
+                i += 1
+            if last != '\n' and i < n and source[i] != '\n':
+                out.append(' ')
+        elif c == '\n':
+            while out and out[-1] == ' ':
+                out.pop()
+            if last != '\n':
+                out.append('\n')
+                last = '\n'
+            i += 1
+        else:
+            out.append(c)
+            i, last = i + 1, c
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build(root, dist=None):
+    """Minify, fingerprint and precompress every asset; returns the manifest"""
+    dist = dist or os.path.join(root, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    brotli = _brotli()
+
+    manifest = {}
+    for logical, source in ASSET_SOURCES.items():
+        with open(os.path.join(root, source), encoding='utf-8') as f:
+            text = f.read()
+        stem, ext = os.path.splitext(os.path.basename(logical))
+        body = MINIFIERS[ext](text).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        filename = f'{stem}.{digest}{ext}'
+
+        variants = {'': body, '.gz': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(body, quality=11)
+        for suffix, data in variants.items():
+            with open(os.path.join(dist, filename + suffix), 'wb') as f:
+                f.write(data)
+        manifest[logical] = filename
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(dist):
+    try:
+        with open(os.path.join(dist, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(name):
+    """Fingerprinted URL of an asset, or the plain static URL when assets haven't been built"""
+    filename = current_app.extensions['assets']['manifest'].get(name)
+    if filename is None:
+        return url_for('static', filename=name)
+    return url_for('main.asset', filename=filename)
+
+
+def send_asset(filename):
+    """Serve a built asset forever-cacheable, preferring a precompressed variant"""
+    state = current_app.extensions['assets']
+    if filename not in state['files']:
+        abort(404)
+
+    path = os.path.join(state['dist'], filename)
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if name in request.accept_encodings and os.path.exists(path + suffix):
+            path, encoding = path + suffix, name
+            break
+
+    response = send_file(path, mimetype=MIMETYPES[os.path.splitext(filename)[1]],
+                         conditional=True, etag=True, max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    dist = os.path.join(app.root_path, DIST_DIR)
+    manifest = load_manifest(dist)
+    app.extensions['assets'] = {'dist': dist, 'manifest': manifest, 'files': set(manifest.values())}
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Minify, fingerprint and precompress static assets into static/dist"""
+        manifest = build(app.root_path, dist)
+        app.extensions['assets'].update(manifest=manifest, files=set(manifest.values()))
+        for logical, filename in sorted(manifest.items()):
+            print(f'{logical} -> {filename}')
+        if _brotli() is None:
+            print('brotli is not installed; only .gz variants were written')
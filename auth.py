@@ -0,0 +1,125 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from app import metrics
+from app.models import db, User
+
+DEFAULT_HASH_METHOD = 'pbkdf2:sha256:600000'  # Werkzeug's default; scrypt:N:r:p also works
+DEFAULT_HASH_WORKERS = 2
+DEFAULT_HASH_QUEUE = 16
+HASH_TIMEOUT = 10  # seconds
+
+
+class AuthBusy(Exception):
+    """Raised when too many password hashes are already queued, or one takes too long"""
+
+
+def normalize_identifier(identifier):
+    """Trim a username/email; emails compare case-insensitively"""
+    identifier = (identifier or '').strip()
+    return identifier.lower() if '@' in identifier else identifier
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def find_user(identifier):
+    """Look a user up by username or email with one indexed query"""
+    raw = (identifier or '').strip()
+    normalized = normalize_identifier(raw)
+    # Older accounts may have mixed-case emails; IN keeps the lookup on the unique index
+    users = User.query.filter(db.or_(
+        User.username == raw,
+        User.email.in_({raw, normalized})
+    )).limit(2).all()
+    for user in users:
+        if user.username == raw:
+            return user
+    return users[0] if users else None
+
+
+# Hash parameters
+
+def hash_method():
+    return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+
+
+_method_prefixes = {}
+
+
+def _method_prefix(method):
+    """Canonical 'method:params' prefix Werkzeug writes for a configured method"""
+    prefix = _method_prefixes.get(method)
+    if prefix is None:
+        prefix = generate_password_hash('', method=method).split('$', 1)[0]
+        _method_prefixes[method] = prefix
+    return prefix
+
+
+def hash_password(password):
+    with metrics.timed(metrics.PASSWORD_HASH_TIME, 'generate_password_hash'):
+        return generate_password_hash(password, method=hash_method())
+
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with different parameters than configured"""
+    return password_hash.split('$', 1)[0] != _method_prefix(hash_method())
+
+
+# Bounded hashing pool: caps CPU spent on hashing per worker and sheds excess load
+
+class HashPool:
+    def __init__(self, workers=DEFAULT_HASH_WORKERS, queue=DEFAULT_HASH_QUEUE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise AuthBusy()
+        # Timed from submission, so waiting behind other hashes counts too
+        with metrics.timed(metrics.PASSWORD_HASH_TIME, func.__name__):
+            try:
+                future = self._executor.submit(func, *args)
+            except BaseException:
+                self._slots.release()
+                raise
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                return future.result(timeout=HASH_TIMEOUT)
+            except FutureTimeoutError:
+                # The hash still finishes in the pool and frees its slot then
+                raise AuthBusy()
+
+
+def get_hash_pool():
+    pool = current_app.extensions.get('hash_pool')
+    if pool is None:
+        pool = current_app.extensions.setdefault('hash_pool', HashPool(
+            workers=current_app.config.get('PASSWORD_HASH_WORKERS', DEFAULT_HASH_WORKERS),
+            queue=current_app.config.get('PASSWORD_HASH_QUEUE', DEFAULT_HASH_QUEUE)
+        ))
+    return pool
+
+
+def verify_password(user, password):
+    return get_hash_pool().run(check_password_hash, user.password_hash, password)
+
+
+def authenticate(identifier, password):
+    """Return the user for valid credentials, or None
+
+    Hashes made with outdated parameters are transparently upgraded on success.
+    Raises AuthBusy when the hashing pool is saturated.
+    """
+    user = find_user(identifier)
+    if user is None or not verify_password(user, password):
+        return None
+
+    if needs_rehash(user.password_hash):
+        user.password_hash = get_hash_pool().run(generate_password_hash, password, hash_method())
+        db.session.commit()
+    return user
@@ -0,0 +1,298 @@
+import threading
+import time as _time
+from bisect import bisect_right
+from datetime import datetime, date, time, timedelta
+
+from flask import current_app
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+
+from app import database
+from app.models import db, Booking, AvailableSlot
+
+SLOT_STEP_MINUTES = 30  # Slots are offered every 30 minutes from the start of each window
+DEFAULT_CACHE_TTL = 15  # seconds; bounds staleness across worker processes
+MINUTES_PER_DAY = 24 * 60
+MAX_CACHED_DAYS = 400
+
+
+def to_minutes(value):
+    """Convert a time to minutes after midnight"""
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes):
+    """Convert minutes after midnight back to a time"""
+    return time(minutes // 60, minutes % 60)
+
+
+def merge_intervals(intervals):
+    """Sort and merge overlapping (start, end) minute intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(windows, busy):
+    """Remove merged busy intervals from merged windows"""
+    free = []
+    i = 0
+    for start, end in windows:
+        cursor = start
+        # Skip busy intervals that finish before this window
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > cursor:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if cursor < end:
+            free.append((cursor, end))
+    return free
+
+
+class DayAvailability:
+    """Compiled free intervals for a single calendar date"""
+    __slots__ = ('day', 'windows', 'free_starts', 'free_ends', 'computed_at', '_open')
+
+    def __init__(self, day, windows, free, computed_at):
+        self.day = day
+        self.windows = windows
+        self.free_starts = [start for start, _ in free]
+        self.free_ends = [end for _, end in free]
+        self.computed_at = computed_at
+        self._open = {}
+
+    def is_free(self, start, duration):
+        """Check whether [start, start + duration) lies in one free interval"""
+        idx = bisect_right(self.free_starts, start) - 1
+        return idx >= 0 and self.free_ends[idx] >= start + duration
+
+    def open_starts(self, duration=SLOT_STEP_MINUTES):
+        """Start minutes of every slot that can hold a session of this length"""
+        starts = self._open.get(duration)
+        if starts is None:
+            starts = []
+            for window_start, window_end in self.windows:
+                slot = window_start
+                while slot + duration <= window_end:
+                    if self.is_free(slot, duration):
+                        starts.append(slot)
+                    slot += SLOT_STEP_MINUTES
+            self._open[duration] = starts
+        return starts
+
+
+class AvailabilityEngine:
+    """Per-day interval index of open slots built from AvailableSlot rules and bookings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {}
+        self._rules = None
+        self._rules_computed_at = 0.0
+        self._changed_at = {}
+        self._forgotten_at = datetime.min  # newest change pruned from _changed_at
+        self._rules_changed_at = datetime.utcnow()
+
+    # Cache plumbing
+
+    def _ttl(self):
+        try:
+            return current_app.config.get('AVAILABILITY_CACHE_TTL', DEFAULT_CACHE_TTL)
+        except RuntimeError:
+            return DEFAULT_CACHE_TTL
+
+    def invalidate(self, days=None):
+        """Drop cached results for the given dates, or everything when days is None"""
+        now = datetime.utcnow()
+        with self._lock:
+            if days is None:
+                self._days.clear()
+                self._rules = None
+                self._rules_changed_at = now
+                self._changed_at.clear()
+                self._forgotten_at = datetime.min
+            else:
+                for day in days:
+                    self._days.pop(day, None)
+                    self._changed_at[day] = now
+                if len(self._changed_at) > MAX_CACHED_DAYS:
+                    # Forget the oldest changes; dates without an entry report the newest
+                    # forgotten one, so Last-Modified may move forward but never back
+                    by_age = sorted(self._changed_at.items(), key=lambda item: item[1])
+                    forgotten = by_age[:len(by_age) - MAX_CACHED_DAYS]
+                    self._forgotten_at = max(self._forgotten_at, forgotten[-1][1])
+                    for day, _ in forgotten:
+                        del self._changed_at[day]
+
+    def last_modified(self, day):
+        """Time of the last known change affecting a date"""
+        return max(self._changed_at.get(day, self._forgotten_at), self._rules_changed_at)
+
+    # Compilation
+
+    def _weekly_rules(self):
+        """Compile AvailableSlot rows into merged windows per weekday"""
+        now = _time.monotonic()
+        rules = self._rules
+        if rules is not None and now - self._rules_computed_at < self._ttl():
+            return rules
+
+        slots = [
+            {'day_of_week': slot.day_of_week, 'start_time': slot.start_time, 'end_time': slot.end_time}
+            for slot in AvailableSlot.query.filter_by(is_active=True).all()
+        ]
+        if not slots:
+            slots = AvailableSlot.get_tina_schedule()
+
+        by_day = {day: [] for day in range(7)}
+        for slot in slots:
+            start, end = to_minutes(slot['start_time']), to_minutes(slot['end_time'])
+            if end > start:
+                by_day[slot['day_of_week']].append((start, end))
+        rules = {day: merge_intervals(windows) for day, windows in by_day.items()}
+
+        with self._lock:
+            self._rules = rules
+            self._rules_computed_at = now
+        return rules
+
+    def _busy_by_day(self, start_day, end_day):
+        """Fetch booked intervals for a date range with a single query"""
+        now = datetime.utcnow()
+        rows = db.session.query(
+            Booking.booking_date, Booking.booking_time, Booking.duration
+        ).filter(
+            Booking.booking_date >= start_day,
+            Booking.booking_date <= end_day,
+            Booking.status.notin_(('cancelled', 'conflict')),
+            # Lapsed holds free their slot even before the sweeper cancels them
+            or_(Booking.hold_expires_at == None, Booking.hold_expires_at > now,  # noqa: E711
+                Booking.payment_status == 'succeeded')
+        ).all()
+
+        busy = {}
+        for booking_date, booking_time, duration in rows:
+            start = to_minutes(booking_time)
+            end = min(start + (duration or 0), MINUTES_PER_DAY)
+            busy.setdefault(booking_date, []).append((start, end))
+        return busy
+
+    def days(self, start_day, end_day):
+        """Return DayAvailability for every date in [start_day, end_day]"""
+        now = _time.monotonic()
+        ttl = self._ttl()
+        result = {}
+        missing = []
+
+        day = start_day
+        while day <= end_day:
+            cached = self._days.get(day)
+            if cached is not None and now - cached.computed_at < ttl:
+                result[day] = cached
+            else:
+                missing.append(day)
+            day += timedelta(days=1)
+
+        if missing:
+            # Every client shares this cache, and no worker knows what the others just
+            # wrote, so it always fills from the primary; the TTL bounds how often
+            with database.primary_reads():
+                rules = self._weekly_rules()
+                busy = self._busy_by_day(missing[0], missing[-1])
+            compiled = {}
+            for day in missing:
+                windows = rules.get(day.weekday(), [])
+                free = subtract_intervals(windows, merge_intervals(busy.get(day, [])))
+                compiled[day] = DayAvailability(day, windows, free, now)
+            with self._lock:
+                if len(self._days) > MAX_CACHED_DAYS:
+                    # Drop expired entries rather than growing without bound
+                    self._days = {
+                        d: cached for d, cached in self._days.items()
+                        if now - cached.computed_at < ttl
+                    }
+                self._days.update(compiled)
+            result.update(compiled)
+
+        return result
+
+    def day(self, selected_date):
+        return self.days(selected_date, selected_date)[selected_date]
+
+    # Queries
+
+    def open_times(self, selected_date, duration=SLOT_STEP_MINUTES):
+        """Open slot start times for a date"""
+        return [from_minutes(start) for start in self.day(selected_date).open_starts(duration)]
+
+    def open_times_range(self, start_day, end_day, duration=SLOT_STEP_MINUTES):
+        """Open slot start times for every date in a range"""
+        return {
+            day: [from_minutes(start) for start in availability.open_starts(duration)]
+            for day, availability in self.days(start_day, end_day).items()
+        }
+
+    def is_available(self, selected_date, start_time, duration):
+        """Check whether a session of this length can start at start_time"""
+        start = to_minutes(start_time)
+        return start in self.day(selected_date).open_starts(duration)
+
+
+availability = AvailabilityEngine()
+
+
+# Invalidation: collect touched dates during flush, drop them once the transaction commits
+
+def _pending(session):
+    return session.info.setdefault('availability_dirty', set())
+
+
+def _booking_dates(target):
+    dates = {target.booking_date}
+    history = inspect(target).attrs.booking_date.history
+    dates.update(d for d in history.deleted or () if d is not None)
+    return {d for d in dates if isinstance(d, date)}
+
+
+@event.listens_for(Booking, 'after_insert')
+@event.listens_for(Booking, 'after_update')
+@event.listens_for(Booking, 'after_delete')
+def _booking_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        _pending(session).update(_booking_dates(target))
+
+
+@event.listens_for(AvailableSlot, 'after_insert')
+@event.listens_for(AvailableSlot, 'after_update')
+@event.listens_for(AvailableSlot, 'after_delete')
+def _slot_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['availability_rules_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidation(session):
+    if session.info.pop('availability_rules_dirty', False):
+        session.info.pop('availability_dirty', None)
+        availability.invalidate()
+        return
+    dirty = session.info.pop('availability_dirty', None)
+    if dirty:
+        availability.invalidate(dirty)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidation(session):
+    session.info.pop('availability_dirty', None)
+    session.info.pop('availability_rules_dirty', None)
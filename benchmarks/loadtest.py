@@ -0,0 +1,332 @@
+"""Offline end-to-end load test: virtual clients going from the home page to a paid booking.
+
+    python -m app.benchmarks.loadtest --concurrency 10 --concurrency 50 --concurrency 100 --duration 30
+    python -m app.benchmarks.loadtest --database-url sqlite:////tmp/load.db --stripe-latency 0.4
+    python -m app.benchmarks.loadtest --url http://127.0.0.1:5000 --webhook-secret whsec_load
+
+Each virtual client opens a keep-alive session and loops through:
+home -> register -> login -> /get_available_times -> book -> payment
+-> payment_success or a signed stripe_webhook.
+
+Without --url, the app is served in a child process. That process has a fake
+Stripe client with the given latency, a local Hedra stub, a local SMTP sink
+and its background workers, and runs against a temporary SQLite file or --database-url (see
+`benchmarks.seed`). With --url, point it at a server such as gunicorn that has
+STRIPE_CLIENT=fake, and pass its webhook secret. Each flow sends its own
+X-Forwarded-For address; requests refused by admission control (429/503)
+count as errors.
+
+Every concurrency step reports throughput, p50/p95/p99 latency, SQL statements
+(from X-Query-Count) and error rate per endpoint. The ramp stops at the first
+step over --max-error-rate or --p95-slo-ms, and that step is reported as the
+breaking point.
+"""
+import argparse
+import json
+import random
+import re
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from app import SESSION_TYPES
+
+WEBHOOK_SECRET = 'whsec_loadtest'
+PASSWORD = 'loadtest-password'
+BOOKING_WINDOW_DAYS = 60
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+INTENT_PATTERN = re.compile(r'(pi_[A-Za-z0-9_]+?)_secret_')
+PAYMENT_PATH = re.compile(r'/payment/(\d+)$')
+
+
+class FlowAborted(Exception):
+    """The step failed; the virtual client starts its next flow"""
+
+
+class Results:
+    """Latencies, statuses and query counts per endpoint, shared by all clients"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+        self.outcomes = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status, queries=None, error=False):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if queries is not None:
+                self.queries[endpoint].append(queries)
+            if error:
+                self.errors[endpoint] += 1
+
+    def outcome(self, name):
+        with self._lock:
+            self.outcomes[name] += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class VirtualClient:
+    """One visitor: a keep-alive session walking the booking funnel"""
+
+    def __init__(self, base_url, results, rng, webhook_secret, webhook_ratio):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.rng = rng
+        self.webhook_secret = webhook_secret
+        self.webhook_ratio = webhook_ratio
+        self.http = requests.Session()
+
+    def call(self, method, path, endpoint, expect, **kwargs):
+        """Send a request, record it under `endpoint` and abort the flow on an unexpected status"""
+        import requests
+
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, allow_redirects=False, timeout=30, **kwargs)
+        except requests.RequestException as e:
+            self.results.record(endpoint, time.perf_counter() - started, type(e).__name__, error=True)
+            raise FlowAborted(endpoint)
+
+        queries = response.headers.get('X-Query-Count')
+        ok = response.status_code in expect
+        self.results.record(endpoint, time.perf_counter() - started, response.status_code,
+                            int(queries) if queries else None, error=not ok)
+        if not ok:
+            raise FlowAborted(endpoint)
+        return response
+
+    def form(self, path, endpoint, data):
+        """GET a form page, then POST it back with its CSRF token"""
+        page = self.call('GET', path, f'GET {endpoint}', (200,))
+        token = CSRF_PATTERN.search(page.text)
+        if token:
+            data = dict(data, csrf_token=token.group(1))
+        return self.call('POST', path, f'POST {endpoint}', (200, 302), data=data)
+
+    def run_flow(self):
+        self.http.cookies.clear()
+        # Each flow is a new visitor, from its own address as far as per-IP rate limits go
+        self.http.headers['X-Forwarded-For'] = '.'.join(['10'] + [str(self.rng.randrange(1, 255)) for _ in range(3)])
+        name = f'lt{secrets.token_hex(8)}'  # unique across runs against the same database; max 20 chars
+        self.call('GET', '/', 'GET /', (200,))
+
+        registered = self.form('/register', '/register', {
+            'first_name': 'Load', 'last_name': 'Test', 'username': name,
+            'email': f'{name}@example.com', 'password': PASSWORD, 'confirm_password': PASSWORD,
+        })
+        if registered.status_code != 302:
+            return 'registration rejected'
+        self.call('GET', '/logout', 'GET /logout', (302,))
+        if self.form('/login', '/login', {'username': name, 'password': PASSWORD}).status_code != 302:
+            return 'login rejected'
+
+        session_type = self.rng.choice(list(SESSION_TYPES))
+        booking_date = date.today() + timedelta(days=self.rng.randint(1, BOOKING_WINDOW_DAYS))
+        times = self.call('GET', f'/get_available_times?date={booking_date}&session_type={session_type}',
+                          'GET /get_available_times', (200,)).json().get('times') or []
+        if not times:
+            return 'no availability'
+
+        booked = self.form('/book', '/book', {
+            'session_type': session_type,
+            'booking_date': booking_date.isoformat(),
+            'booking_time': self.rng.choice(times)[0],
+        })
+        match = PAYMENT_PATH.search(booked.headers.get('Location', ''))
+        if booked.status_code != 302 or not match:
+            return 'slot taken'
+        booking_id = match.group(1)
+
+        payment_page = self.call('GET', f'/payment/{booking_id}', 'GET /payment/<id>', (200,))
+        intent = INTENT_PATTERN.search(payment_page.text)
+        if self.rng.random() < self.webhook_ratio and intent:
+            self.send_webhook(booking_id, intent.group(1))
+        else:
+            self.call('GET', f'/payment_success/{booking_id}', 'GET /payment_success/<id>', (200,))
+        return 'paid'
+
+    def send_webhook(self, booking_id, intent_id):
+        from app.webhooks import sign_payload
+
+        event_id = f'evt_load_{booking_id}_{self.rng.getrandbits(32):x}'
+        payload = json.dumps({
+            'id': event_id, 'object': 'event', 'type': 'payment_intent.succeeded',
+            'data': {'object': {'id': intent_id, 'metadata': {'booking_id': booking_id}}},
+        })
+        self.call('POST', '/stripe_webhook', 'POST /stripe_webhook', (200,), data=payload, headers={
+            'Content-Type': 'application/json',
+            'Stripe-Signature': sign_payload(payload, self.webhook_secret),
+        })
+
+    def run(self, deadline):
+        while time.monotonic() < deadline:
+            try:
+                self.results.outcome(self.run_flow())
+            except FlowAborted as e:
+                self.results.outcome(f'failed at {e}')
+
+
+def run_step(base_url, concurrency, duration, webhook_secret, webhook_ratio, seed):
+    results = Results()
+    deadline = time.monotonic() + duration
+    clients = [VirtualClient(base_url, results, random.Random(f'{seed}-{concurrency}-{index}'),
+                             webhook_secret, webhook_ratio)
+               for index in range(concurrency)]
+    threads = [threading.Thread(target=client.run, args=(deadline,), daemon=True) for client in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def report(concurrency, results, elapsed):
+    """Print one step's table; returns (error rate, worst p95 in ms)"""
+    total = sum(len(values) for values in results.latencies.values())
+    errors = sum(results.errors.values())
+    print(f'\n{concurrency} concurrent clients: {total} requests in {elapsed:.1f} s '
+          f'({total / elapsed:.1f} req/s), {results.outcomes["paid"] / elapsed:.2f} paid bookings/s')
+    print(f'{"endpoint":<28}{"requests":>9}{"req/s":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+          f'{"queries":>9}{"errors":>8}')
+    worst_p95 = 0.0
+    for endpoint in sorted(results.latencies):
+        latencies = results.latencies[endpoint]
+        queries = results.queries[endpoint]
+        p95 = percentile(latencies, 0.95) * 1000
+        worst_p95 = max(worst_p95, p95)
+        print(f'{endpoint:<28}{len(latencies):>9}{len(latencies) / elapsed:>8.1f}'
+              f'{percentile(latencies, 0.5) * 1000:>9.1f}{p95:>9.1f}{percentile(latencies, 0.99) * 1000:>9.1f}'
+              f'{sum(queries) / len(queries) if queries else float("nan"):>9.1f}'
+              f'{results.errors[endpoint] / len(latencies):>8.1%}')
+        unexpected = {status: count for status, count in results.statuses[endpoint].items()
+                      if status not in (200, 302)}
+        if unexpected:
+            print(f'{"":<28}statuses: {unexpected}')
+    print('flows: ' + ', '.join(f'{count} {name}' for name, count in results.outcomes.most_common()))
+    return errors / total if total else 1.0, worst_p95
+
+
+# Child-process server
+
+def serve(port, database_url, stripe_latency, hedra_latency, hash_method, admission_capacity):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    from app import hedra_stub, smtp_sink
+    from app.benchmarks.common import use_page_templates
+
+    _, hedra_url = hedra_stub.start_in_background(latency=hedra_latency)
+    _, smtp_port = smtp_sink.start_in_background()
+    config = {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'STRIPE_CLIENT': 'fake',
+        'FAKE_STRIPE_LATENCY': stripe_latency,
+        'STRIPE_WEBHOOK_SECRET': WEBHOOK_SECRET,
+        'HEDRA_API_KEY': 'stub',
+        'HEDRA_API_URL': hedra_url,
+        'SMTP_HOST': '127.0.0.1',
+        'SMTP_PORT': smtp_port,
+        'SMTP_STARTTLS': False,
+        'QUERY_COUNT_HEADER': True,
+        'ADMISSION_ENABLED': admission_capacity > 0,
+        'ADMISSION_CAPACITY': admission_capacity,
+    }
+    if hash_method:
+        config['PASSWORD_HASH_METHOD'] = hash_method
+
+    from app import create_app, db
+    app = create_app(config)
+    use_page_templates(app)
+    with app.app_context():
+        db.create_all()
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', port, app, threaded=True, request_handler=QuietHandler)
+    print(f'serving on http://127.0.0.1:{server.server_port}', flush=True)
+    server.serve_forever()
+
+
+def start_server(args):
+    """Run `serve` in a child process; returns (process, base URL)"""
+    database_url = args.database_url or f'sqlite:///{tempfile.mkdtemp(prefix="loadtest-")}/load.db'
+    command = [sys.executable, '-m', 'app.benchmarks.loadtest', '--serve',
+               '--database-url', database_url,
+               '--stripe-latency', str(args.stripe_latency),
+               '--hedra-latency', str(args.hedra_latency),
+               '--admission-capacity', str(args.admission_capacity)]
+    if args.hash_method:
+        command += ['--hash-method', args.hash_method]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('serving on '):
+        process.kill()
+        sys.exit(f'Load test server failed to start: {line.strip() or "no output"}')
+    return process, line.split()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, action='append', help='virtual clients per step (repeatable)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds per step')
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--webhook-secret', default=WEBHOOK_SECRET)
+    parser.add_argument('--webhook-ratio', type=float, default=0.5,
+                        help='share of payments confirmed by webhook rather than payment_success')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--p95-slo-ms', type=float, default=2000)
+    parser.add_argument('--seed', type=int, default=1, help='random seed, for repeatable runs')
+    parser.add_argument('--database-url', help='database for the started server (default: fresh SQLite file)')
+    parser.add_argument('--stripe-latency', type=float, default=0.3, help='fake Stripe round trip, seconds')
+    parser.add_argument('--hedra-latency', type=float, default=0.3, help='Hedra stub round trip, seconds')
+    parser.add_argument('--hash-method', help='PASSWORD_HASH_METHOD for the started server')
+    parser.add_argument('--admission-capacity', type=int, default=32,
+                        help='ADMISSION_CAPACITY for the started server; 0 turns admission control off')
+    parser.add_argument('--port', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.port, args.database_url, args.stripe_latency, args.hedra_latency, args.hash_method,
+                     args.admission_capacity)
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url = start_server(args)
+    try:
+        for concurrency in sorted(args.concurrency or (10, 25, 50, 100)):
+            results, elapsed = run_step(base_url, concurrency, args.duration,
+                                        args.webhook_secret, args.webhook_ratio, args.seed)
+            error_rate, worst_p95 = report(concurrency, results, elapsed)
+            if error_rate > args.max_error_rate or worst_p95 > args.p95_slo_ms:
+                print(f'\nBreaking point: {concurrency} concurrent clients '
+                      f'(error rate {error_rate:.1%}, worst p95 {worst_p95:.0f} ms)')
+                break
+        else:
+            print('\nNo breaking point within the tested concurrency')
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Login cost per password hash setting: one lookup query plus verification.
+
+    python -m app.benchmarks.login --iterations 20
+    python -m app.benchmarks.login --method scrypt:32768:8:1 --method pbkdf2:sha256:260000
+"""
+import argparse
+import statistics
+
+from app.benchmarks.common import make_app, timed, summarize
+
+DEFAULT_METHODS = (
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--method', action='append', help='hash method to measure (repeatable)')
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app()
+
+    from app.models import db, User
+    from app import auth
+
+    with app.test_request_context():
+        for index, method in enumerate(args.method or DEFAULT_METHODS):
+            app.config['PASSWORD_HASH_METHOD'] = method
+            user = User(username=f'bench{index}', email=f'bench{index}@example.com', first_name='Bench')
+            user.set_password('correct horse battery staple')
+            db.session.add(user)
+            db.session.commit()
+
+            def login():
+                assert auth.authenticate(user.email, 'correct horse battery staple') is not None
+
+            durations = timed(login, args.iterations)
+            summarize(method, durations)
+            # Hashing is CPU-bound and holds the GIL, so each core sustains about 1/mean logins
+            print(f'{"":<32} {1000 / statistics.mean(durations):8.1f} logins/sec per core')
+
+
+if __name__ == '__main__':
+    main()
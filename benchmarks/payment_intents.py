@@ -0,0 +1,54 @@
+"""Payment page setup cost with and without PaymentIntent reuse, fully offline.
+
+    python -m app.benchmarks.payment_intents --latency 0.25 --iterations 20
+"""
+import argparse
+from datetime import date, time
+
+from app.benchmarks.common import make_app, timed, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.25, help='simulated Stripe round trip (seconds)')
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app(FAKE_STRIPE_LATENCY=args.latency)
+
+    from app.models import db, User, Booking
+    from app.payments import ensure_payment_intent
+    from app.stripe_client import get_stripe_client
+
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', first_name='Bench', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        booking = Booking(user_id=user.id, session_type='deep_dive', booking_date=date(2030, 1, 5),
+                          booking_time=time(9, 0), duration=30, price=9700)
+        db.session.add(booking)
+        db.session.commit()
+
+        client = get_stripe_client()
+
+        def create_every_load():
+            # Previous behaviour: a fresh intent on every payment page render
+            intent = client.create_payment_intent(booking.price, 'usd', {'booking_id': booking.id})
+            booking.stripe_payment_intent_id = intent.id
+            db.session.commit()
+
+        def reuse_local_state():
+            ensure_payment_intent(booking)
+
+        ensure_payment_intent(booking)
+        db.session.commit()
+
+        calls_before = client.calls
+        summarize('create intent per page load', timed(create_every_load, args.iterations))
+        summarize('reuse stored intent', timed(reuse_local_state, args.iterations))
+        print(f'Stripe calls: {client.calls - calls_before} '
+              f'({args.iterations} from the old path, {client.calls - calls_before - args.iterations} from reuse)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""SQL statements per page as the number of bookings grows, with lazy loads forbidden.
+
+    python -m app.benchmarks.query_budget --scale 10 --scale 100 --scale 1000
+
+Runs with QUERY_RAISELOAD, so a template or view touching a relationship its
+query didn't load fails outright instead of quietly running a query per row.
+Exits 1 if a page goes over its budget or its query count grows with the rows.
+"""
+import argparse
+import json
+import sys
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import event, insert
+
+from app.benchmarks.common import make_app, use_page_templates
+
+# Statements per page, whatever the number of rows (the login lookup included).
+# Draining webhooks writes per booking, so only its reads are held to a budget.
+BUDGETS = {
+    'dashboard': 4,
+    'admin dashboard': 4,
+    'admin bookings': 3,
+    'payment': 3,
+    'session room': 3,
+    'webhook drain reads': 5,
+}
+
+PASSWORD = 'correct horse battery staple'
+
+
+@contextmanager
+def counting_selects(engine):
+    """Count SELECTs run on `engine` inside the block, outside any request"""
+    counter = {'count': 0}
+
+    def count(conn, cursor, statement, *args):
+        counter['count'] += statement.lstrip().upper().startswith('SELECT')
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+def seed(rows):
+    """`rows` bookings spread over 20 clients, plus one client with a session running now"""
+    from app import SESSION_TYPES, TIMEZONE
+    from app.models import db, Booking, User
+
+    users = []
+    for index in range(20):
+        user = User(username=f'client{index}', email=f'client{index}@example.com',
+                    first_name='Client', last_name=str(index))
+        user.set_password(PASSWORD)
+        users.append(user)
+    admin = User(username='admin', email='admin@example.com', first_name='Admin', is_admin=True)
+    admin.set_password(PASSWORD)
+    db.session.add_all(users + [admin])
+    db.session.flush()
+
+    today = date.today()
+    session_types = list(SESSION_TYPES)
+    created = datetime.utcnow() - timedelta(days=rows)
+    db.session.execute(insert(Booking), [
+        {
+            'user_id': users[index % len(users)].id,
+            'session_type': session_types[index % len(session_types)],
+            'booking_date': today + timedelta(days=index % 60 - 30),
+            'booking_time': time(17 + index % 5, 0),
+            'duration': 30,
+            'price': 9700,
+            'status': 'paid' if index % 2 else 'pending',
+            'payment_status': 'succeeded' if index % 2 else 'pending',
+            'stripe_payment_intent_id': f'pi_seed_{index}',
+            'created_at': created + timedelta(days=index),
+        }
+        for index in range(rows)
+    ])
+
+    now = datetime.now(TIMEZONE)
+    live = Booking(user_id=users[0].id, session_type='deep_dive', booking_date=now.date(),
+                   booking_time=now.time().replace(second=0, microsecond=0), duration=30, price=9700,
+                   status='paid', payment_status='succeeded')
+    pending = Booking(user_id=users[0].id, session_type='deep_dive', booking_date=today + timedelta(days=3),
+                      booking_time=time(20, 0), duration=30, price=9700,
+                      stripe_payment_intent_id='pi_pending', stripe_client_secret='pi_pending_secret',
+                      hold_expires_at=datetime.utcnow() + timedelta(hours=1))
+    db.session.add_all([live, pending])
+    db.session.commit()
+    return live.id, pending.id
+
+
+def queue_webhooks(count):
+    """`count` payment_intent.succeeded events for unpaid seeded bookings"""
+    from app.models import db, StripeEvent
+
+    db.session.add_all([
+        StripeEvent(event_id=f'evt_{index}', event_type='payment_intent.succeeded', payload=json.dumps({
+            'id': f'evt_{index}', 'type': 'payment_intent.succeeded',
+            'data': {'object': {'id': f'pi_seed_{index}', 'metadata': {}}}
+        }))
+        for index in range(0, count * 2, 2)
+    ])
+    db.session.commit()
+
+
+def measure(rows):
+    """Statements per page for one data size"""
+    app = make_app(QUERY_RAISELOAD=True, QUERY_COUNT_HEADER=True, PAGE_CACHE_ENABLED=False,
+                   PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    use_page_templates(app)
+
+    from app.models import db
+    from app.webhooks import drain
+
+    with app.app_context():
+        live_id, pending_id = seed(rows)
+
+    def page_queries(client, path):
+        response = client.get(path)
+        assert response.status_code == 200, f'{path} answered {response.status_code}'
+        return int(response.headers['X-Query-Count'])
+
+    counts = {}
+    client = app.test_client()
+    client.post('/login', data={'username': 'client0', 'password': PASSWORD})
+    counts['dashboard'] = page_queries(client, '/dashboard')
+    counts['payment'] = page_queries(client, f'/payment/{pending_id}')
+    counts['session room'] = page_queries(client, f'/session_room/{live_id}')
+
+    admin = app.test_client()
+    admin.post('/login', data={'username': 'admin', 'password': PASSWORD})
+    counts['admin dashboard'] = page_queries(admin, '/admin')
+    counts['admin bookings'] = page_queries(admin, '/admin/bookings')
+
+    with app.app_context():
+        queue_webhooks(min(rows // 2, 50))
+        with counting_selects(db.engine) as counter:
+            drain()
+        counts['webhook drain reads'] = counter['count']
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, action='append', help='bookings to seed (repeatable)')
+    args = parser.parse_args()
+    scales = sorted(args.scale or (10, 100, 1000))
+
+    results = {rows: measure(rows) for rows in scales}
+
+    print(f'{"page":<20}' + ''.join(f'{rows:>10}' for rows in scales) + f'{"budget":>10}')
+    failures = 0
+    for page, budget in BUDGETS.items():
+        counts = [results[rows][page] for rows in scales]
+        over = max(counts) > budget or counts[-1] > counts[0]
+        failures += over
+        print(f'{page:<20}' + ''.join(f'{count:>10}' for count in counts)
+              + f'{budget:>10}' + ('   FAIL' if over else ''))
+    if failures:
+        print(f'{failures} pages over budget or growing with the number of rows')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Fill a database with synthetic clients, bookings and payments for load tests.
+
+    python -m app.benchmarks.seed --scale 100k --database-url sqlite:////tmp/load.db
+    python -m app.benchmarks.seed --scale 1M --database-url postgresql://localhost/divine_load
+
+`--scale` is the number of bookings (10k, 100k, 1M or a plain number), with
+one client per five bookings. Every client's password is `loadtest-password`.
+Most bookings lie in the past two years. Each day of the coming weeks gets a
+few paid sessions that hold their slots, as real bookings do. Rollups are
+rebuilt at the end, so the admin dashboard matches the data.
+"""
+import argparse
+import random
+import time as clock
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import insert, select
+
+from app import SESSION_TYPES
+
+PASSWORD = 'loadtest-password'
+CHUNK_ROWS = 10000
+BOOKINGS_PER_CLIENT = 5
+HISTORY_DAYS = 730
+FUTURE_DAYS = 60
+FUTURE_START_TIMES = (time(18, 0), time(19, 30), time(21, 0))  # open every day of the week
+SCALES = {'k': 1000, 'm': 1000000}
+
+
+def parse_scale(value):
+    value = value.strip().lower()
+    if value[-1:] in SCALES:
+        return int(float(value[:-1]) * SCALES[value[-1]])
+    return int(value)
+
+
+def insert_chunks(table, rows):
+    """Insert an iterable of row dicts in executemany batches of CHUNK_ROWS"""
+    from app.models import db
+
+    inserted = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_ROWS:
+            db.session.execute(insert(table), chunk)
+            db.session.commit()
+            inserted += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(table), chunk)
+        db.session.commit()
+        inserted += len(chunk)
+    return inserted
+
+
+def seed(bookings, rng, prefix='seed'):
+    """Insert the synthetic data; returns row counts per table"""
+    from app import auth, rollups
+    from app.models import db, Booking, Payment, SlotClaim, User
+    from app.availability import to_minutes
+    from app.reservations import claim_cells
+
+    clients = max(1, bookings // BOOKINGS_PER_CLIENT)
+    password_hash = auth.hash_password(PASSWORD)  # one hash for all; hashing a million would take hours
+    now = datetime.utcnow()
+    counts = {'users': insert_chunks(User, (
+        {
+            'username': f'{prefix}_{index}',
+            'email': f'{prefix}_{index}@example.com',
+            'first_name': 'Load',
+            'last_name': f'Client {index}',
+            'password_hash': password_hash,
+            'created_at': now - timedelta(days=rng.randrange(HISTORY_DAYS)),
+        }
+        for index in range(clients)
+    ))}
+    user_ids = db.session.execute(
+        select(User.id).where(User.username.like(f'{prefix}\\_%', escape='\\'))).scalars().all()
+
+    today = date.today()
+    session_types = list(SESSION_TYPES)
+    # Upcoming sessions skip cells already held, e.g. by an earlier seeding
+    held = set(db.session.execute(select(SlotClaim.slot_date, SlotClaim.slot_minute).where(
+        SlotClaim.slot_date > today)).all())
+    longest = max(details['duration'] for details in SESSION_TYPES.values())
+    future = [(day, start)
+              for day in (today + timedelta(days=offset) for offset in range(1, FUTURE_DAYS + 1))
+              for start in FUTURE_START_TIMES
+              if not any((day, minute) in held
+                         for minute in range(to_minutes(start), to_minutes(start) + longest, 10))]
+    future = future[:bookings // 10]  # leave most of the calendar open for the load test
+    past_count = bookings - len(future)
+
+    def booking_rows():
+        for index in range(bookings):
+            session_type = session_types[index % len(session_types)]
+            details = SESSION_TYPES[session_type]
+            if index < past_count:
+                booking_date = today - timedelta(days=rng.randrange(1, HISTORY_DAYS))
+                booking_time = time(rng.choice((8, 10, 12, 14, 17, 18, 19, 20)), rng.choice((0, 30)))
+                paid = rng.random() < 0.8
+                status = 'completed' if paid else rng.choice(('pending', 'cancelled'))
+            else:
+                booking_date, booking_time = future[index - past_count]
+                paid = True
+                status = 'paid'
+            created_at = datetime.combine(booking_date, time(12)) - timedelta(days=rng.randrange(1, 30))
+            yield {
+                'user_id': user_ids[index % len(user_ids)],
+                'session_type': session_type,
+                'booking_date': booking_date,
+                'booking_time': booking_time,
+                'duration': details['duration'],
+                'price': details['price'],
+                'status': status,
+                'payment_status': 'succeeded' if paid else 'pending',
+                'stripe_payment_intent_id': f'pi_{prefix}_{index}',
+                'paid_at': created_at + timedelta(minutes=5) if paid else None,
+                'created_at': created_at,
+            }
+
+    first_booking_id = (db.session.scalar(select(db.func.max(Booking.id))) or 0) + 1
+    counts['bookings'] = insert_chunks(Booking, booking_rows())
+
+    # Payments are copied from the new paid bookings inside the database
+    paid = select(Booking.id, Booking.stripe_payment_intent_id, Booking.price, db.literal('usd'),
+                  db.literal('succeeded'), Booking.paid_at, Booking.paid_at).where(
+        Booking.id >= first_booking_id, Booking.payment_status == 'succeeded')
+    counts['payments'] = db.session.execute(insert(Payment).from_select(
+        ['booking_id', 'stripe_payment_intent_id', 'amount', 'currency', 'status', 'created_at', 'updated_at'],
+        paid)).rowcount
+    db.session.commit()
+    counts['slot claims'] = insert_chunks(SlotClaim, (
+        {'booking_id': booking.id, 'slot_date': booking.booking_date, 'slot_minute': cell}
+        for booking in db.session.execute(
+            select(Booking.id, Booking.booking_date, Booking.booking_time, Booking.duration).where(
+                Booking.id >= first_booking_id, Booking.booking_date > today)
+        ).all()
+        for cell in claim_cells(booking)
+    ))
+    counts['rollups'] = rollups.rebuild()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='10k', help='bookings to create: 10k, 100k, 1M, ...')
+    parser.add_argument('--database-url', required=True, help='database to fill; tables are created if missing')
+    parser.add_argument('--prefix', default='seed', help='username prefix, to seed the same database twice')
+    parser.add_argument('--random-seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app import create_app, db
+
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': args.database_url,
+        'BACKGROUND_WORKERS_ENABLED': False,
+    })
+    started = clock.perf_counter()
+    with app.app_context():
+        db.create_all()
+        counts = seed(parse_scale(args.scale), random.Random(args.random_seed), args.prefix)
+    print(', '.join(f'{count} {name}' for name, count in counts.items())
+          + f' in {clock.perf_counter() - started:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Cold-start cost of `create_app()` measured with `python -X importtime`.
+
+    python -m app.benchmarks.startup --budget-ms 1500
+
+Exits non-zero if start-up exceeds the budget or if a module that should be
+imported lazily (stripe, requests) is pulled in while building the app.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+LAZY_MODULES = ('stripe', 'requests')
+
+STARTUP_SCRIPT = "from app import create_app; create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})"
+
+
+def measure():
+    """Run create_app() in a fresh interpreter; returns (wall ms, {module: cumulative us})"""
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(package_dir))
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+        env=env, capture_output=True, text=True, check=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        # "import time:       self [us] |  cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nesting is shown by indentation; keep it to tell top-level imports apart
+        modules[name.rstrip()[1:]] = int(cumulative)
+    return wall_ms, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget-ms', type=float, default=None, help='fail if start-up takes longer')
+    parser.add_argument('--top', type=int, default=15, help='slowest top-level imports to list')
+    args = parser.parse_args()
+
+    wall_ms, modules = measure()
+    top_level = {name: us for name, us in modules.items() if not name.startswith(' ')}
+
+    print(f'create_app() cold start: {wall_ms:.0f} ms wall, '
+          f'{sum(top_level.values()) / 1000:.0f} ms importing')
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f'  {us / 1000:8.1f} ms  {name}')
+
+    failures = []
+    imported = {name.strip() for name in modules}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    if eager:
+        failures.append(f"imported at start-up but should be lazy: {', '.join(eager)}")
+    if args.budget_ms is not None and wall_ms > args.budget_ms:
+        failures.append(f'start-up took {wall_ms:.0f} ms, budget is {args.budget_ms:.0f} ms')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
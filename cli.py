@@ -0,0 +1,44 @@
+import os
+
+from app import db, ADMIN_EMAIL
+
+
+def seed_admin():
+    """Create the admin user if it doesn't exist; returns True when created"""
+    from app.models import User
+
+    admin = User.query.filter_by(username='tina_admin').first()
+    if admin:
+        return False
+
+    admin = User(
+        username='tina_admin',
+        email=ADMIN_EMAIL,
+        first_name='Tina',
+        last_name='',
+        is_admin=True
+    )
+    admin.set_password(os.environ.get('ADMIN_PASSWORD', 'DivineTalks2024!'))
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+
+def init_app(app):
+    # Run from the release step, never from web workers, so parallel worker
+    # start-up doesn't race on DDL
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create any missing tables and the admin user."""
+        db.create_all()
+        if seed_admin():
+            print('✅ Admin user created: tina_admin')
+
+    @app.cli.command('seed-admin')
+    def seed_admin_command():
+        """Create the admin user if it doesn't exist."""
+        if seed_admin():
+            print('✅ Admin user created: tina_admin')
+        else:
+            print('Admin user already exists')
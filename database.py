@@ -0,0 +1,150 @@
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+DEFAULT_THREADS = 4  # gunicorn.conf.py's gthread default
+DEFAULT_GEVENT_POOL_SIZE = 10  # green threads queue for these rather than opening hundreds
+DEFAULT_MAX_OVERFLOW = 5  # background workers and long requests beyond the request threads
+DEFAULT_POOL_TIMEOUT = 10  # seconds; fail well inside gunicorn's 30 s timeout
+DEFAULT_POOL_RECYCLE = 1800  # seconds; below typical server and proxy idle limits
+DEFAULT_READ_YOUR_WRITES = 10  # seconds a client's reads stay on the primary after it writes
+
+# Session.info keys
+ROUTE_READS = 'route_reads_to_replica'
+WROTE = 'wrote'
+LAST_WRITE = '_db_write_at'  # in the Flask session, so it follows the client across workers
+
+
+def default_pool_size():
+    """Connections per process for the gunicorn worker model in use"""
+    worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+    if worker_class == 'sync':
+        return 1
+    if worker_class == 'gevent':
+        return DEFAULT_GEVENT_POOL_SIZE
+    return int(os.environ.get('GUNICORN_THREADS', DEFAULT_THREADS))
+
+
+def pool_options(url, config):
+    """Engine options for a database URL from the DB_POOL_* settings"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return {}  # one shared in-memory connection; there is no pool to size
+    return {
+        'pool_size': config.get('DB_POOL_SIZE', DEFAULT_THREADS),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', DEFAULT_MAX_OVERFLOW),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', DEFAULT_POOL_RECYCLE),
+        'pool_pre_ping': True,
+    }
+
+
+def configure(app):
+    """Set engine options for the primary and the replica bind; call before db.init_app"""
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', pool_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config))
+    replica_url = app.config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(REPLICA_BIND, {'url': replica_url, **pool_options(replica_url, app.config)})
+
+
+class RoutingSession(Session):
+    """Sends SELECTs to the replica while a view has opted in and nothing was written
+
+    Flushes, DML and every query outside such views use the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get(ROUTE_READS) and not self.info.get(WROTE)
+                and not self._flushing and getattr(clause, 'is_select', False)):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info[WROTE] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info[WROTE] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(db_session):
+    if db_session.info.get(WROTE) and has_request_context() and has_replica():
+        session[LAST_WRITE] = time.time()
+
+
+def has_replica():
+    return bool(current_app.config.get('DATABASE_REPLICA_URL'))
+
+
+def read_your_writes_window():
+    """Seconds a write may take to reach the replica"""
+    return current_app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', DEFAULT_READ_YOUR_WRITES)
+
+
+def wrote_recently():
+    """True when this client committed a write within the replica's expected lag"""
+    return session.get(LAST_WRITE, 0) > time.time() - read_your_writes_window()
+
+
+def replica_reads(view):
+    """Serve a read-only view's queries from the replica, unless its client just wrote"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        from app import db
+
+        if not has_replica() or wrote_recently():
+            return view(*args, **kwargs)
+        db.session.info[ROUTE_READS] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            db.session.info.pop(ROUTE_READS, None)
+    return wrapped
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, e.g. to fill a cache every client shares"""
+    from app import db
+
+    routed = db.session.info.pop(ROUTE_READS, None)
+    try:
+        yield
+    finally:
+        if routed:
+            db.session.info[ROUTE_READS] = routed
+
+
+def init_app(app):
+    @app.cli.command('snapshot-replica')
+    def snapshot_replica_command():
+        """Copy a SQLite primary onto the SQLite replica, for trying replica routing locally"""
+        from app import db
+
+        if not has_replica():
+            raise SystemExit('DATABASE_REPLICA_URL is not set')
+        primary, replica = db.engines[None], db.engines[REPLICA_BIND]
+        if primary.url.get_backend_name() != 'sqlite' or replica.url.get_backend_name() != 'sqlite':
+            raise SystemExit('Only SQLite files can be copied; replicate Postgres with streaming replication')
+        source, target = primary.raw_connection(), replica.raw_connection()
+        try:
+            source.driver_connection.backup(target.driver_connection)
+        finally:
+            source.close()
+            target.close()
+        print(f'Copied {primary.url.database} to {replica.url.database}')
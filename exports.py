@@ -0,0 +1,166 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time
+
+import click
+from sqlalchemy import select
+
+from app.models import db, Booking, Payment, SessionLog, User
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+YIELD_PER = 1000  # rows fetched per round trip from the server-side cursor
+CHUNK_ROWS = 500  # rows encoded per chunk handed to the WSGI server
+
+
+class ExportSpec:
+    """What one export streams: its columns, how it joins to bookings and what it filters on"""
+
+    def __init__(self, table, columns, date_column, status_column, joins=()):
+        self.table = table
+        self.columns = columns
+        self.date_column = date_column
+        self.status_column = status_column
+        self.joins = joins
+
+    @property
+    def fieldnames(self):
+        return [column.key for column in self.columns]
+
+
+EXPORTS = {
+    'bookings': ExportSpec(
+        Booking,
+        [Booking.id, Booking.user_id, User.username, User.email, Booking.session_type,
+         Booking.booking_date, Booking.booking_time, Booking.duration, Booking.price,
+         Booking.status, Booking.payment_status, Booking.stripe_payment_intent_id,
+         Booking.paid_at, Booking.created_at],
+        date_column=Booking.booking_date,
+        status_column=Booking.status,
+        joins=[(User, User.id == Booking.user_id)]
+    ),
+    'payments': ExportSpec(
+        Payment,
+        [Payment.id, Payment.booking_id, Booking.session_type, Booking.booking_date,
+         Payment.stripe_payment_intent_id, Payment.amount, Payment.currency, Payment.status,
+         Payment.created_at, Payment.updated_at],
+        date_column=Payment.created_at,
+        status_column=Payment.status,
+        joins=[(Booking, Booking.id == Payment.booking_id)]
+    ),
+    'session_logs': ExportSpec(
+        SessionLog,
+        [SessionLog.id, SessionLog.booking_id, Booking.session_type, Booking.booking_date,
+         SessionLog.session_started_at, SessionLog.session_ended_at, SessionLog.actual_duration,
+         SessionLog.user_rating, SessionLog.user_feedback, SessionLog.session_notes,
+         SessionLog.created_at],
+        date_column=SessionLog.created_at,
+        status_column=Booking.status,
+        joins=[(Booking, Booking.id == SessionLog.booking_id)]
+    ),
+}
+
+
+def build_query(kind, start=None, end=None, status=None, session_type=None):
+    """Core SELECT for an export; `start`/`end` are inclusive dates"""
+    spec = EXPORTS[kind]
+    stmt = select(*spec.columns).select_from(spec.table)
+    for target, onclause in spec.joins:
+        stmt = stmt.join(target, onclause)
+
+    # DateTime columns need the whole of the end day
+    is_datetime = spec.date_column.type.python_type is datetime
+    if start:
+        stmt = stmt.where(spec.date_column >= (datetime.combine(start, time.min) if is_datetime else start))
+    if end:
+        stmt = stmt.where(spec.date_column <= (datetime.combine(end, time.max) if is_datetime else end))
+    if status:
+        stmt = stmt.where(spec.status_column == status)
+    if session_type:
+        stmt = stmt.where(Booking.session_type == session_type)
+    return stmt.order_by(spec.table.id)
+
+
+def _value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(fieldnames):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode(rows):
+        for row in rows:
+            writer.writerow([_value(value) for value in row])
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(fieldnames)
+    header = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return header, encode
+
+
+def _encode_jsonl(fieldnames):
+    def encode(rows):
+        return ''.join(json.dumps(dict(zip(fieldnames, map(_value, row)))) + '\n' for row in rows)
+    return '', encode
+
+
+def stream(engine, kind, fmt, **filters):
+    """Yield an export as text chunks, reading rows through a server-side cursor
+
+    Uses its own connection and Core rows, so memory stays flat and no ORM
+    objects pile up in a session, however many rows match.
+    """
+    spec = EXPORTS[kind]
+    stmt = build_query(kind, **filters)
+    header, encode = (_encode_csv if fmt == 'csv' else _encode_jsonl)(spec.fieldnames)
+    if header:
+        yield header
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=YIELD_PER).execute(stmt)
+        for rows in result.partitions(CHUNK_ROWS):
+            yield encode(rows)
+
+
+def filename(kind, fmt, start=None, end=None, **filters):
+    span = '-'.join(value.isoformat() for value in (start, end) if value) or date.today().isoformat()
+    return f'{kind}-{span}.{fmt}'
+
+
+def parse_filters(values):
+    """Export filters from request args or CLI options; raises ValueError on bad dates"""
+    filters = {}
+    for key in ('start', 'end'):
+        if values.get(key):
+            filters[key] = datetime.strptime(values[key], '%Y-%m-%d').date()
+    for key in ('status', 'session_type'):
+        if values.get(key):
+            filters[key] = values[key]
+    return filters
+
+
+def init_app(app):
+    @app.cli.command('export')
+    @click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+    @click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='csv')
+    @click.option('--start', help='first date, YYYY-MM-DD')
+    @click.option('--end', help='last date, YYYY-MM-DD')
+    @click.option('--status')
+    @click.option('--session-type')
+    @click.option('--output', type=click.File('w'), default='-', help='file to write (default: stdout)')
+    def export_command(kind, fmt, output, **options):
+        """Stream bookings, payments or session logs as CSV or JSONL."""
+        try:
+            filters = parse_filters(options)
+        except ValueError:
+            raise click.BadParameter('dates must be YYYY-MM-DD')
+        for chunk in stream(db.engine, kind, fmt, **filters):
+            output.write(chunk)
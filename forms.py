@@ -3,7 +3,8 @@ from wtforms import StringField, TextAreaField, SelectField, DateField, TimeFiel
 from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError, Optional
 from datetime import datetime, date, time
 import pytz
-from app.models import User
+from app.models import db, User
+from app.auth import normalize_email
 
 class RegistrationForm(FlaskForm):
     """User registration form"""
@@ -18,15 +19,21 @@ class RegistrationForm(FlaskForm):
     ])
     submit = SubmitField('Create My Account')
 
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Username already exists. Please choose a different one.')
-
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Email already registered. Please use a different email or login.')
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+
+        # One query covers both uniqueness checks
+        email = normalize_email(self.email.data)
+        taken = User.query.filter(db.or_(
+            User.username == self.username.data,
+            User.email.in_({self.email.data, email})
+        )).all()
+        if any(user.username == self.username.data for user in taken):
+            self.username.errors.append('Username already exists. Please choose a different one.')
+        if any(user.email in (self.email.data, email) for user in taken):
+            self.email.errors.append('Email already registered. Please use a different email or login.')
+        return not taken
 
 class LoginForm(FlaskForm):
     """User login form"""
@@ -46,7 +53,7 @@ class BookingForm(FlaskForm):
         validators=[DataRequired()]
     )
     booking_date = DateField('Preferred Date', validators=[DataRequired()])
-    booking_time = SelectField('Preferred Time (CST)', validators=[DataRequired()])
+    booking_time = SelectField('Preferred Time (CST)', validators=[DataRequired()], validate_choice=False)
     special_requests = TextAreaField('Special Focus Areas or Questions', 
         validators=[Optional(), Length(max=500)],
         render_kw={"placeholder": "Share what you'd like Zahrah to focus on during your session..."}
@@ -59,47 +66,43 @@ class BookingForm(FlaskForm):
 
     def populate_time_slots(self):
         """Generate available time slots based on Tina's CST schedule"""
-        # This will be populated dynamically based on selected date
+        # Populated dynamically on the client; on submit, offer the open slots for the posted date
         self.booking_time.choices = [('', 'Select a time...')]
+        if self.booking_date.data:
+            self.booking_time.choices += self.get_available_times_for_date(
+                self.booking_date.data, self._selected_duration())
+
+    def _selected_duration(self):
+        from app import SESSION_TYPES
+        session_details = SESSION_TYPES.get(self.session_type.data)
+        return session_details['duration'] if session_details else None
 
     def validate_booking_date(self, booking_date):
         if booking_date.data < date.today():
             raise ValidationError('Please select a future date.')
 
+    def validate_booking_time(self, booking_time):
+        if not self.booking_date.data:
+            return
+        try:
+            selected_time = datetime.strptime(booking_time.data, '%H:%M').time()
+        except (TypeError, ValueError):
+            raise ValidationError('Please select a valid time.')
+
+        from app.availability import availability, SLOT_STEP_MINUTES
+        duration = self._selected_duration() or SLOT_STEP_MINUTES
+        if not availability.is_available(self.booking_date.data, selected_time, duration):
+            raise ValidationError('That time is no longer available. Please choose another slot.')
+
     @staticmethod
-    def get_available_times_for_date(selected_date):
-        """Get available time slots for a specific date in CST"""
-        from datetime import time, timedelta
-
-        day_of_week = selected_date.weekday()  # 0=Monday, 6=Sunday
-        available_times = []
-
-        if day_of_week < 5:  # Monday to Friday
-            # 5:30 PM to 10:00 PM CST
-            start_hour, start_min = 17, 30
-            end_hour = 22
-        else:  # Saturday and Sunday
-            # 8:00 AM to 10:00 PM CST  
-            start_hour, start_min = 8, 0
-            end_hour = 22
-
-        # Generate 30-minute slots
-        current_time = time(start_hour, start_min)
-        end_time = time(end_hour, 0)
-
-        while current_time < end_time:
-            time_str = current_time.strftime("%I:%M %p")
-            available_times.append((current_time.strftime("%H:%M"), f"{time_str} CST"))
-
-            # Add 30 minutes
-            minutes = current_time.minute + 30
-            hours = current_time.hour
-            if minutes >= 60:
-                minutes -= 60
-                hours += 1
-            current_time = time(hours, minutes)
-
-        return available_times
+    def get_available_times_for_date(selected_date, duration=None, zone=None):
+        """Open slots for a date as (CST 'HH:MM', label) pairs, labelled in `zone` (default CST)"""
+        from app import timezones
+        from app.availability import availability, SLOT_STEP_MINUTES
+
+        starts = availability.day(selected_date).open_starts(duration or SLOT_STEP_MINUTES)
+        labels = timezones.slot_labels(selected_date, starts, zone or timezones.BUSINESS_ZONE)
+        return [(f'{start // 60:02d}:{start % 60:02d}', label) for start, label in zip(starts, labels)]
 
 class PaymentForm(FlaskForm):
     """Payment processing form for Stripe integration"""
@@ -0,0 +1,64 @@
+# Gunicorn configuration: `gunicorn -c gunicorn.conf.py`
+#
+# Worker model is chosen with GUNICORN_WORKER_CLASS:
+#   sync    - one request per process; simplest, but a slow Stripe call blocks the worker
+#   gthread - (default) a thread pool per process; slow I/O only ties up one thread
+#   gevent  - cooperative green threads for many concurrent slow or long-lived requests;
+#             requires `pip install gevent`
+import multiprocessing
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # Patch before the app is preloaded so sockets and locks in the master are cooperative too
+    from gevent import monkey
+    monkey.patch_all()
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+wsgi_app = 'app:create_app()'
+
+# Processes scale with cores; threads (gthread) or connections (gevent) cover I/O waits
+workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+# Recycle workers gradually to contain leaks, without restarting them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Keep connections from the platform's load balancer open between requests
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Never share database connections opened in the master with forked workers
+    from app.models import db
+
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in db.engines.values():  # the primary and the read replica, if configured
+            engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    # Write session-room messages and notes still buffered in this worker
+    from app import session_log
+
+    app = server.app.wsgi()
+    with app.app_context():
+        try:
+            session_log.flush()
+        except Exception:
+            server.log.exception('Could not flush buffered session logs')
@@ -0,0 +1,184 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from app import TIMEZONE
+from app.models import db, Booking, HedraSession
+from app.http_client import HTTPClient, CircuitBreaker, ExternalServiceError, ServiceUnavailable
+from app.workers import PeriodicWorker, register_worker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api.hedra.com'
+SESSIONS_PATH = '/v1/realtime/sessions'
+DEFAULT_LEAD_MINUTES = 5
+DEFAULT_PROVISION_INTERVAL = 60  # seconds
+MAX_ATTEMPTS = 5
+
+
+class HedraClient:
+    """Server-side Hedra API access; the API key never reaches the browser"""
+
+    def __init__(self, api_key, base_url=DEFAULT_API_URL, avatar_id=None, **http_options):
+        self.avatar_id = avatar_id
+        self.http = HTTPClient(base_url, headers={'Authorization': f'Bearer {api_key}'},
+                               breaker=CircuitBreaker(), name='Hedra', **http_options)
+
+    def create_session(self, booking, replaces=None):
+        """Provision a realtime avatar session; safe to retry for the same booking
+
+        Pass the expired session's id as `replaces` to get a new session
+        rather than the stored response for the old one.
+        """
+        idempotency_key = f'booking-{booking.id}-session'
+        if replaces:
+            idempotency_key += f'-{replaces}'
+        created = self.http.post(SESSIONS_PATH, idempotency_key=idempotency_key, json={
+            'external_id': f'booking-{booking.id}',
+            'avatar_id': self.avatar_id,
+            'starts_at': booking.booking_datetime_cst.isoformat(),
+            'duration_minutes': booking.duration,
+        })
+        if not isinstance(created, dict) or not created.get('id') or not created.get('join_url'):
+            raise ExternalServiceError('Hedra: session response is missing id or join_url')
+        return created
+
+
+def get_hedra_client():
+    """Client for the current app, or None when HEDRA_API_KEY isn't configured"""
+    client = current_app.extensions.get('hedra_client')
+    if client is None and current_app.config.get('HEDRA_API_KEY'):
+        client = current_app.extensions.setdefault('hedra_client', HedraClient(
+            current_app.config['HEDRA_API_KEY'],
+            base_url=current_app.config.get('HEDRA_API_URL') or DEFAULT_API_URL,
+            avatar_id=current_app.config.get('HEDRA_AVATAR_ID')
+        ))
+    return client
+
+
+def _parse_expiry(value):
+    if not value:
+        return None
+    try:
+        expires_at = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ExternalServiceError(f'Hedra: unreadable expires_at {value!r}')
+    if expires_at.tzinfo is not None:
+        expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return expires_at
+
+
+def provision(booking, client):
+    """Create or refresh the booking's HedraSession; the caller commits
+
+    Failures are recorded on the row and re-raised. `attempts` counts
+    failures since the last session was stored.
+    """
+    record = booking.hedra_session
+    if record is None:
+        record = HedraSession(booking_id=booking.id, status='pending', attempts=0)
+        db.session.add(record)
+
+    record.attempts = (record.attempts or 0) + 1
+    try:
+        # The stored id only changes on success, so retries of one refresh share a key
+        created = client.create_session(booking, replaces=record.external_id)
+        expires_at = _parse_expiry(created.get('expires_at'))
+        if expires_at is not None and expires_at <= datetime.utcnow():
+            raise ExternalServiceError(f'Hedra: session {created["id"]} is already expired')
+    except ExternalServiceError as e:
+        record.status = 'failed'
+        record.last_error = str(e)
+        raise
+
+    record.external_id = created['id']
+    record.join_url = created['join_url']
+    record.expires_at = expires_at
+    record.status = 'ready'
+    record.attempts = 0
+    record.last_error = None
+    return record
+
+
+def session_for(booking):
+    """A usable HedraSession for the session room, provisioning on the spot if the worker hasn't"""
+    record = booking.hedra_session
+    if record is not None and record.usable():
+        return record
+    if record is not None and record.attempts >= MAX_ATTEMPTS:
+        return None  # given up on; don't make every page load wait on Hedra
+
+    client = get_hedra_client()
+    if client is None:
+        return None
+    try:
+        record = provision(booking, client)
+    except ServiceUnavailable:
+        db.session.rollback()
+        return None
+    except ExternalServiceError as e:
+        logger.warning('Could not provision Hedra session for booking %s: %s', booking.id, e)
+        db.session.commit()
+        return None
+    db.session.commit()
+    return record
+
+
+def due_bookings(now=None, lead_minutes=DEFAULT_LEAD_MINUTES):
+    """Paid bookings starting within `lead_minutes` (or already running) without a usable session"""
+    now = now or datetime.now(TIMEZONE)
+    horizon = now + timedelta(minutes=lead_minutes)
+    utcnow = datetime.utcnow()
+
+    # The join also fills booking.hedra_session, which provision() reads for every candidate
+    candidates = Booking.query.outerjoin(HedraSession).filter(
+        Booking.booking_date.in_({now.date(), horizon.date()}),
+        Booking.payment_status == 'succeeded',
+        Booking.status.notin_(('cancelled', 'completed', 'conflict')),
+        db.or_(
+            HedraSession.id == None,  # noqa: E711
+            db.and_(db.or_(HedraSession.status != 'ready', HedraSession.expires_at < utcnow),
+                    HedraSession.attempts < MAX_ATTEMPTS)
+        )
+    ).options(db.contains_eager(Booking.hedra_session)).all()
+
+    return [booking for booking in candidates
+            if now - timedelta(minutes=booking.duration) <= booking.booking_datetime_cst <= horizon]
+
+
+def provision_due():
+    """Pre-provision avatar sessions for bookings about to start; returns how many succeeded"""
+    client = get_hedra_client()
+    if client is None:
+        return 0
+
+    lead = current_app.config.get('HEDRA_PROVISION_LEAD_MINUTES', DEFAULT_LEAD_MINUTES)
+    provisioned = 0
+    for booking in due_bookings(lead_minutes=lead):
+        try:
+            provision(booking, client)
+            provisioned += 1
+        except ServiceUnavailable:
+            db.session.rollback()
+            logger.warning('Hedra circuit open; deferring pre-provisioning')
+            break
+        except ExternalServiceError as e:
+            logger.warning('Pre-provisioning Hedra session for booking %s failed: %s', booking.id, e)
+        # One booking per transaction, so a failure never undoes another's session
+        db.session.commit()
+    return provisioned
+
+
+hedra_provisioner = PeriodicWorker('hedra-provisioner', DEFAULT_PROVISION_INTERVAL, provision_due)
+
+
+def init_app(app):
+    """Register the pre-provisioning worker and its CLI command"""
+    hedra_provisioner.interval = app.config.get('HEDRA_PROVISION_INTERVAL', DEFAULT_PROVISION_INTERVAL)
+    register_worker(app, hedra_provisioner)
+
+    @app.cli.command('provision-hedra-sessions')
+    def provision_hedra_sessions_command():
+        """Provision Hedra avatar sessions for bookings about to start."""
+        print(f'Provisioned {provision_due()} Hedra sessions')
@@ -0,0 +1,113 @@
+"""Local stand-in for the Hedra realtime API, for development and load tests.
+
+    python -m app.hedra_stub --port 8765 --latency 0.3 --fail-rate 0.1
+    HEDRA_API_URL=http://127.0.0.1:8765 HEDRA_API_KEY=stub flask run
+"""
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.hedra import SESSIONS_PATH
+
+SESSION_LIFETIME = timedelta(hours=2)
+
+
+class HedraStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def _send(self, status, body, content_type='application/json'):
+        data = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _simulate(self):
+        """Apply the configured latency and failures; True if the request should fail"""
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        return random.random() < server.fail_rate
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path != SESSIONS_PATH:
+            return self._send(404, {'error': 'not found'})
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._send(401, {'error': 'missing API key'})
+        if self._simulate():
+            return self._send(503, {'error': 'simulated outage'})
+
+        server = self.server
+        key = self.headers.get('Idempotency-Key')
+        with server.lock:
+            server.requests += 1
+            if key and key in server.idempotent:
+                return self._send(200, server.sessions[server.idempotent[key]])
+
+            session_id = f'hs_stub_{len(server.sessions) + 1}'
+            host = self.headers.get('Host', f'127.0.0.1:{server.server_port}')
+            session = {
+                'id': session_id,
+                'join_url': f'http://{host}/realtime/{session_id}?token={secrets.token_urlsafe(16)}',
+                'expires_at': (datetime.now(timezone.utc) + SESSION_LIFETIME).isoformat(),
+                'request': json.loads(body or b'{}'),
+            }
+            server.sessions[session_id] = session
+            if key:
+                server.idempotent[key] = session_id
+        self._send(201, session)
+
+    def do_GET(self):
+        if self.path.startswith('/realtime/'):
+            return self._send(200, '<html><body style="color:#fff">Hedra stub avatar</body></html>', 'text/html')
+        self._send(404, {'error': 'not found'})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(port=0, latency=0.0, fail_rate=0.0, verbose=False):
+    server = ThreadingHTTPServer(('127.0.0.1', port), HedraStubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.verbose = verbose
+    server.sessions = {}
+    server.idempotent = {}
+    server.requests = 0
+    server.lock = threading.Lock()
+    return server
+
+
+def start_in_background(**options):
+    """Start a stub on a free port; returns (server, base URL). Call server.shutdown() to stop."""
+    server = make_server(**options)
+    threading.Thread(target=server.serve_forever, name='hedra-stub', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every API call')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of calls answered with 503')
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency, args.fail_rate, verbose=True)
+    print(f'Hedra stub listening on http://127.0.0.1:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
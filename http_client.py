@@ -0,0 +1,173 @@
+import logging
+import random
+import threading
+import time
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.2  # seconds; doubled per attempt, with full jitter
+DEFAULT_POOL_SIZE = 10
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class ExternalServiceError(Exception):
+    """Raised when an external API fails or answers with an error"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceUnavailable(ExternalServiceError):
+    """Raised without calling out while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for `reset_timeout` seconds after repeated failures"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Closed breakers let every call through; a half-open one admits a single trial call
+        until it records success (closing the breaker) or failure (re-opening it)"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_timeout:
+                return False
+            # A trial that never reported back stops blocking the next one after reset_timeout
+            if self._trial_started_at is not None and now - self._trial_started_at < self.reset_timeout:
+                return False
+            self._trial_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._trial_started_at = None
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+class HTTPClient:
+    """Keep-alive JSON client for one external API: pooled connections, timeouts,
+    jittered retries and a circuit breaker
+
+    `requests` is imported on first use so it stays off the start-up path.
+    """
+
+    def __init__(self, base_url, headers=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE, breaker=None, name=None):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.name = name or self.base_url
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def request(self, method, path, idempotency_key=None, **kwargs):
+        """Send a request and return the decoded JSON body
+
+        POSTs are only retried when an `idempotency_key` makes that safe.
+        """
+        with metrics.external_call(self.name, method):
+            return self._request(method, path, idempotency_key, **kwargs)
+
+    def _request(self, method, path, idempotency_key, **kwargs):
+        import requests
+
+        if not self.breaker.allow():
+            raise ServiceUnavailable(f'{self.name} is unavailable (circuit open)')
+
+        headers = kwargs.pop('headers', {})
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        retries = self.retries if method in ('GET', 'PUT', 'DELETE') or idempotency_key else 0
+        url = f'{self.base_url}/{path.lstrip("/")}'
+
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                error = ExternalServiceError(f'{self.name}: {e}')
+            else:
+                if response.status_code < 400:
+                    try:
+                        body = response.json() if response.content else None
+                    except ValueError:
+                        # Retrying won't fix a malformed body; count it against the service
+                        self.breaker.record_failure()
+                        raise ExternalServiceError(f'{self.name}: invalid JSON in response', response.status_code)
+                    self.breaker.record_success()
+                    return body
+                error = ExternalServiceError(f'{self.name}: HTTP {response.status_code}', response.status_code)
+                if response.status_code < 500 and response.status_code not in RETRY_STATUSES:
+                    # The service is up; the request itself is wrong
+                    self.breaker.record_success()
+                    raise error
+
+            if attempt < retries:
+                logger.info('Retrying %s %s after: %s', method, url, error)
+                self._sleep_before_retry(attempt)
+
+        self.breaker.record_failure()
+        raise error
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
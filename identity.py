@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import db, User
+
+# Everything current_user is used for in views and templates
+IDENTITY_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'phone', 'is_admin', 'created_at')
+
+DEFAULT_LOCAL_TTL = 30  # seconds; only without a backend, where nothing else could tell other workers
+DEFAULT_SHARED_TTL = 300
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class UserIdentity(UserMixin):
+    """Read-only snapshot of a User, served to current_user from the identity cache"""
+
+    def __init__(self, data):
+        for field in IDENTITY_FIELDS:
+            setattr(self, field, data.get(field))
+        if isinstance(self.created_at, str):
+            self.created_at = datetime.fromisoformat(self.created_at)
+
+    def load(self):
+        """The full User row, for code that needs to modify it or follow relationships"""
+        return db.session.get(User, self.id)
+
+    def __repr__(self):
+        return f'<UserIdentity {self.id} {self.username}>'
+
+
+def snapshot(user):
+    """JSON-safe dict of the identity fields of a User"""
+    data = {field: getattr(user, field) for field in IDENTITY_FIELDS}
+    if data['created_at'] is not None:
+        data['created_at'] = data['created_at'].isoformat()
+    data['is_admin'] = bool(data['is_admin'])
+    return data
+
+
+class IdentityBackend:
+    """Shared store (e.g. Redis or Memcached) consulted when the local cache misses"""
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def set(self, user_id, data, ttl):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+
+class InMemoryIdentityBackend(IdentityBackend):
+    """Process-local stand-in for a shared backend, for development and tests"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, user_id, data, ttl):
+        with self._lock:
+            self._entries[user_id] = (dict(data), time.monotonic() + ttl)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class IdentityCache:
+    """LRU of user identities with a TTL, backed by an optional shared store
+
+    With a backend, `ttl` defaults to 0: every lookup goes to the shared store,
+    which invalidations reach at once, so no worker keeps serving a stale copy.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=None, backend=None, shared_ttl=DEFAULT_SHARED_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl if ttl is not None else (0 if backend is not None else DEFAULT_LOCAL_TTL)
+        self.backend = backend
+        self.shared_ttl = shared_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, user_id, identity):
+        with self._lock:
+            self._entries[user_id] = (identity, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, user_id):
+        """Identity for a user id, or None if the user doesn't exist"""
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            with self._lock:
+                if user_id in self._entries:
+                    self._entries.move_to_end(user_id)
+            return entry[0]
+
+        data = self.backend.get(user_id) if self.backend is not None else None
+        if data is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            data = snapshot(user)
+            if self.backend is not None:
+                self.backend.set(user_id, data, self.shared_ttl)
+
+        identity = UserIdentity(data)
+        if self.ttl > 0:
+            self._remember(user_id, identity)
+        return identity
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self.backend is not None:
+            self.backend.delete(user_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def get_identity_cache():
+    return current_app.extensions['identity_cache']
+
+
+def load_identity(user_id):
+    """Flask-Login user loader; Flask-Login memoizes the result for the rest of the request"""
+    return get_identity_cache().get(int(user_id))
+
+
+# Invalidation: any committed change to a User drops its cached identity
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('identity_dirty', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_invalidation(session):
+    dirty = session.info.pop('identity_dirty', None)
+    if not dirty:
+        return
+    try:
+        cache = get_identity_cache()
+    except (RuntimeError, KeyError):
+        return
+    for user_id in dirty:
+        cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_invalidation(session):
+    session.info.pop('identity_dirty', None)
+
+
+def init_app(app, backend=None):
+    """Install the identity cache; `backend` (or IDENTITY_BACKEND) shares it between workers"""
+    backend = backend or app.config.get('IDENTITY_BACKEND')
+    app.extensions['identity_cache'] = IdentityCache(
+        max_entries=app.config.get('IDENTITY_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+        ttl=app.config.get('IDENTITY_CACHE_TTL'),
+        backend=backend,
+        shared_ttl=app.config.get('IDENTITY_SHARED_TTL', DEFAULT_SHARED_TTL)
+    )
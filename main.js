@@ -216,6 +216,7 @@ function initializeBookingSystem() {
             const sessionSelect = document.getElementById('session_type');
             if (sessionSelect) {
                 sessionSelect.value = sessionType;
+                updateAvailableTimes();
             }
 
             // Update UI
@@ -231,50 +232,78 @@ function initializeBookingSystem() {
     });
 }
 
-function updateAvailableTimes() {
-    const dateInput = document.getElementById('booking_date');
-    const timeSelect = document.getElementById('booking_time');
+// Open slots per month, so browsing dates costs one request per month
+const availabilityCache = new Map();
+// Slot labels come back in the visitor's own zone; booking values stay CST
+const clientTimeZone = (window.Intl && Intl.DateTimeFormat().resolvedOptions().timeZone) || null;
+const AVAILABILITY_CACHE_MS = 60 * 1000;
 
-    if (!dateInput || !timeSelect) return;
+function fetchMonthAvailability(dateValue) {
+    const [year, month] = dateValue.split('-').map(Number);
+    const key = `${year}-${month}`;
+    const cached = availabilityCache.get(key);
 
-    const selectedDate = new Date(dateInput.value);
-    const dayOfWeek = selectedDate.getDay(); // 0 = Sunday, 6 = Saturday
-
-    // Clear existing options
-    timeSelect.innerHTML = '<option value="">Select a time...</option>';
+    if (cached && Date.now() - cached.fetchedAt < AVAILABILITY_CACHE_MS) {
+        return cached.request;
+    }
 
-    let startHour, endHour;
+    const lastDay = new Date(year, month, 0).getDate();
+    const pad = value => value.toString().padStart(2, '0');
+    const params = new URLSearchParams({
+        start: `${year}-${pad(month)}-01`,
+        end: `${year}-${pad(month)}-${pad(lastDay)}`
+    });
+    if (clientTimeZone) params.set('tz', clientTimeZone);
+
+    const request = fetch(`/get_available_times_range?${params.toString()}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .catch(error => {
+            availabilityCache.delete(key);
+            throw error;
+        });
 
-    // Tina's schedule: Weekdays 5:30-10pm, Weekends 8am-10pm CST
-    if (dayOfWeek === 0 || dayOfWeek === 6) { // Weekend
-        startHour = 8;
-        endHour = 22;
-    } else { // Weekday
-        startHour = 17.5; // 5:30 PM
-        endHour = 22;
-    }
+    availabilityCache.set(key, { request, fetchedAt: Date.now() });
+    return request;
+}
 
-    // Generate 30-minute time slots
-    for (let hour = startHour; hour < endHour; hour += 0.5) {
-        const wholeHour = Math.floor(hour);
-        const minutes = (hour % 1) === 0.5 ? 30 : 0;
+function formatSlotLabel(time24) {
+    const [hour, minutes] = time24.split(':').map(Number);
+    const period = hour >= 12 ? 'PM' : 'AM';
+    const displayHour = hour % 12 === 0 ? 12 : hour % 12;
+    return `${displayHour.toString().padStart(2, '0')}:${minutes.toString().padStart(2, '0')} ${period} CST`;
+}
 
-        const time24 = `${wholeHour.toString().padStart(2, '0')}:${minutes.toString().padStart(2, '0')}`;
+function updateAvailableTimes() {
+    const dateInput = document.getElementById('booking_date');
+    const timeSelect = document.getElementById('booking_time');
+    const sessionSelect = document.getElementById('session_type');
 
-        // Convert to 12-hour format for display
-        const displayTime = formatTime12Hour(wholeHour, minutes);
+    if (!dateInput || !timeSelect || !dateInput.value) return;
 
-        const option = document.createElement('option');
-        option.value = time24;
-        option.textContent = `${displayTime} CST`;
-        timeSelect.appendChild(option);
-    }
-}
+    // Clear existing options
+    timeSelect.innerHTML = '<option value="">Select a time...</option>';
 
-function formatTime12Hour(hour, minutes) {
-    const period = hour >= 12 ? 'PM' : 'AM';
-    const displayHour = hour > 12 ? hour - 12 : (hour === 0 ? 12 : hour);
-    return `${displayHour}:${minutes.toString().padStart(2, '0')} ${period}`;
+    // Open slots come from the server so booked times are never offered
+    const sessionType = (sessionSelect && sessionSelect.value) || 'deep_dive';
+
+    fetchMonthAvailability(dateInput.value)
+        .then(data => {
+            const day = data.days[dateInput.value] || {};
+            const labels = (data.labels && data.labels[dateInput.value]) || {};
+            (day[sessionType] || []).forEach(time24 => {
+                const option = document.createElement('option');
+                option.value = time24;
+                option.textContent = labels[time24] || formatSlotLabel(time24);
+                timeSelect.appendChild(option);
+            });
+        })
+        .catch(error => {
+            console.error('Error loading available times:', error);
+            showNotification('Unable to load available times. Please try again.', 'error');
+        });
 }
 
 // Payment Handling
@@ -0,0 +1,268 @@
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, request, before_render_template, template_rendered
+
+from app import query_counter
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+DEFAULT_PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_HISTORY = 20  # slow-request profiles kept for /admin/metrics/profiles
+MAX_STACK_DEPTH = 64
+
+
+class Histogram:
+    """Cumulative histogram per combination of label values
+
+    Kept per process: `/admin/metrics` reports the worker that serves it. An
+    observation is a bisect and two additions under a lock, cheap enough to
+    leave on in production.
+    """
+
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        """Prometheus text exposition lines"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                bucket = ','.join(pairs + [f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket}}} {cumulative}')
+            selector = '{' + ','.join(pairs) + '}' if pairs else ''
+            lines.append(f'{self.name}_sum{selector} {values[-1]:.6f}')
+            lines.append(f'{self.name}_count{selector} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time until the response is ready, per endpoint',
+    ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'http_request_sql_queries', 'SQL statements run per request',
+    ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_TIME = Histogram(
+    'http_request_sql_seconds', 'Time spent in SQL per request',
+    ('endpoint',))
+REQUEST_EXTERNAL_TIME = Histogram(
+    'http_request_external_seconds', 'Time spent calling external services per request',
+    ('endpoint',))
+TEMPLATE_RENDER_TIME = Histogram(
+    'template_render_seconds', 'Jinja render time per template',
+    ('template',))
+EXTERNAL_CALL_TIME = Histogram(
+    'external_call_seconds', 'Calls to Stripe, Hedra and other services, retries included',
+    ('service', 'operation', 'outcome'))
+PASSWORD_HASH_TIME = Histogram(
+    'password_hash_seconds', 'Password hashing and verification, queueing included',
+    ('operation',))
+
+HISTOGRAMS = (REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_SQL_TIME, REQUEST_EXTERNAL_TIME,
+              TEMPLATE_RENDER_TIME, EXTERNAL_CALL_TIME, PASSWORD_HASH_TIME)
+
+
+@contextmanager
+def timed(histogram, *labels):
+    """Observe how long the block takes; usable as a decorator too"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, *labels)
+
+
+@contextmanager
+def external_call(service, operation):
+    """Time a call to an external service, also counting it against the current request"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = time.perf_counter() - started
+        EXTERNAL_CALL_TIME.observe(elapsed, service, operation, outcome)
+        if has_request_context():
+            g._external_seconds = g.get('_external_seconds', 0.0) + elapsed
+
+
+def expose():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.expose())
+    return '\n'.join(lines) + '\n'
+
+
+# Opt-in sampling profiler for slow requests
+
+class SlowRequestProfile:
+    def __init__(self, method, path, duration, samples):
+        self.method = method
+        self.path = path
+        self.duration = duration
+        self.samples = samples  # Counter of collapsed stacks
+        self.recorded_at = datetime.utcnow()
+
+    def collapsed(self):
+        """Stacks in the collapsed format flame graph tools read"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common())
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving requests every `interval` seconds
+
+    Costs nothing per request beyond registering the thread; the sampling
+    thread only runs while requests are in flight.
+    """
+
+    def __init__(self, interval=DEFAULT_PROFILE_INTERVAL, history=PROFILE_HISTORY):
+        self.interval = interval
+        self.profiles = deque(maxlen=history)
+        self._active = {}  # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def record(self, method, path, duration, samples):
+        profile = SlowRequestProfile(method, path, duration, samples)
+        self.profiles.append(profile)
+        top = samples.most_common(1)
+        logger.warning('Slow request %s %s took %.0f ms; hottest stack ends in %s', method, path,
+                       duration * 1000, ';'.join(top[0][0].split(';')[-3:]) if top else 'no samples')
+        return profile
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            while self._active:
+                frames = sys._current_frames()
+                with self._lock:
+                    for thread_id, samples in self._active.items():
+                        frame = frames.get(thread_id)
+                        if frame is not None:
+                            samples[_collapse(frame)] += 1
+                time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{getattr(code, "co_qualname", code.co_name)}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def get_profiler():
+    return current_app.extensions.get('request_profiler')
+
+
+def init_app(app):
+    """Time every request, its SQL, external calls and templates; optionally profile slow requests
+
+    METRICS_ENABLED (default on) turns recording off. PROFILE_SLOW_REQUESTS_MS
+    enables the sampling profiler and keeps profiles of requests slower than that.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    slow_threshold = app.config.get('PROFILE_SLOW_REQUESTS_MS', 0) / 1000
+    if slow_threshold:
+        app.extensions['request_profiler'] = SamplingProfiler(
+            interval=app.config.get('PROFILE_INTERVAL', DEFAULT_PROFILE_INTERVAL))
+
+    @app.before_request
+    def start_request_timer():
+        g._request_started = time.perf_counter()
+        if slow_threshold:
+            app.extensions['request_profiler'].begin()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.observe(elapsed, endpoint, request.method, str(response.status_code))
+
+        stats = query_counter.current_stats()
+        REQUEST_QUERIES.observe(stats.count, endpoint)
+        REQUEST_SQL_TIME.observe(stats.duration, endpoint)
+        REQUEST_EXTERNAL_TIME.observe(g.get('_external_seconds', 0.0), endpoint)
+
+        if slow_threshold:
+            samples = app.extensions['request_profiler'].end()
+            if samples is not None and elapsed >= slow_threshold:
+                app.extensions['request_profiler'].record(request.method, request.path, elapsed, samples)
+        return response
+
+    @app.teardown_request
+    def stop_request_profile(exc=None):
+        # A request that never reached after_request must not stay registered
+        if slow_threshold:
+            app.extensions['request_profiler'].end()
+
+    def start_template_timer(sender, template, context, **extra):
+        g.setdefault('_template_started', []).append(time.perf_counter())
+
+    def record_template_time(sender, template, context, **extra):
+        starts = g.get('_template_started')
+        if starts:
+            TEMPLATE_RENDER_TIME.observe(time.perf_counter() - starts.pop(), template.name or 'string')
+
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(record_template_time, app, weak=False)
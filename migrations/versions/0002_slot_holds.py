@@ -0,0 +1,44 @@
+"""slot holds and claims
+
+Revision ID: 0002_slot_holds
+Revises: 0001_baseline
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_slot_holds'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hold_expires_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_booking_date_time', ['booking_date', 'booking_time'], unique=False)
+
+    op.create_table('slot_claim',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('booking_id', sa.Integer(), nullable=False),
+    sa.Column('slot_date', sa.Date(), nullable=False),
+    sa.Column('slot_minute', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['booking_id'], ['booking.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('slot_date', 'slot_minute', name='uq_slot_claim_cell')
+    )
+    with op.batch_alter_table('slot_claim', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_slot_claim_booking_id'), ['booking_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('slot_claim', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_slot_claim_booking_id'))
+
+    op.drop_table('slot_claim')
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.drop_index('ix_booking_date_time')
+        batch_op.drop_column('hold_expires_at')
@@ -0,0 +1,46 @@
+"""booking and payment hot path indexes
+
+Revision ID: 0003_hot_path_indexes
+Revises: 0002_slot_holds
+Create Date: 2026-10-17 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_hot_path_indexes'
+down_revision = '0002_slot_holds'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_user_payment_date', ['user_id', 'payment_status', 'booking_date', 'booking_time'], unique=False)
+        batch_op.create_index('ix_booking_user_date', ['user_id', 'booking_date'], unique=False)
+        batch_op.create_index('ix_booking_payment_created', ['payment_status', 'created_at'], unique=False)
+        batch_op.create_index('ix_booking_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_booking_payment_intent', ['stripe_payment_intent_id'], unique=False)
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_booking_id'), ['booking_id'], unique=False)
+
+    with op.batch_alter_table('session_log', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_session_log_booking_id'), ['booking_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('session_log', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_session_log_booking_id'))
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payment_booking_id'))
+
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.drop_index('ix_booking_payment_intent')
+        batch_op.drop_index('ix_booking_created_at')
+        batch_op.drop_index('ix_booking_payment_created')
+        batch_op.drop_index('ix_booking_user_date')
+        batch_op.drop_index('ix_booking_user_payment_date')
@@ -0,0 +1,35 @@
+"""booking rollups
+
+Revision ID: 0004_booking_rollups
+Revises: 0003_hot_path_indexes
+Create Date: 2026-10-17 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_booking_rollups'
+down_revision = '0003_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate with `flask rebuild-rollups` after upgrading
+    op.create_table('booking_rollup',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(length=5), nullable=False),
+    sa.Column('period_start', sa.Date(), nullable=False),
+    sa.Column('session_type', sa.String(length=50), nullable=False),
+    sa.Column('bookings', sa.Integer(), nullable=False),
+    sa.Column('paid_bookings', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('period', 'period_start', 'session_type', name='uq_booking_rollup_bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('booking_rollup')
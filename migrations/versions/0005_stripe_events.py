@@ -0,0 +1,38 @@
+"""stripe webhook event queue
+
+Revision ID: 0005_stripe_events
+Revises: 0004_booking_rollups
+Create Date: 2026-10-17 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_stripe_events'
+down_revision = '0004_booking_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.String(length=255), nullable=False),
+    sa.Column('event_type', sa.String(length=100), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id')
+    )
+    with op.batch_alter_table('stripe_event', schema=None) as batch_op:
+        batch_op.create_index('ix_stripe_event_pending', ['processed_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stripe_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_stripe_event_pending')
+
+    op.drop_table('stripe_event')
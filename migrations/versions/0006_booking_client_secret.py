@@ -0,0 +1,26 @@
+"""store PaymentIntent client secret on booking
+
+Revision ID: 0006_booking_client_secret
+Revises: 0005_stripe_events
+Create Date: 2026-10-17 09:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_booking_client_secret'
+down_revision = '0005_stripe_events'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stripe_client_secret', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.drop_column('stripe_client_secret')
@@ -0,0 +1,37 @@
+"""session chat messages
+
+Revision ID: 0007_session_messages
+Revises: 0006_booking_client_secret
+Create Date: 2026-10-17 10:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007_session_messages'
+down_revision = '0006_booking_client_secret'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('session_message',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('booking_id', sa.Integer(), nullable=False),
+    sa.Column('sender', sa.String(length=20), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['booking_id'], ['booking.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('session_message', schema=None) as batch_op:
+        batch_op.create_index('ix_session_message_booking', ['booking_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('session_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_session_message_booking')
+
+    op.drop_table('session_message')
@@ -0,0 +1,29 @@
+"""keyset index for the admin booking browser
+
+Revision ID: 0009_booking_keyset_index
+Revises: 0008_hedra_sessions
+Create Date: 2026-10-17 10:50:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009_booking_keyset_index'
+down_revision = '0008_hedra_sessions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (created_at, id) serves everything the created_at index did, plus seeks past a page
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_created_id', ['created_at', 'id'], unique=False)
+        batch_op.drop_index('ix_booking_created_at')
+
+
+def downgrade():
+    with op.batch_alter_table('booking', schema=None) as batch_op:
+        batch_op.create_index('ix_booking_created_at', ['created_at'], unique=False)
+        batch_op.drop_index('ix_booking_created_id')
@@ -0,0 +1,30 @@
+"""count failed stripe event applications and set repeat offenders aside
+
+Revision ID: 0011_stripe_event_attempts
+Revises: 0010_notifications
+Create Date: 2026-10-17 13:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011_stripe_event_attempts'
+down_revision = '0010_notifications'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stripe_event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_error', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('failed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('stripe_event', schema=None) as batch_op:
+        batch_op.drop_column('failed_at')
+        batch_op.drop_column('last_error')
+        batch_op.drop_column('attempts')
@@ -0,0 +1,42 @@
+"""one session log per booking
+
+Revision ID: 0012_session_log_unique_booking
+Revises: 0011_stripe_event_attempts
+Create Date: 2026-10-17 13:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012_session_log_unique_booking'
+down_revision = '0011_stripe_event_attempts'
+branch_labels = None
+depends_on = None
+
+MERGED_COLUMNS = ('session_ended_at', 'actual_duration', 'session_notes', 'user_rating', 'user_feedback')
+
+
+def upgrade():
+    # Concurrent flushes could insert a second log for a booking; fold the newest
+    # value of each column into the oldest log, which is the one the app read, then drop the rest
+    for column in MERGED_COLUMNS:
+        op.execute(
+            f'UPDATE session_log SET {column} = ('
+            f'SELECT d.{column} FROM session_log d WHERE d.booking_id = session_log.booking_id '
+            f'AND d.{column} IS NOT NULL ORDER BY d.id DESC LIMIT 1) '
+            f'WHERE EXISTS (SELECT 1 FROM session_log d WHERE d.booking_id = session_log.booking_id '
+            f'AND d.id <> session_log.id AND d.{column} IS NOT NULL)'
+        )
+    op.execute('DELETE FROM session_log WHERE id NOT IN (SELECT MIN(id) FROM session_log GROUP BY booking_id)')
+
+    with op.batch_alter_table('session_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_session_log_booking_id')
+        batch_op.create_index('ix_session_log_booking_id', ['booking_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('session_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_session_log_booking_id')
+        batch_op.create_index('ix_session_log_booking_id', ['booking_id'], unique=False)
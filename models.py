@@ -1,10 +1,8 @@
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
-import pytz
+from werkzeug.security import check_password_hash
 
-db = SQLAlchemy()
+from app import db, TIMEZONE
 
 class User(UserMixin, db.Model):
     """User model for authentication and profile management"""
@@ -22,13 +20,28 @@ class User(UserMixin, db.Model):
     bookings = db.relationship('Booking', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from app.auth import hash_password
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
 class Booking(db.Model):
     """Booking model for session management"""
+    __table_args__ = (
+        # Availability engine reads a date range of bookings per request
+        db.Index('ix_booking_date_time', 'booking_date', 'booking_time'),
+        # dashboard(): upcoming paid sessions, then recent history, per user
+        db.Index('ix_booking_user_payment_date', 'user_id', 'payment_status', 'booking_date', 'booking_time'),
+        db.Index('ix_booking_user_date', 'user_id', 'booking_date'),
+        # admin_dashboard(): revenue sums and paid counts, recent bookings
+        db.Index('ix_booking_payment_created', 'payment_status', 'created_at'),
+        # admin booking browser: keyset pagination on (created_at, id)
+        db.Index('ix_booking_created_id', 'created_at', 'id'),
+        # stripe_webhook(): look bookings up by their PaymentIntent
+        db.Index('ix_booking_payment_intent', 'stripe_payment_intent_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     session_type = db.Column(db.String(50), nullable=False)  # quick_guidance, deep_dive, intensive_healing
@@ -36,21 +49,81 @@ class Booking(db.Model):
     booking_time = db.Column(db.Time, nullable=False)
     duration = db.Column(db.Integer, nullable=False)  # in minutes
     price = db.Column(db.Integer, nullable=False)  # in cents
-    status = db.Column(db.String(20), default='pending')  # pending, paid, completed, cancelled
+    status = db.Column(db.String(20), default='pending')  # pending, paid, completed, cancelled, conflict
     special_requests = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Payment tracking
     stripe_payment_intent_id = db.Column(db.String(255), nullable=True)
+    stripe_client_secret = db.Column(db.String(255), nullable=True)  # lets the payment page render without calling Stripe
     payment_status = db.Column(db.String(20), default='pending')  # pending, succeeded, failed
     paid_at = db.Column(db.DateTime, nullable=True)
 
+    # Unpaid bookings hold their slot until this time (UTC), then get swept
+    hold_expires_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    slot_claims = db.relationship('SlotClaim', backref='booking', lazy=True, cascade='all, delete-orphan')
+
+    @property
+    def hold_expired(self):
+        """True when an unpaid booking's slot hold has lapsed"""
+        if self.status == 'cancelled':
+            return True
+        return (self.payment_status != 'succeeded'
+                and self.hold_expires_at is not None
+                and self.hold_expires_at <= datetime.utcnow())
+
+    # Hot-path queries, shared by the views and the query plan audit
+
+    @classmethod
+    def upcoming_for_user(cls, user_id, today):
+        """Paid sessions from today on, soonest first"""
+        return cls.query.filter_by(
+            user_id=user_id,
+            payment_status='succeeded'
+        ).filter(
+            cls.booking_date >= today
+        ).order_by(cls.booking_date.asc(), cls.booking_time.asc())
+
+    @classmethod
+    def history_for_user(cls, user_id, today):
+        """Sessions before today, most recent first"""
+        return cls.query.filter_by(
+            user_id=user_id
+        ).filter(
+            cls.booking_date < today
+        ).order_by(cls.booking_date.desc())
+
+    @classmethod
+    def recent(cls):
+        """All bookings, newest first"""
+        return cls.query.order_by(cls.created_at.desc(), cls.id.desc())
+
+    @classmethod
+    def browse(cls, status=None, payment_status=None, session_type=None, start=None, end=None):
+        """Filtered admin listing, newest first, with each booking's user loaded in the same query"""
+        query = cls.recent().options(db.joinedload(cls.user))
+        if status:
+            query = query.filter(cls.status == status)
+        if payment_status:
+            query = query.filter(cls.payment_status == payment_status)
+        if session_type:
+            query = query.filter(cls.session_type == session_type)
+        if start:
+            query = query.filter(cls.booking_date >= start)
+        if end:
+            query = query.filter(cls.booking_date <= end)
+        return query
+
+    @classmethod
+    def by_payment_intent(cls, payment_intent_id):
+        return cls.query.filter_by(stripe_payment_intent_id=payment_intent_id)
+
     @property
     def booking_datetime_cst(self):
         """Returns booking datetime in CST"""
-        utc_dt = datetime.combine(self.booking_date, self.booking_time)
-        cst = pytz.timezone('US/Central')
-        return cst.localize(utc_dt)
+        return TIMEZONE.localize(datetime.combine(self.booking_date, self.booking_time))
 
     @property
     def price_dollars(self):
@@ -102,10 +175,21 @@ class AvailableSlot(db.Model):
 
         return slots
 
+class SlotClaim(db.Model):
+    """One claimed 10-minute cell of the calendar; the unique key makes double booking impossible"""
+    __table_args__ = (
+        db.UniqueConstraint('slot_date', 'slot_minute', name='uq_slot_claim_cell'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False, index=True)
+    slot_date = db.Column(db.Date, nullable=False)
+    slot_minute = db.Column(db.Integer, nullable=False)  # minutes after midnight CST, multiple of 10
+
 class Payment(db.Model):
     """Payment tracking for Stripe integration"""
     id = db.Column(db.Integer, primary_key=True)
-    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False, index=True)
     stripe_payment_intent_id = db.Column(db.String(255), unique=True, nullable=False)
     amount = db.Column(db.Integer, nullable=False)  # in cents
     currency = db.Column(db.String(3), default='usd')
@@ -116,10 +200,41 @@ class Payment(db.Model):
     # Relationship
     booking = db.relationship('Booking', backref='payments')
 
+class BookingRollup(db.Model):
+    """Daily and monthly booking/revenue totals per session type, kept in step with Booking"""
+    __table_args__ = (
+        db.UniqueConstraint('period', 'period_start', 'session_type', name='uq_booking_rollup_bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(5), nullable=False)  # day, month
+    period_start = db.Column(db.Date, nullable=False)  # bucket of Booking.created_at
+    session_type = db.Column(db.String(50), nullable=False)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    paid_bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)  # in cents
+
+class StripeEvent(db.Model):
+    """Raw Stripe webhook event, stored on receipt and applied later by the webhook worker"""
+    __table_args__ = (
+        db.Index('ix_stripe_event_pending', 'processed_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(255), unique=True, nullable=False)
+    event_type = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    # Failed applications; after MAX_EVENT_ATTEMPTS the event is set aside (failed_at) for a person to look at
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_error = db.Column(db.Text, nullable=True)
+    failed_at = db.Column(db.DateTime, nullable=True)
+
 class SessionLog(db.Model):
     """Log of actual sessions conducted"""
     id = db.Column(db.Integer, primary_key=True)
-    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False, index=True, unique=True)
     session_started_at = db.Column(db.DateTime, nullable=True)
     session_ended_at = db.Column(db.DateTime, nullable=True)
     actual_duration = db.Column(db.Integer, nullable=True)  # in minutes
@@ -130,3 +245,54 @@ class SessionLog(db.Model):
 
     # Relationship
     booking = db.relationship('Booking', backref='session_logs')
+
+class SessionMessage(db.Model):
+    """Chat message sent during a session, written in batches by the session log buffer"""
+    __table_args__ = (
+        db.Index('ix_session_message_booking', 'booking_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False)
+    sender = db.Column(db.String(20), nullable=False, default='user')  # user, system
+    body = db.Column(db.Text, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class HedraSession(db.Model):
+    """Avatar session provisioned with Hedra ahead of a booking's start time"""
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), unique=True, nullable=False)
+    external_id = db.Column(db.String(255), nullable=True)
+    join_url = db.Column(db.Text, nullable=True)  # short-lived, carries no API key
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, ready, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    booking = db.relationship('Booking', backref=db.backref('hedra_session', uselist=False))
+
+    def usable(self, now=None):
+        now = now or datetime.utcnow()
+        return self.status == 'ready' and (self.expires_at is None or self.expires_at > now)
+
+class Notification(db.Model):
+    """Outbox row for an email about a booking, written with the change and sent by the notification worker"""
+    __table_args__ = (
+        db.UniqueConstraint('booking_id', 'kind', name='uq_notification_booking_kind'),
+        # Dispatcher: due rows in send order
+        db.Index('ix_notification_pending', 'status', 'send_after'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # confirmation, reminder, slot_conflict
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed, skipped
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    send_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # UTC; pushed back on retry and while claimed
+    sent_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    booking = db.relationship('Booking')
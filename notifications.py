@@ -0,0 +1,310 @@
+import logging
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import BUSINESS_NAME, ADMIN_EMAIL, SESSION_TYPES, TIMEZONE, metrics
+from app.models import db, Booking, Notification
+from app.workers import PeriodicWorker, register_worker
+
+logger = logging.getLogger(__name__)
+
+CONFIRMATION = 'confirmation'
+REMINDER = 'reminder'
+SLOT_CONFLICT = 'slot_conflict'  # to the admin: paid, but the slot went to another booking
+DEFAULT_DISPATCH_INTERVAL = 30  # seconds; commits that queue mail wake the worker, this is only the safety net
+DEFAULT_REMINDER_LEAD_HOURS = 24
+REMINDER_QUIET_PERIOD = timedelta(hours=1)  # a booking paid this recently just got its confirmation
+DISPATCH_BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 60  # seconds, doubled after every failed attempt
+SMTP_TIMEOUT = 10  # seconds
+SMTP_IDLE_TIMEOUT = 60  # seconds; reconnect rather than reuse a connection the server may have dropped
+CLAIM_TIMEOUT = 300  # seconds; a row claimed by a process that died is sent by another after this
+
+
+class Mailer:
+    """One SMTP connection, opened on first use and reused for every message after it"""
+
+    def __init__(self, host, port, username=None, password=None, starttls=False,
+                 timeout=SMTP_TIMEOUT, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.connections = 0
+        self._smtp = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        self.connections += 1
+        return smtp
+
+    def _close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except OSError:
+                pass
+            self._smtp = None
+
+    def send(self, message):
+        """Send an EmailMessage; raises smtplib/socket errors for the caller to retry"""
+        with self._lock:
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._close()
+            for attempt in (1, 2):
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                try:
+                    with metrics.external_call('smtp', 'send_message'):
+                        self._smtp.send_message(message)
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    # The server closed a connection we were reusing; reconnect once
+                    self._smtp = None
+                    if attempt == 2:
+                        raise
+                except smtplib.SMTPResponseException:
+                    raise  # the server answered; the connection is still good
+                except OSError:
+                    self._smtp = None
+                    raise
+            self._last_used = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def get_mailer():
+    """Mailer for the current app, or None when SMTP_HOST isn't configured"""
+    mailer = current_app.extensions.get('mailer')
+    if mailer is None and current_app.config.get('SMTP_HOST'):
+        config = current_app.config
+        mailer = current_app.extensions.setdefault('mailer', Mailer(
+            config['SMTP_HOST'], config.get('SMTP_PORT', 587),
+            username=config.get('SMTP_USERNAME'), password=config.get('SMTP_PASSWORD'),
+            starttls=config.get('SMTP_STARTTLS', False)
+        ))
+    return mailer
+
+
+# Outbox: rows are written in the caller's transaction and sent after it commits
+
+def enqueue(booking, kind):
+    """Queue an email about `booking`; the caller commits"""
+    db.session.add(Notification(booking_id=booking.id, kind=kind, status='pending', attempts=0,
+                                send_after=datetime.utcnow()))
+    db.session.info['notifications_queued'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop('notifications_queued', False):
+        notification_worker.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_queued(session):
+    session.info.pop('notifications_queued', None)
+
+
+def queue_reminders(now=None, lead_hours=DEFAULT_REMINDER_LEAD_HOURS):
+    """Queue reminders for paid bookings starting within `lead_hours`; returns how many"""
+    now = now or datetime.now(TIMEZONE)
+    horizon = now + timedelta(hours=lead_hours)
+
+    # The date range reads ix_booking_date_time; the anti-join skips bookings already reminded
+    candidates = db.session.query(Booking.id, Booking.booking_date, Booking.booking_time).outerjoin(
+        Notification, db.and_(Notification.booking_id == Booking.id, Notification.kind == REMINDER)
+    ).filter(
+        Booking.booking_date.between(now.date(), horizon.date()),
+        Booking.payment_status == 'succeeded',
+        Booking.status.notin_(('cancelled', 'completed', 'conflict')),
+        Booking.paid_at < datetime.utcnow() - REMINDER_QUIET_PERIOD,
+        Notification.id == None  # noqa: E711
+    ).all()
+
+    utcnow = datetime.utcnow()
+    rows = [{'booking_id': booking_id, 'kind': REMINDER, 'status': 'pending', 'attempts': 0,
+             'send_after': utcnow, 'created_at': utcnow}
+            for booking_id, booking_date, booking_time in candidates
+            if now < TIMEZONE.localize(datetime.combine(booking_date, booking_time)) <= horizon]
+    if not rows:
+        return 0
+    try:
+        db.session.execute(insert(Notification), rows)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker process queued the same reminders first
+        db.session.rollback()
+        return 0
+    return len(rows)
+
+
+# Dispatch
+
+def _claim(batch_size, now):
+    """Mark up to `batch_size` due rows as being sent by this process, and return them
+
+    Every worker process runs a dispatcher. Selecting and claiming in one
+    conditional UPDATE lets only one of them take each row, on any database. A
+    claimed row is due again after CLAIM_TIMEOUT, in case the process that
+    claimed it died mid-batch.
+    """
+    due = (Notification.status.in_(('pending', 'sending')), Notification.send_after <= now)
+    candidates = select(Notification.id).where(*due).order_by(
+        Notification.send_after, Notification.id).limit(batch_size)
+    if db.engine.dialect.name == 'postgresql':
+        # Skip rows another dispatcher is claiming instead of waiting for it
+        candidates = candidates.with_for_update(skip_locked=True)
+
+    claimed = db.session.execute(
+        update(Notification).where(Notification.id.in_(candidates.scalar_subquery()), *due).values(
+            status='sending', send_after=now + timedelta(seconds=CLAIM_TIMEOUT)
+        ).returning(Notification.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.session.commit()
+    if not claimed:
+        return []
+    return Notification.query.filter(Notification.id.in_(claimed)).options(
+        # Every message needs its booking and recipient
+        db.joinedload(Notification.booking, innerjoin=True).joinedload(Booking.user, innerjoin=True)
+    ).order_by(Notification.id).all()
+
+
+def build_message(notification):
+    booking = notification.booking
+    user = booking.user
+    starts = booking.booking_datetime_cst
+    session_name = SESSION_TYPES.get(booking.session_type, {}).get('name', booking.session_type)
+    when = f'{starts:%A, %B} {starts.day} at {starts:%I:%M %p} {starts.tzname()}'
+
+    message = EmailMessage()
+    message['From'] = current_app.config.get('MAIL_FROM') or f'{BUSINESS_NAME} <{ADMIN_EMAIL}>'
+    if notification.kind == SLOT_CONFLICT:
+        message['To'] = ADMIN_EMAIL
+        message['Subject'] = f'Booking {booking.id} was paid but its time is taken'
+        message.set_content(f'{user.first_name} ({user.email}) paid for a {session_name} on {when}, '
+                            f'but the slot hold had lapsed and another booking now holds that time.\n\n'
+                            f'Booking {booking.id} is marked "conflict". Please refund it or agree a new time.\n')
+        return message
+
+    message['To'] = user.email
+    if notification.kind == CONFIRMATION:
+        message['Subject'] = f'Your {session_name} is confirmed'
+        intro = f'Thank you for your booking. Your {session_name} ({booking.duration} minutes) is confirmed for {when}.'
+    else:
+        message['Subject'] = f'Reminder: your {session_name} is coming up'
+        intro = f'This is a reminder that your {session_name} ({booking.duration} minutes) starts {when}.'
+    message.set_content(f'Hi {user.first_name},\n\n{intro}\n\n'
+                        f'You can join the session room from your dashboard a few minutes before it starts.\n\n'
+                        f'{BUSINESS_NAME}\n')
+    return message
+
+
+def _failed(notification, error, permanent=False):
+    notification.attempts += 1
+    notification.last_error = str(error)
+    if permanent or notification.attempts >= MAX_ATTEMPTS:
+        notification.status = 'failed'
+        logger.warning('Giving up on %s email for booking %s: %s', notification.kind, notification.booking_id, error)
+    else:
+        notification.status = 'pending'
+        notification.send_after = datetime.utcnow() + timedelta(seconds=RETRY_BACKOFF * 2 ** (notification.attempts - 1))
+
+
+def dispatch(batch_size=DISPATCH_BATCH_SIZE):
+    """Send due notifications over one reused SMTP connection; returns emails sent
+
+    Rows are claimed a batch at a time, and each outcome is committed as soon
+    as it is known, so a later failure can never cause a message to be sent again.
+    """
+    mailer = get_mailer()
+    if mailer is None:
+        return 0
+
+    sent = 0
+    while True:
+        batch = _claim(batch_size, datetime.utcnow())
+        if not batch:
+            break
+
+        unreachable = False
+        for notification in batch:
+            if unreachable:
+                # Hand the rest back rather than leave them claimed until CLAIM_TIMEOUT
+                notification.status = 'pending'
+                notification.send_after = datetime.utcnow()
+                continue
+            booking = notification.booking
+            if booking.status == 'cancelled' or (
+                    notification.kind == REMINDER and booking.booking_datetime_cst <= datetime.now(TIMEZONE)):
+                notification.status = 'skipped'
+                db.session.commit()
+                continue
+            try:
+                mailer.send(build_message(notification))
+            except smtplib.SMTPRecipientsRefused as e:
+                _failed(notification, e, permanent=True)
+            except smtplib.SMTPResponseException as e:
+                _failed(notification, e, permanent=e.smtp_code >= 500)
+            except OSError as e:
+                # Server unreachable or the connection dropped; the rest wait for the next run
+                _failed(notification, e)
+                unreachable = True
+            except Exception as e:
+                # e.g. a header build_message can't encode; retrying would fail the same way
+                logger.exception('Could not send %s email for booking %s', notification.kind, notification.booking_id)
+                _failed(notification, e, permanent=True)
+            else:
+                notification.status = 'sent'
+                notification.sent_at = datetime.utcnow()
+                sent += 1
+            db.session.commit()
+        db.session.commit()
+
+        if unreachable or len(batch) < batch_size:
+            break
+    return sent
+
+
+def run():
+    """Queue due reminders, then send everything pending"""
+    queue_reminders(lead_hours=current_app.config.get('REMINDER_LEAD_HOURS', DEFAULT_REMINDER_LEAD_HOURS))
+    return dispatch()
+
+
+notification_worker = PeriodicWorker('notifications', DEFAULT_DISPATCH_INTERVAL, run)
+
+
+def init_app(app):
+    """Register the notification worker and its CLI command"""
+    notification_worker.interval = app.config.get('NOTIFICATION_INTERVAL', DEFAULT_DISPATCH_INTERVAL)
+    register_worker(app, notification_worker)
+
+    @app.cli.command('send-notifications')
+    def send_notifications_command():
+        """Queue due session reminders and send pending booking emails."""
+        print(f'Sent {run()} emails')
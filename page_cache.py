@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, request, session, render_template, make_response
+from flask_login import current_user
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+GZIP_MIN_BYTES = 512
+
+# A rendered page in both encodings; the strong ETag is derived from the identity body
+CachedPage = namedtuple('CachedPage', 'body gzip_body etag')
+
+
+class PageCacheBackend:
+    """Shared store (e.g. Redis or Memcached) for rendered pages, keyed by string"""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, page):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class InMemoryPageCacheBackend(PageCacheBackend):
+    """Per-process LRU bounded by the total size of the stored bodies"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cost(page):
+        return len(page.body) + len(page.gzip_body or b'')
+
+    def get(self, key):
+        page = self._entries.get(key)
+        if page is not None:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+        return page
+
+    def set(self, key, page):
+        cost = self._cost(page)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= self._cost(previous)
+            self._entries[key] = page
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self._cost(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+def get_page_cache():
+    return current_app.extensions['page_cache']
+
+
+def fingerprint(context):
+    """Stable digest of a template's inputs; any change to them (e.g. pricing) is a new key"""
+    encoded = json.dumps(context, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def cacheable():
+    """Only anonymous GETs with nothing pending in the session share a rendering"""
+    return (current_app.config.get('PAGE_CACHE_ENABLED', True)
+            and not current_app.jinja_env.auto_reload
+            and request.method in ('GET', 'HEAD')
+            and '_flashes' not in session
+            and not current_user.is_authenticated)
+
+
+def build_page(html):
+    body = html.encode('utf-8')
+    gzip_body = gzip.compress(body, compresslevel=9, mtime=0) if len(body) >= GZIP_MIN_BYTES else None
+    return CachedPage(body, gzip_body, hashlib.sha256(body).hexdigest()[:32])
+
+
+def page_response(page):
+    """Response for a cached page, honouring If-None-Match and Accept-Encoding"""
+    use_gzip = page.gzip_body is not None and 'gzip' in request.accept_encodings
+    # Each encoding is a different representation, so it gets its own strong ETag
+    etag = f'{page.etag}-gz' if use_gzip else page.etag
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(page.gzip_body if use_gzip else page.body)
+        response.mimetype = 'text/html'
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.vary.update(('Accept-Encoding', 'Cookie'))
+    response.cache_control.no_cache = True
+    return response
+
+
+def render_cached(template_name, **context):
+    """render_template for public pages; anonymous visitors get a shared, pre-compressed rendering
+
+    Keyed on the template, its context and the requested URL (without query string,
+    so tracking parameters don't fragment the cache).
+    """
+    if not cacheable():
+        return render_template(template_name, **context)
+
+    key = f'{template_name}:{request.base_url}:{fingerprint(context)}'
+    cache = get_page_cache()
+    page = cache.get(key)
+    if page is None:
+        page = build_page(render_template(template_name, **context))
+        cache.set(key, page)
+    return page_response(page)
+
+
+def init_app(app, backend=None):
+    """Install the page cache; `backend` (or PAGE_CACHE_BACKEND) shares it between workers"""
+    backend = backend or app.config.get('PAGE_CACHE_BACKEND')
+    app.extensions['page_cache'] = backend or InMemoryPageCacheBackend(
+        max_bytes=app.config.get('PAGE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    )
+
+    @app.cli.command('clear-page-cache')
+    def clear_page_cache_command():
+        """Drop every cached page rendering"""
+        get_page_cache().clear()
+        print('Page cache cleared')
@@ -0,0 +1,53 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+
+from app.models import db
+
+KeysetPage = namedtuple('KeysetPage', 'items older newer')
+
+
+def encode_cursor(created_at, row_id):
+    raw = f'{created_at.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; raises ValueError if it was tampered with"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def seek(query, model, before=None, after=None, per_page=50):
+    """One page of `query` (ordered newest first on created_at, id) by keyset rather than OFFSET
+
+    `before` continues to older rows, `after` goes back to newer ones. Each page
+    is an index seek on (created_at, id), so page N costs the same as page 1.
+    """
+    key = db.tuple_(model.created_at, model.id)
+
+    if after:
+        # Walk forwards from the cursor, then present the page newest first again
+        rows = query.filter(key > decode_cursor(after)).order_by(None).order_by(
+            model.created_at.asc(), model.id.asc()).limit(per_page + 1).all()
+        has_newer = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        return KeysetPage(
+            items,
+            older=encode_cursor(items[-1].created_at, items[-1].id) if items else None,
+            newer=encode_cursor(items[0].created_at, items[0].id) if has_newer else None
+        )
+
+    if before:
+        query = query.filter(key < decode_cursor(before))
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    return KeysetPage(
+        items,
+        older=encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > per_page else None,
+        newer=encode_cursor(items[0].created_at, items[0].id) if before and items else None
+    )
@@ -0,0 +1,164 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+from flask import current_app
+
+from app.models import db, Booking, Payment
+from app import notifications, reservations, rollups
+from app.stripe_client import get_stripe_client, REUSABLE_STATUSES, StripeClientError
+
+logger = logging.getLogger(__name__)
+
+PRECREATE_WAIT = 5  # seconds the payment page waits for a background intent creation
+KEY_IN_USE_RETRIES = 3
+KEY_IN_USE_BACKOFF = 0.25  # seconds, doubled after every retry
+
+_executor = None
+_precreating = {}  # booking id -> Future, while its intent is being created in the background
+
+# Pass as `existing` when the caller has already looked and there is no Payment row
+NO_PAYMENT = object()
+
+
+def record_payment(booking, status, payment_intent_id=None, existing=None):
+    """Create or update the Payment row for a PaymentIntent"""
+    payment_intent_id = payment_intent_id or booking.stripe_payment_intent_id
+    if not payment_intent_id:
+        return None
+
+    payment = existing
+    if payment is None:
+        payment = Payment.query.filter_by(stripe_payment_intent_id=payment_intent_id).first()
+    if payment is None or payment is NO_PAYMENT:
+        payment = Payment(
+            booking_id=booking.id,
+            stripe_payment_intent_id=payment_intent_id,
+            amount=booking.price,
+            status=status
+        )
+        db.session.add(payment)
+    elif payment.status != status:
+        payment.status = status
+    return payment
+
+
+def mark_paid(booking, payment_intent_id=None, existing_payment=None):
+    """Transition a booking to paid; returns False if it was already paid
+
+    A booking paid after its lapsed hold went to someone else is marked
+    'conflict' instead of 'paid', and the admin is told to refund or reschedule it.
+    """
+    if booking.payment_status == 'succeeded':
+        return False
+
+    slot_kept = reservations.confirm(booking)
+    rollups.record_payment_succeeded(booking)
+    if payment_intent_id:
+        booking.stripe_payment_intent_id = payment_intent_id
+    booking.payment_status = 'succeeded'
+    booking.paid_at = datetime.utcnow()
+    booking.status = 'paid' if slot_kept else 'conflict'
+    record_payment(booking, 'succeeded', payment_intent_id, existing_payment)
+    # Sent by the notification worker once this transaction commits, never inline
+    if slot_kept:
+        notifications.enqueue(booking, notifications.CONFIRMATION)
+    else:
+        logger.error('Booking %s was paid after its slot was taken; it needs a refund or a new time', booking.id)
+        notifications.enqueue(booking, notifications.SLOT_CONFLICT)
+    return True
+
+
+def mark_failed(booking, payment_intent_id=None, existing_payment=None):
+    """Record a failed attempt; a booking that already succeeded stays paid"""
+    if booking.payment_status == 'succeeded':
+        return False
+
+    booking.payment_status = 'failed'
+    record_payment(booking, 'failed', payment_intent_id, existing_payment)
+    return True
+
+
+def intent_idempotency_key(booking, replaces=None):
+    """Same booking and amount always map to the same PaymentIntent"""
+    key = f'booking-{booking.id}-intent-{booking.price}'
+    return f'{key}-replaces-{replaces}' if replaces else key
+
+
+def ensure_payment_intent(booking, verify=False):
+    """Return (intent id, client secret) for a booking, creating the intent only once
+
+    Without `verify`, a stored intent is trusted and no Stripe call is made.
+    The caller commits.
+    """
+    client = get_stripe_client()
+
+    replaces = None
+    if booking.stripe_payment_intent_id and booking.stripe_client_secret:
+        if not verify:
+            return booking.stripe_payment_intent_id, booking.stripe_client_secret
+        intent = client.retrieve_payment_intent(booking.stripe_payment_intent_id)
+        if intent.status in REUSABLE_STATUSES and intent.amount == booking.price:
+            return intent.id, intent.client_secret
+        replaces = intent.id
+
+    for attempt in range(KEY_IN_USE_RETRIES + 1):
+        try:
+            intent = client.create_payment_intent(
+                amount=booking.price,
+                currency='usd',
+                metadata={
+                    'booking_id': booking.id,
+                    'user_id': booking.user_id,
+                    'session_type': booking.session_type
+                },
+                idempotency_key=intent_idempotency_key(booking, replaces)
+            )
+            break
+        except StripeClientError as e:
+            if e.code != 'idempotency_key_in_use' or attempt == KEY_IN_USE_RETRIES:
+                raise
+        # Another process (usually the pre-create) is creating this intent; use it once committed
+        time.sleep(KEY_IN_USE_BACKOFF * 2 ** attempt)
+        db.session.refresh(booking)
+        if booking.stripe_client_secret and booking.stripe_payment_intent_id not in (None, replaces):
+            return booking.stripe_payment_intent_id, booking.stripe_client_secret
+    booking.stripe_payment_intent_id = intent.id
+    booking.stripe_client_secret = intent.client_secret
+    return intent.id, intent.client_secret
+
+
+def _precreate(app, booking_id):
+    with app.app_context():
+        try:
+            booking = db.session.get(Booking, booking_id)
+            if booking is not None and booking.payment_status != 'succeeded':
+                ensure_payment_intent(booking)
+                db.session.commit()
+        except StripeClientError as e:
+            # The payment page will retry with the same idempotency key
+            logger.warning('Could not pre-create PaymentIntent for booking %s: %s', booking_id, e)
+            db.session.rollback()
+        except Exception:
+            logger.exception('Pre-creating PaymentIntent for booking %s failed', booking_id)
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+
+def precreate_payment_intent(booking):
+    """Create the booking's PaymentIntent in the background after book() commits"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='stripe-intents')
+    future = _precreating[booking.id] = _executor.submit(_precreate, current_app._get_current_object(), booking.id)
+    future.add_done_callback(lambda done, booking_id=booking.id: _precreating.pop(booking_id, None))
+    return future
+
+
+def wait_for_precreate(booking_id, timeout=PRECREATE_WAIT):
+    """Let a background intent creation for this booking finish, rather than race it with the same key"""
+    future = _precreating.get(booking_id)
+    if future is not None:
+        wait([future], timeout=timeout)
@@ -0,0 +1,80 @@
+import logging
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, raiseload
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """SQL statements run while serving one request, and the time spent in them"""
+
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # seconds
+
+
+def current_stats():
+    """Stats for the current request, or None outside a request"""
+    if not has_request_context():
+        return None
+    stats = g.get('_query_stats')
+    if stats is None:
+        stats = g._query_stats = QueryStats()
+    return stats
+
+
+def query_count():
+    stats = current_stats()
+    return stats.count if stats else 0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    stats = current_stats()
+    if started and stats is not None:
+        stats.count += 1
+        stats.duration += time.perf_counter() - started.pop()
+
+
+def _raise_on_lazy_load(orm_execute_state):
+    """With QUERY_RAISELOAD, a relationship the query didn't load raises instead of querying
+
+    Lets the query budget check catch N+1 regressions: every page has to say
+    up front what it reads, with joinedload/selectinload.
+    """
+    if (orm_execute_state.is_select
+            and not orm_execute_state.is_relationship_load
+            and not orm_execute_state.is_column_load
+            and has_app_context() and current_app.config.get('QUERY_RAISELOAD')):
+        orm_execute_state.statement = orm_execute_state.statement.options(raiseload('*', sql_only=True))
+
+
+def init_app(app):
+    """Count queries per request; optionally report them and warn over QUERY_BUDGET"""
+    for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute)):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+    if not event.contains(Session, 'do_orm_execute', _raise_on_lazy_load):
+        event.listen(Session, 'do_orm_execute', _raise_on_lazy_load)
+
+    @app.after_request
+    def report_query_count(response):
+        count = query_count()
+        if app.config.get('QUERY_COUNT_HEADER'):
+            response.headers['X-Query-Count'] = str(count)
+        budget = app.config.get('QUERY_BUDGET')
+        if budget and count > budget:
+            logger.warning('%s %s ran %d queries (budget %d)', request.method, request.path, count, budget)
+        return response
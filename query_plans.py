@@ -0,0 +1,71 @@
+import sys
+from datetime import date, datetime
+
+from sqlalchemy import create_engine
+
+from app.models import db, Booking, BookingRollup, Payment
+
+
+def hot_queries(today=None):
+    """The queries behind dashboard(), admin_dashboard() and stripe_webhook()"""
+    today = today or date.today()
+    return {
+        'dashboard: upcoming sessions': Booking.upcoming_for_user(1, today),
+        'dashboard: past sessions': Booking.history_for_user(1, today).limit(5),
+        'admin: recent bookings': Booking.recent().limit(10),
+        'admin: bookings page': Booking.recent().filter(
+            db.tuple_(Booking.created_at, Booking.id) < (datetime(2030, 1, 1), 1000)).limit(51),
+        'admin: monthly rollups': BookingRollup.query.filter_by(period='month'),
+        'book: rollup bucket': BookingRollup.query.filter_by(
+            period='day', period_start=today, session_type='deep_dive'),
+        'webhook: booking by payment intent': Booking.by_payment_intent('pi_audit'),
+        'webhook: payments for booking': Payment.query.filter_by(booking_id=1),
+    }
+
+
+def explain(connection, query):
+    """Return SQLite EXPLAIN QUERY PLAN detail lines for an ORM query"""
+    compiled = query.statement.compile(dialect=connection.dialect)
+    params = compiled.construct_params()
+    values = tuple(
+        None if params[name] is None else str(params[name])
+        for name in compiled.positiontup
+    )
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', values).fetchall()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    """Plan steps that read a whole table instead of an index"""
+    return [step for step in plan if step.startswith('SCAN') and ' USING ' not in step]
+
+
+def audit(today=None):
+    """Explain every hot query against an empty SQLite copy of the schema
+
+    Returns a dict of query name -> (plan lines, full scan lines).
+    """
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    results = {}
+    with engine.connect() as connection:
+        for name, query in hot_queries(today).items():
+            plan = explain(connection, query)
+            results[name] = (plan, full_scans(plan))
+    engine.dispose()
+    return results
+
+
+def init_app(app):
+    @app.cli.command('audit-query-plans')
+    def audit_query_plans_command():
+        """Fail if any hot query's SQLite plan scans a table without an index."""
+        failures = 0
+        for name, (plan, scans) in audit().items():
+            print(f"{'FAIL' if scans else 'ok  '} {name}")
+            for step in plan:
+                print(f'       {step}')
+            failures += bool(scans)
+        if failures:
+            print(f'{failures} hot queries fall back to full table scans')
+            sys.exit(1)
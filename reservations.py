@@ -0,0 +1,155 @@
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Booking, SlotClaim
+from app.availability import availability, to_minutes
+from app.workers import PeriodicWorker, register_worker
+
+logger = logging.getLogger(__name__)
+
+CLAIM_CELL_MINUTES = 10  # gcd of every session length and the 30-minute slot step
+DEFAULT_HOLD_MINUTES = 15
+DEFAULT_SWEEP_INTERVAL = 60  # seconds
+SWEEP_BATCH_SIZE = 500
+
+
+class SlotUnavailable(Exception):
+    """Raised when another booking already holds part of the requested time"""
+
+
+def claim_cells(booking):
+    """Calendar cells covered by a booking's [start, start + duration) range"""
+    start = to_minutes(booking.booking_time)
+    first = start - start % CLAIM_CELL_MINUTES
+    return list(range(first, start + booking.duration, CLAIM_CELL_MINUTES))
+
+
+def _expired_hold_filter(now):
+    return (
+        (Booking.status == 'pending')
+        & (Booking.payment_status != 'succeeded')
+        & (Booking.hold_expires_at != None)  # noqa: E711
+        & (Booking.hold_expires_at < now)
+    )
+
+
+def _insert_claims(booking, cells):
+    """Insert every claim in one savepoint; the unique key rejects any overlap"""
+    try:
+        with db.session.begin_nested():
+            db.session.add_all([
+                SlotClaim(booking_id=booking.id, slot_date=booking.booking_date, slot_minute=cell)
+                for cell in cells
+            ])
+        return True
+    except IntegrityError:
+        return False
+
+
+def reserve(booking):
+    """Add a pending booking holding its slot, or raise SlotUnavailable
+
+    The caller commits. Contention costs at most one failed insert, one targeted
+    release of lapsed holds and one retry, whatever the number of competing users.
+    """
+    hold_minutes = current_app.config.get('BOOKING_HOLD_MINUTES', DEFAULT_HOLD_MINUTES)
+    booking.hold_expires_at = datetime.utcnow() + timedelta(minutes=hold_minutes)
+
+    db.session.add(booking)
+    db.session.flush()
+
+    cells = claim_cells(booking)
+    if _insert_claims(booking, cells):
+        return booking
+
+    # The cells may belong to holds that lapsed but haven't been swept yet
+    if release_expired_claims(booking.booking_date, cells) and _insert_claims(booking, cells):
+        return booking
+
+    raise SlotUnavailable()
+
+
+def confirm(booking):
+    """Make a paid booking's hold permanent; re-claims cells if the hold was swept
+
+    Returns False when another booking has taken the cells in the meantime.
+    """
+    booking.hold_expires_at = None
+    if booking.status == 'cancelled' or not booking.slot_claims:
+        if booking.status == 'cancelled':
+            booking.status = 'pending'
+        db.session.flush()
+        if not _insert_claims(booking, claim_cells(booking)):
+            return False
+    return True
+
+
+def release_expired_claims(slot_date, cells):
+    """Expire lapsed holds that overlap the given cells; returns how many were released"""
+    now = datetime.utcnow()
+    booking_ids = [row[0] for row in db.session.query(SlotClaim.booking_id).join(Booking).filter(
+        SlotClaim.slot_date == slot_date,
+        SlotClaim.slot_minute.in_(cells),
+        _expired_hold_filter(now)
+    ).distinct().all()]
+    return len(_expire(booking_ids, now)) if booking_ids else 0
+
+
+def _expire(booking_ids, now):
+    """Cancel the bookings whose hold has still lapsed and free their cells; returns their ids
+
+    The hold is re-checked by the UPDATE itself, so a booking paid since it was
+    selected is left alone, claims included.
+    """
+    cancelled = db.session.execute(
+        update(Booking).where(
+            Booking.id.in_(booking_ids),
+            _expired_hold_filter(now)
+        ).values(status='cancelled').returning(Booking.id).execution_options(synchronize_session=False)
+    ).scalars().all()
+    if cancelled:
+        SlotClaim.query.filter(SlotClaim.booking_id.in_(cancelled)).delete(synchronize_session=False)
+    return cancelled
+
+
+def expire_holds(batch_size=SWEEP_BATCH_SIZE):
+    """Bulk-cancel unpaid bookings whose hold lapsed and free their slots"""
+    now = datetime.utcnow()
+    expired = 0
+    while True:
+        rows = db.session.query(Booking.id, Booking.booking_date).filter(
+            _expired_hold_filter(now)
+        ).limit(batch_size).all()
+        if not rows:
+            break
+
+        cancelled = set(_expire([booking_id for booking_id, _ in rows], now))
+        db.session.commit()
+
+        # Bulk statements bypass ORM events, so invalidate availability by hand
+        availability.invalidate({booking_date for booking_id, booking_date in rows if booking_id in cancelled})
+        expired += len(cancelled)
+        if len(rows) < batch_size:
+            break
+
+    if expired:
+        logger.info('Expired %d unpaid booking holds', expired)
+    return expired
+
+
+hold_sweeper = PeriodicWorker('hold-sweeper', DEFAULT_SWEEP_INTERVAL, expire_holds)
+
+
+def init_app(app):
+    """Register the hold sweeper and its CLI command"""
+    hold_sweeper.interval = app.config.get('HOLD_SWEEP_INTERVAL', DEFAULT_SWEEP_INTERVAL)
+    register_worker(app, hold_sweeper)
+
+    @app.cli.command('sweep-holds')
+    def sweep_holds_command():
+        """Cancel unpaid bookings whose slot hold has expired."""
+        print(f'Expired {expire_holds()} booking holds')
@@ -0,0 +1,108 @@
+from datetime import date, datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Booking, BookingRollup
+
+PERIODS = ('day', 'month')
+
+
+def _bucket(period, day):
+    return day if period == 'day' else day.replace(day=1)
+
+
+def _created_day(booking):
+    return (booking.created_at or datetime.utcnow()).date()
+
+
+def _bump(day, session_type, **deltas):
+    """Add deltas to the day and month rows for a bucket inside the caller's transaction"""
+    for period in PERIODS:
+        key = dict(period=period, period_start=_bucket(period, day), session_type=session_type)
+        values = {getattr(BookingRollup, column): getattr(BookingRollup, column) + delta
+                  for column, delta in deltas.items()}
+
+        if BookingRollup.query.filter_by(**key).update(values, synchronize_session=False):
+            continue
+        try:
+            # First event for this bucket; a concurrent insert falls through to the update
+            with db.session.begin_nested():
+                db.session.add(BookingRollup(**key, **deltas))
+        except IntegrityError:
+            BookingRollup.query.filter_by(**key).update(values, synchronize_session=False)
+
+
+def record_booking_created(booking):
+    """Count a new booking; call before committing it"""
+    _bump(_created_day(booking), booking.session_type, bookings=1)
+
+
+def record_payment_succeeded(booking):
+    """Count a booking's transition to a succeeded payment; call once per transition"""
+    _bump(_created_day(booking), booking.session_type, paid_bookings=1, revenue=booking.price)
+
+
+def dashboard_stats(today=None):
+    """Admin revenue and conversion figures from monthly rollup rows"""
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    rows = db.session.query(
+        BookingRollup.period_start,
+        db.func.sum(BookingRollup.bookings),
+        db.func.sum(BookingRollup.paid_bookings),
+        db.func.sum(BookingRollup.revenue)
+    ).filter(
+        BookingRollup.period == 'month'
+    ).group_by(BookingRollup.period_start).all()
+
+    stats = {'total_revenue': 0, 'monthly_revenue': 0, 'total_bookings': 0, 'paid_bookings': 0}
+    for period_start, bookings, paid_bookings, revenue in rows:
+        stats['total_bookings'] += bookings or 0
+        stats['paid_bookings'] += paid_bookings or 0
+        stats['total_revenue'] += revenue or 0
+        if period_start >= month_start:
+            stats['monthly_revenue'] += revenue or 0
+    return stats
+
+
+def rebuild():
+    """Recompute every rollup row from the Booking table"""
+    created_day = db.func.date(Booking.created_at)
+    paid = Booking.payment_status == 'succeeded'
+    rows = db.session.query(
+        created_day,
+        Booking.session_type,
+        db.func.count(Booking.id),
+        db.func.sum(db.case((paid, 1), else_=0)),
+        db.func.sum(db.case((paid, Booking.price), else_=0))
+    ).group_by(created_day, Booking.session_type).all()
+
+    totals = {}
+    for day, session_type, bookings, paid_bookings, revenue in rows:
+        if day is None:
+            continue
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        elif isinstance(day, datetime):
+            day = day.date()
+        for period in PERIODS:
+            bucket = totals.setdefault((period, _bucket(period, day), session_type), [0, 0, 0])
+            bucket[0] += bookings or 0
+            bucket[1] += paid_bookings or 0
+            bucket[2] += revenue or 0
+
+    BookingRollup.query.delete(synchronize_session=False)
+    db.session.add_all([
+        BookingRollup(period=period, period_start=period_start, session_type=session_type,
+                      bookings=bookings, paid_bookings=paid_bookings, revenue=revenue)
+        for (period, period_start, session_type), (bookings, paid_bookings, revenue) in totals.items()
+    ])
+    db.session.commit()
+    return len(totals)
+
+
+def init_app(app):
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups_command():
+        """Rebuild the admin dashboard rollups from existing bookings."""
+        print(f'Rebuilt {rebuild()} rollup rows')
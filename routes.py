@@ -1,35 +1,38 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, session, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, current_app, Response
 from flask_login import login_user, login_required, logout_user, current_user
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, date, time, timedelta
-import stripe
-import pytz
-import requests
-import json
 from app.models import db, User, Booking, Payment, SessionLog, AvailableSlot
 from app.forms import RegistrationForm, LoginForm, BookingForm, PaymentForm, ContactForm, AdminSlotForm
+from app.availability import availability
+from app import (admission, assets, auth, page_cache, reservations, rollups, payments, webhooks,
+                 session_log, session_events, hedra, exports, pagination, metrics, timezones, database)
+from app.stripe_client import StripeClientError
 
 # Import app configuration
-from app import app, STRIPE_PUBLISHABLE_KEY, HEDRA_API_KEY, SESSION_TYPES, BUSINESS_NAME, TIKTOK_URL, TIMEZONE
+from app import SESSION_TYPES, BUSINESS_NAME, TIKTOK_URL, TIMEZONE
 
-@app.route('/')
+bp = Blueprint('main', __name__)
+
+@bp.route('/')
 def home():
     """Homepage with Zahrah branding and service overview"""
-    return render_template('home.html', 
-                         business_name=BUSINESS_NAME,
-                         session_types=SESSION_TYPES,
-                         tiktok_url=TIKTOK_URL)
+    return page_cache.render_cached('home.html',
+                                    business_name=BUSINESS_NAME,
+                                    session_types=SESSION_TYPES,
+                                    tiktok_url=TIKTOK_URL)
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     """User registration with validation"""
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(
             username=form.username.data,
-            email=form.email.data,
+            email=auth.normalize_email(form.email.data),
             first_name=form.first_name.data,
             last_name=form.last_name.data,
             phone=form.phone.data
@@ -41,24 +44,25 @@ def register():
 
         flash('Welcome to Divine Talks! Your spiritual journey begins now.', 'success')
         login_user(user)
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     return render_template('register.html', form=form, business_name=BUSINESS_NAME)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """User login with username or email support"""
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     form = LoginForm()
     if form.validate_on_submit():
-        # Try username first, then email
-        user = User.query.filter_by(username=form.username.data).first()
-        if not user:
-            user = User.query.filter_by(email=form.username.data).first()
+        try:
+            user = auth.authenticate(form.username.data, form.password.data)
+        except auth.AuthBusy:
+            flash('We are handling many sign-ins right now. Please try again in a moment.', 'error')
+            return render_template('login.html', form=form, business_name=BUSINESS_NAME), 503
 
-        if user and user.check_password(form.password.data):
+        if user:
             login_user(user, remember=form.remember_me.data)
 
             # Redirect to next page if available
@@ -68,40 +72,32 @@ def login():
 
             # Redirect based on user role
             if user.is_admin:
-                return redirect(url_for('admin_dashboard'))
+                return redirect(url_for('main.admin_dashboard'))
             else:
-                return redirect(url_for('dashboard'))
+                return redirect(url_for('main.dashboard'))
         else:
             flash('Invalid username/email or password. Please try again.', 'error')
 
     return render_template('login.html', form=form, business_name=BUSINESS_NAME)
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """User logout"""
     logout_user()
     flash('You have been safely logged out. Until we meet again! 🌟', 'success')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@database.replica_reads
 def dashboard():
     """User dashboard with booking overview"""
     # Get user's upcoming sessions
-    upcoming_sessions = Booking.query.filter_by(
-        user_id=current_user.id,
-        payment_status='succeeded'
-    ).filter(
-        Booking.booking_date >= date.today()
-    ).order_by(Booking.booking_date.asc(), Booking.booking_time.asc()).all()
+    upcoming_sessions = Booking.upcoming_for_user(current_user.id, date.today()).all()
 
     # Get recent booking history
-    past_sessions = Booking.query.filter_by(
-        user_id=current_user.id
-    ).filter(
-        Booking.booking_date < date.today()
-    ).order_by(Booking.booking_date.desc()).limit(5).all()
+    past_sessions = Booking.history_for_user(current_user.id, date.today()).limit(5).all()
 
     return render_template('dashboard.html',
                          upcoming_sessions=upcoming_sessions,
@@ -109,7 +105,7 @@ def dashboard():
                          business_name=BUSINESS_NAME,
                          session_types=SESSION_TYPES)
 
-@app.route('/book', methods=['GET', 'POST'])
+@bp.route('/book', methods=['GET', 'POST'])
 @login_required
 def book():
     """Session booking with CST timezone handling"""
@@ -135,18 +131,29 @@ def book():
             special_requests=form.special_requests.data
         )
 
-        db.session.add(booking)
-        db.session.commit()
+        # Hold the slot until payment; the database rejects overlapping holds
+        try:
+            reservations.reserve(booking)
+            rollups.record_booking_created(booking)
+            db.session.commit()
+            payments.precreate_payment_intent(booking)
+        except reservations.SlotUnavailable:
+            db.session.rollback()
+            flash('Someone just booked that time. Please choose another slot.', 'error')
+            return render_template('book.html',
+                                 form=form,
+                                 session_types=SESSION_TYPES,
+                                 business_name=BUSINESS_NAME)
 
         # Redirect to payment
-        return redirect(url_for('payment', booking_id=booking.id))
+        return redirect(url_for('main.payment', booking_id=booking.id))
 
     return render_template('book.html', 
                          form=form, 
                          session_types=SESSION_TYPES,
                          business_name=BUSINESS_NAME)
 
-@app.route('/get_available_times')
+@bp.route('/get_available_times')
 @login_required
 def get_available_times():
     """AJAX endpoint for getting available times for a date"""
@@ -154,100 +161,168 @@ def get_available_times():
     if not date_str:
         return jsonify({'error': 'Date required'}), 400
 
+    # Labels may be shown in the client's own zone; values stay CST for booking.
+    # A zone we don't know falls back to Central rather than failing the form.
+    zone = timezones.label_zone(request.args.get('tz'))
+
+    # Only offer slots long enough for the chosen session
+    session_details = SESSION_TYPES.get(request.args.get('session_type'))
+    duration = session_details['duration'] if session_details else None
+
     try:
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        available_times = BookingForm.get_available_times_for_date(selected_date)
-        return jsonify({'times': available_times})
+        available_times = BookingForm.get_available_times_for_date(selected_date, duration, zone)
+        return jsonify({'times': available_times, 'timezone': zone})
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
 
-@app.route('/payment/<int:booking_id>')
+MAX_AVAILABILITY_RANGE_DAYS = 42  # six calendar weeks covers any month view
+
+@bp.route('/get_available_times_range')
+@login_required
+def get_available_times_range():
+    """AJAX endpoint returning open times per session type for a week or month"""
+    start_str = request.args.get('start')
+    if not start_str:
+        return jsonify({'error': 'Start date required'}), 400
+
+    zone = timezones.label_zone(request.args.get('tz'))
+
+    try:
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
+        if request.args.get('end'):
+            end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+        else:
+            end_date = start_date + timedelta(days=int(request.args.get('days', 7)) - 1)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+
+    if end_date < start_date:
+        return jsonify({'error': 'End date must not be before start date'}), 400
+    # Never offer days that have already passed in CST; a range wholly in the past has none
+    start_date = max(start_date, datetime.now(TIMEZONE).date())
+    if (end_date - start_date).days >= MAX_AVAILABILITY_RANGE_DAYS:
+        return jsonify({'error': f'Range limited to {MAX_AVAILABILITY_RANGE_DAYS} days'}), 400
+
+    days = availability.days(start_date, end_date)
+    durations = {key: details['duration'] for key, details in SESSION_TYPES.items()}
+    open_starts = {
+        day: {key: day_availability.open_starts(duration) for key, duration in durations.items()}
+        for day, day_availability in sorted(days.items())
+    }
+
+    # One label per distinct start and day, converted in a batch and cached per (zone, date)
+    labels = {}
+    for day, by_type in open_starts.items():
+        starts = sorted({start for starts in by_type.values() for start in starts})
+        labels[day.isoformat()] = dict(zip((f'{start // 60:02d}:{start % 60:02d}' for start in starts),
+                                           timezones.slot_labels(day, starts, zone)))
+
+    response = jsonify({
+        'timezone': 'CST',
+        'label_timezone': zone,
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'session_types': durations,
+        'days': {
+            day.isoformat(): {
+                key: [f'{start // 60:02d}:{start % 60:02d}' for start in starts]
+                for key, starts in by_type.items()
+            }
+            for day, by_type in open_starts.items()
+        },
+        'labels': labels
+    })
+
+    # Let browsers and proxies revalidate instead of refetching the whole range
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    if days:
+        response.last_modified = max(availability.last_modified(day) for day in days)
+    response.add_etag()
+    return response.make_conditional(request)
+
+@bp.route('/payment/<int:booking_id>')
 @login_required
 def payment(booking_id):
     """Payment page with Stripe integration"""
+    # book() just handed intent creation to this process's background pool
+    payments.wait_for_precreate(booking_id)
     booking = Booking.query.get_or_404(booking_id)
 
     # Ensure user owns this booking
     if booking.user_id != current_user.id:
         flash('You can only pay for your own bookings.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     # Check if already paid
     if booking.payment_status == 'succeeded':
         flash('This session has already been paid for.', 'info')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-    try:
-        # Create Stripe PaymentIntent
-        intent = stripe.PaymentIntent.create(
-            amount=booking.price,
-            currency='usd',
-            metadata={
-                'booking_id': booking.id,
-                'user_id': current_user.id,
-                'session_type': booking.session_type
-            }
-        )
+    # Unpaid holds lapse so abandoned checkouts don't block the calendar
+    if booking.hold_expired:
+        flash('Your reserved time has expired. Please choose a time again.', 'info')
+        return redirect(url_for('main.book'))
 
-        # Update booking with payment intent
-        booking.stripe_payment_intent_id = intent.id
-        db.session.commit()
+    try:
+        # Reuse the intent created when the booking was made; after a failed
+        # attempt, check with Stripe that it can still be paid
+        intent_id, client_secret = payments.ensure_payment_intent(
+            booking, verify=booking.payment_status == 'failed')
+        if db.session.is_modified(booking):
+            db.session.commit()
 
         return render_template('payment.html',
                              booking=booking,
-                             client_secret=intent.client_secret,
-                             stripe_publishable_key=STRIPE_PUBLISHABLE_KEY,
+                             client_secret=client_secret,
+                             stripe_publishable_key=current_app.config['STRIPE_PUBLISHABLE_KEY'],
                              business_name=BUSINESS_NAME)
 
-    except stripe.error.StripeError as e:
+    except StripeClientError as e:
         flash(f'Payment setup error: {str(e)}', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-@app.route('/payment_success/<int:booking_id>')
+@bp.route('/payment_success/<int:booking_id>')
 @login_required
 def payment_success(booking_id):
     """Payment success confirmation"""
-    booking = Booking.query.get_or_404(booking_id)
+    # Confirming the payment reads the slot hold. The row lock makes a webhook
+    # drain marking the same booking paid wait for this request, or this one for it
+    booking = Booking.query.options(db.selectinload(Booking.slot_claims)).filter_by(
+        id=booking_id).with_for_update(of=Booking).first_or_404()
 
     if booking.user_id != current_user.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
-
-    # Mark booking as paid
-    booking.payment_status = 'succeeded'
-    booking.paid_at = datetime.utcnow()
-    booking.status = 'paid'
-
-    # Create payment record
-    payment = Payment(
-        booking_id=booking.id,
-        stripe_payment_intent_id=booking.stripe_payment_intent_id,
-        amount=booking.price,
-        status='succeeded'
-    )
-
-    db.session.add(payment)
-    db.session.commit()
+        return redirect(url_for('main.dashboard'))
+
+    # Mark booking as paid and record the payment (no-op if the webhook got here first)
+    try:
+        payments.mark_paid(booking)
+        db.session.commit()
+    except IntegrityError:
+        # Without row locks (SQLite) the drain can still commit the same payment first
+        db.session.rollback()
 
     flash('Payment successful! Your session with Zahrah is confirmed. 🌟', 'success')
     return render_template('payment_success.html', 
                          booking=booking,
                          business_name=BUSINESS_NAME)
 
-@app.route('/session_room/<int:booking_id>')
+@bp.route('/session_room/<int:booking_id>')
 @login_required
 def session_room(booking_id):
     """Session room for Hedra avatar interaction"""
-    booking = Booking.query.get_or_404(booking_id)
+    booking = Booking.query.options(db.joinedload(Booking.hedra_session)).get_or_404(booking_id)
 
     # Security checks
     if booking.user_id != current_user.id:
         flash('Access denied.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     if booking.payment_status != 'succeeded':
         flash('Please complete payment before accessing your session.', 'error')
-        return redirect(url_for('payment', booking_id=booking.id))
+        return redirect(url_for('main.payment', booking_id=booking.id))
 
     # Check if session is today and within time window
     now_cst = datetime.now(TIMEZONE)
@@ -259,45 +334,155 @@ def session_room(booking_id):
 
     if now_cst < access_time:
         flash(f'Session room opens at {access_time.strftime("%I:%M %p CST")}', 'info')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     if now_cst > end_time:
         flash('Session time has ended.', 'info')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
+
+    session_log.start(booking.id)
+    # Usually provisioned minutes ago by the background worker
+    hedra_session = hedra.session_for(booking)
 
     return render_template('session_room.html',
                          booking=booking,
-                         hedra_api_key=HEDRA_API_KEY,
+                         hedra_join_url=hedra_session.join_url if hedra_session else None,
                          business_name=BUSINESS_NAME)
 
-@app.route('/admin')
+def _session_payload():
+    """JSON body and booking id of a session-room API call, or an error response"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return None, None, (jsonify({'error': 'JSON body required'}), 400)
+    try:
+        booking_id = int(payload.get('booking_id'))
+    except (TypeError, ValueError):
+        return None, None, (jsonify({'error': 'booking_id required'}), 400)
+    if not session_log.authorize(booking_id, current_user):
+        return None, None, (jsonify({'error': 'Session not found'}), 404)
+    return payload, booking_id, None
+
+@bp.route('/api/session-message', methods=['POST'])
+@login_required
+def session_message():
+    """Chat messages from the session room; accepts `message` or a `messages` batch"""
+    payload, booking_id, error = _session_payload()
+    if error:
+        return error
+    try:
+        messages = session_log.parse_messages(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    session_log.record_messages(booking_id, messages)
+    return jsonify({'status': 'ok', 'received': len(messages)}), 202
+
+@bp.route('/api/save-session-notes', methods=['POST'])
+@login_required
+def save_session_notes():
+    """Note autosave; only the latest notes per flush interval reach the database"""
+    payload, booking_id, error = _session_payload()
+    if error:
+        return error
+    notes = payload.get('notes')
+    if not isinstance(notes, str):
+        return jsonify({'error': 'notes required'}), 400
+    try:
+        session_log.save_notes(booking_id, notes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'status': 'ok'}), 202
+
+@bp.route('/api/complete-session', methods=['POST'])
+@login_required
+def complete_session():
+    """End a session, writing any messages and notes sent along with it"""
+    payload, booking_id, error = _session_payload()
+    if error:
+        return error
+    try:
+        messages = session_log.parse_messages(payload) if 'messages' in payload else []
+        if isinstance(payload.get('notes'), str):
+            session_log.save_notes(booking_id, payload['notes'])
+        rating = payload.get('rating')
+        if rating is not None and (not isinstance(rating, int) or not 1 <= rating <= 5):
+            raise ValueError('rating must be between 1 and 5')
+        feedback = payload.get('feedback')
+        if feedback is not None and not isinstance(feedback, str):
+            raise ValueError('feedback must be a string')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if messages:
+        session_log.record_messages(booking_id, messages)
+    session_log.complete(booking_id, rating=rating, feedback=feedback)
+    session_events.publish_booking_state(db.session.get(Booking, booking_id))
+    return jsonify({'status': 'completed'})
+
+@bp.route('/api/session-events/<int:booking_id>')
+@login_required
+def session_event_stream(booking_id):
+    """Server-sent events with the session's authoritative timing, phase changes and notices"""
+    if not session_log.authorize(booking_id, current_user):
+        return jsonify({'error': 'Session not found'}), 404
+
+    state = session_events.room_state(db.session.get(Booking, booking_id))
+    # The stream can stay open for the whole session; don't hold a pooled connection for it
+    db.session.close()
+
+    # A stream occupies a worker thread until it ends, so admission counts it until then
+    return Response(admission.hold(session_events.get_broker().stream(booking_id, state)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/admin/session/<int:booking_id>/end', methods=['POST'])
+@login_required
+def admin_end_session(booking_id):
+    """End a live session for everyone in the room"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    booking = Booking.query.get_or_404(booking_id)
+
+    session_log.complete(booking.id)
+    db.session.refresh(booking)
+    session_events.publish_booking_state(booking)
+    return jsonify({'status': booking.status})
+
+@bp.route('/admin/session/<int:booking_id>/notice', methods=['POST'])
+@login_required
+def admin_session_notice(booking_id):
+    """Show a message in a live session room"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+    payload = request.get_json(silent=True) or request.form
+    message = (payload.get('message') or '').strip()
+    if not message or len(message) > session_log.MAX_MESSAGE_LENGTH:
+        return jsonify({'error': 'message required'}), 400
+
+    session_events.notify(booking_id, message)
+    return jsonify({'status': 'sent'})
+
+@bp.route('/admin')
 @login_required
+@database.replica_reads
 def admin_dashboard():
     """Admin dashboard for Tina"""
     if not current_user.is_admin:
         flash('Access denied. Admin privileges required.', 'error')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
     # Get statistics
     today = date.today()
 
     # Recent bookings
-    recent_bookings = Booking.query.order_by(
-        Booking.created_at.desc()
-    ).limit(10).all()
+    recent_bookings = Booking.recent().options(db.joinedload(Booking.user)).limit(10).all()
 
-    # Revenue statistics
-    total_revenue = db.session.query(db.func.sum(Booking.price)).filter(
-        Booking.payment_status == 'succeeded'
-    ).scalar() or 0
-
-    monthly_revenue = db.session.query(db.func.sum(Booking.price)).filter(
-        Booking.payment_status == 'succeeded',
-        Booking.created_at >= today.replace(day=1)
-    ).scalar() or 0
-
-    total_bookings = Booking.query.count()
-    paid_bookings = Booking.query.filter_by(payment_status='succeeded').count()
+    # Revenue statistics from monthly rollups instead of scanning every booking
+    stats = rollups.dashboard_stats(today)
+    total_revenue = stats['total_revenue']
+    monthly_revenue = stats['monthly_revenue']
+    total_bookings = stats['total_bookings']
+    paid_bookings = stats['paid_bookings']
 
     conversion_rate = (paid_bookings / total_bookings * 100) if total_bookings > 0 else 0
 
@@ -309,44 +494,152 @@ def admin_dashboard():
                          conversion_rate=round(conversion_rate, 1),
                          business_name=BUSINESS_NAME)
 
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Fingerprinted static assets built by `flask build-assets`"""
+    return assets.send_asset(filename)
+
+ADMIN_BOOKINGS_PER_PAGE = 50
+
+@bp.route('/admin/bookings')
+@login_required
+def admin_bookings():
+    """Every booking, newest first, filtered and paged by keyset"""
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('main.dashboard'))
+
+    filters = {key: request.args.get(key) or None
+               for key in ('status', 'payment_status', 'session_type', 'start', 'end')}
+    try:
+        query = Booking.browse(
+            status=filters['status'],
+            payment_status=filters['payment_status'],
+            session_type=filters['session_type'],
+            start=datetime.strptime(filters['start'], '%Y-%m-%d').date() if filters['start'] else None,
+            end=datetime.strptime(filters['end'], '%Y-%m-%d').date() if filters['end'] else None
+        )
+        page = pagination.seek(query, Booking,
+                               before=request.args.get('before'),
+                               after=request.args.get('after'),
+                               per_page=ADMIN_BOOKINGS_PER_PAGE)
+    except ValueError:
+        flash('Invalid filter or page link.', 'error')
+        return redirect(url_for('main.admin_bookings'))
+
+    active_filters = {key: value for key, value in filters.items() if value}
+    return render_template('admin_bookings.html',
+                         bookings=page.items,
+                         older_url=url_for('main.admin_bookings', before=page.older, **active_filters) if page.older else None,
+                         newer_url=url_for('main.admin_bookings', after=page.newer, **active_filters) if page.newer else None,
+                         filters=filters,
+                         session_types=SESSION_TYPES,
+                         business_name=BUSINESS_NAME)
+
+@bp.route('/admin/confirm-booking/<int:booking_id>', methods=['POST'])
+@login_required
+def admin_confirm_booking(booking_id):
+    """Confirm a pending booking, making its slot hold permanent"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+
+    booking = Booking.query.options(db.selectinload(Booking.slot_claims)).get_or_404(booking_id)
+    if booking.status != 'pending':
+        return jsonify({'error': f'Booking is {booking.status}'}), 409
+    if not reservations.confirm(booking):
+        db.session.rollback()
+        return jsonify({'error': 'The time slot has been taken by another booking'}), 409
+
+    booking.status = 'confirmed'
+    db.session.commit()
+    return jsonify({'status': booking.status})
+
+@bp.route('/admin/export/<kind>')
+@login_required
+def admin_export(kind):
+    """Stream bookings, payments or session logs as CSV or JSONL for bookkeeping"""
+    if not current_user.is_admin:
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('main.dashboard'))
+
+    fmt = request.args.get('format', 'csv')
+    if kind not in exports.EXPORTS or fmt not in exports.FORMATS:
+        return jsonify({'error': 'Unknown export'}), 404
+    try:
+        filters = exports.parse_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+
+    # Rows are read on a dedicated connection while the response streams
+    response = Response(exports.stream(db.engine, kind, fmt, **filters), mimetype=exports.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{exports.filename(kind, fmt, **filters)}"'
+    return response
+
+@bp.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    """Latency, SQL, template and external-call histograms in Prometheus text format"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+
+    response = Response(metrics.expose(), mimetype='text/plain')
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    response.cache_control.no_store = True
+    return response
+
+@bp.route('/admin/metrics/profiles')
+@login_required
+def admin_profiles():
+    """Stack samples of recent slow requests, in collapsed format for flame graphs"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin privileges required'}), 403
+
+    profiler = metrics.get_profiler()
+    if profiler is None:
+        return jsonify({'error': 'Profiling is off; set PROFILE_SLOW_REQUESTS_MS'}), 404
+
+    sections = [f'# {profile.recorded_at.isoformat()} {profile.method} {profile.path} '
+                f'{profile.duration * 1000:.0f} ms\n{profile.collapsed()}\n'
+                for profile in reversed(profiler.profiles)]
+    return Response('\n'.join(sections), mimetype='text/plain')
+
+# Health checks for the load balancer and deploys
+@bp.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness: the database is reachable"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+    except Exception:
+        db.session.rollback()
+        return jsonify({'status': 'unavailable'}), 503
+    return jsonify({'status': 'ok'})
+
 # Error handlers
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html', business_name=BUSINESS_NAME), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('errors/500.html', business_name=BUSINESS_NAME), 500
 
 # Webhook handler for Stripe
-@app.route('/stripe_webhook', methods=['POST'])
+@bp.route('/stripe_webhook', methods=['POST'])
 def stripe_webhook():
     """Handle Stripe webhooks"""
     payload = request.get_data()
     sig_header = request.headers.get('Stripe-Signature')
 
     try:
-        # Verify webhook signature (you'll need to set STRIPE_WEBHOOK_SECRET)
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, os.environ.get('STRIPE_WEBHOOK_SECRET', '')
-        )
-    except ValueError:
+        # Verify and store the event; the webhook worker applies it in batches
+        webhooks.ingest(payload, sig_header)
+    except webhooks.InvalidWebhook:
         return 'Invalid payload', 400
-    except stripe.error.SignatureVerificationError:
-        return 'Invalid signature', 400
-
-    # Handle payment_intent.succeeded event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        booking_id = payment_intent['metadata'].get('booking_id')
-
-        if booking_id:
-            booking = Booking.query.get(booking_id)
-            if booking:
-                booking.payment_status = 'succeeded'
-                booking.paid_at = datetime.utcnow()
-                booking.status = 'paid'
-                db.session.commit()
 
     return 'Success', 200
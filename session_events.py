@@ -0,0 +1,201 @@
+import json
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from app.models import Booking
+from app.workers import PeriodicWorker, register_worker
+
+DEFAULT_TICK_INTERVAL = 5  # seconds between phase checks of every open room
+HEARTBEAT_INTERVAL = 15  # seconds; keeps proxies from closing idle streams
+MAX_STREAM_SECONDS = 2 * 3600  # the browser reconnects after this
+SUBSCRIBER_QUEUE_SIZE = 100
+ROOM_OPENS_BEFORE = 15 * 60  # seconds, matching the session_room access window
+ROOM_CLOSES_AFTER = 15 * 60
+ENDING_SOON = 5 * 60
+
+
+def room_state(booking, now=None):
+    """Authoritative timing of a session room; clients count down locally from it"""
+    now = time.time() if now is None else now
+    starts_at = booking.booking_datetime_cst.timestamp()
+    ends_at = starts_at + booking.duration * 60
+    closes_at = ends_at + ROOM_CLOSES_AFTER
+
+    if booking.status in ('completed', 'cancelled') or now >= closes_at:
+        phase = 'ended'
+    elif now < starts_at - ROOM_OPENS_BEFORE:
+        phase = 'closed'
+    elif now < starts_at:
+        phase = 'waiting'
+    elif now < ends_at - ENDING_SOON:
+        phase = 'in_progress'
+    elif now < ends_at:
+        phase = 'ending_soon'
+    else:
+        phase = 'overtime'
+
+    return {
+        'booking_id': booking.id,
+        'phase': phase,
+        'starts_at': starts_at,
+        'ends_at': ends_at,
+        'closes_at': closes_at,
+        'server_now': now,
+    }
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscription:
+    """One connected browser; events are queued until its stream sends them"""
+
+    def __init__(self, booking_id):
+        self.booking_id = booking_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def deliver(self, event, data):
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            # A client this far behind gets dropped and reconnects with fresh state
+            self.closed = True
+
+    def events(self, initial_state):
+        """Server-sent event stream; holds no request context or database connection"""
+        yield f'retry: 5000\n{format_event("state", initial_state)}'
+        if initial_state['phase'] == 'ended':
+            return
+
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while not self.closed and time.monotonic() < deadline:
+            try:
+                event, data = self.queue.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                yield format_event('tick', {'server_now': time.time()})
+                continue
+            yield format_event(event, data)
+            if event == 'state' and data['phase'] == 'ended':
+                break
+
+
+class EventBackend:
+    """Fan-out between processes (e.g. Redis pub/sub); calls `deliver` in every process"""
+
+    def start(self, deliver):
+        raise NotImplementedError
+
+    def publish(self, booking_id, event, data):
+        raise NotImplementedError
+
+
+class LocalEventBackend(EventBackend):
+    """Delivers only within this process; enough for a single worker"""
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, booking_id, event, data):
+        self._deliver(booking_id, event, data)
+
+
+class SessionBroker:
+    """Multiplexes every open session room in this process over one ticker thread"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or LocalEventBackend()
+        self.backend.start(self._deliver)
+        self._rooms = {}  # booking_id -> set of Subscription
+        self._phases = {}  # booking_id -> last phase published
+        self._lock = threading.Lock()
+
+    def subscribe(self, booking_id, phase):
+        subscription = Subscription(booking_id)
+        with self._lock:
+            self._rooms.setdefault(booking_id, set()).add(subscription)
+            self._phases.setdefault(booking_id, phase)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            room = self._rooms.get(subscription.booking_id)
+            if room is not None:
+                room.discard(subscription)
+                if not room:
+                    del self._rooms[subscription.booking_id]
+                    self._phases.pop(subscription.booking_id, None)
+
+    def stream(self, booking_id, initial_state):
+        subscription = self.subscribe(booking_id, initial_state['phase'])
+        try:
+            yield from subscription.events(initial_state)
+        finally:
+            self.unsubscribe(subscription)
+
+    def active_rooms(self):
+        with self._lock:
+            return list(self._rooms)
+
+    def publish(self, booking_id, event, data):
+        self.backend.publish(booking_id, event, data)
+
+    def publish_state(self, state, force=False):
+        """Publish a room's state if its phase changed since it was last published"""
+        with self._lock:
+            if not force and self._phases.get(state['booking_id']) == state['phase']:
+                return False
+            self._phases[state['booking_id']] = state['phase']
+        self.publish(state['booking_id'], 'state', state)
+        return True
+
+    def _deliver(self, booking_id, event, data):
+        with self._lock:
+            subscribers = list(self._rooms.get(booking_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(event, data)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(room) for room in self._rooms.values())
+
+
+def get_broker():
+    return current_app.extensions['session_broker']
+
+
+def tick():
+    """Push phase changes (start, ending soon, end, ended elsewhere) to connected rooms"""
+    broker = get_broker()
+    rooms = broker.active_rooms()
+    if not rooms:
+        return 0
+
+    now = time.time()
+    published = 0
+    for booking in Booking.query.filter(Booking.id.in_(rooms)):
+        published += broker.publish_state(room_state(booking, now))
+    return published
+
+
+def publish_booking_state(booking, force=True):
+    """Push a booking's current state right away, e.g. after an admin action"""
+    get_broker().publish_state(room_state(booking), force=force)
+
+
+def notify(booking_id, message):
+    get_broker().publish(booking_id, 'notice', {'message': message, 'server_now': time.time()})
+
+
+session_ticker = PeriodicWorker('session-ticker', DEFAULT_TICK_INTERVAL, tick)
+
+
+def init_app(app, backend=None):
+    """Install the session broker; `backend` (or SESSION_EVENTS_BACKEND) spans workers"""
+    app.extensions['session_broker'] = SessionBroker(backend or app.config.get('SESSION_EVENTS_BACKEND'))
+    session_ticker.interval = app.config.get('SESSION_TICK_INTERVAL', DEFAULT_TICK_INTERVAL)
+    register_worker(app, session_ticker)
@@ -0,0 +1,285 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models import db, Booking, SessionLog, SessionMessage
+from app.workers import PeriodicWorker, register_worker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 10  # seconds
+DEFAULT_MAX_PENDING_MESSAGES = 50  # per booking, before an immediate flush
+MAX_BATCH_MESSAGES = 100
+MAX_MESSAGE_LENGTH = 2000
+MAX_NOTES_LENGTH = 20000
+MAX_FLUSH_ATTEMPTS = 3  # a booking's writes are dropped after failing this many flushes
+AUTHORIZATION_GRACE = 30 * 60  # seconds an authorized session stays cached past its length
+
+
+class PendingSession:
+    """Writes for one booking that haven't reached the database yet"""
+
+    def __init__(self):
+        self.started_at = None
+        self.ended_at = None
+        self.messages = []
+        self.notes = None
+        self.rating = None
+        self.feedback = None
+        self.failed_flushes = 0
+
+    def merge_older(self, older):
+        """Fold back writes taken by a flush that failed; newer values win"""
+        self.messages[:0] = older.messages
+        self.failed_flushes = older.failed_flushes
+        for field in ('started_at', 'ended_at', 'notes', 'rating', 'feedback'):
+            if getattr(self, field) is None:
+                setattr(self, field, getattr(older, field))
+
+
+class SessionBuffer:
+    """Per-process buffer of session-room writes, flushed to the database in batches"""
+
+    def __init__(self, max_pending_messages=DEFAULT_MAX_PENDING_MESSAGES):
+        self.max_pending_messages = max_pending_messages
+        self._pending = {}
+        self._authorized = {}  # booking_id -> (user_id, expires at)
+        self._lock = threading.Lock()
+
+    def _entry(self, booking_id):
+        entry = self._pending.get(booking_id)
+        if entry is None:
+            entry = self._pending[booking_id] = PendingSession()
+        return entry
+
+    def start(self, booking_id):
+        with self._lock:
+            entry = self._entry(booking_id)
+            if entry.started_at is None:
+                entry.started_at = datetime.utcnow()
+
+    def add_messages(self, booking_id, messages):
+        """Queue messages; returns True when the booking has enough pending to flush now"""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._entry(booking_id)
+            entry.messages.extend((sender, body, now) for sender, body in messages)
+            return len(entry.messages) >= self.max_pending_messages
+
+    def set_notes(self, booking_id, notes):
+        with self._lock:
+            self._entry(booking_id).notes = notes
+
+    def end(self, booking_id, rating=None, feedback=None):
+        with self._lock:
+            entry = self._entry(booking_id)
+            entry.ended_at = datetime.utcnow()
+            entry.rating = rating
+            entry.feedback = feedback
+            self._authorized.pop(booking_id, None)
+
+    def take(self, booking_ids=None):
+        """Remove and return pending writes, for all bookings or the given ones"""
+        with self._lock:
+            if booking_ids is None:
+                taken, self._pending = self._pending, {}
+            else:
+                taken = {booking_id: self._pending.pop(booking_id)
+                         for booking_id in booking_ids if booking_id in self._pending}
+        return taken
+
+    def restore(self, taken):
+        with self._lock:
+            for booking_id, older in taken.items():
+                self._entry(booking_id).merge_older(older)
+
+    def pending_messages(self):
+        return sum(len(entry.messages) for entry in self._pending.values())
+
+    # Authorization is cached so a chat message doesn't cost a booking lookup
+
+    def authorized_user(self, booking_id):
+        entry = self._authorized.get(booking_id)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def remember_authorized(self, booking_id, user_id, seconds):
+        with self._lock:
+            now = time.monotonic()
+            self._authorized[booking_id] = (user_id, now + seconds)
+            for stale in [key for key, (_, expires) in self._authorized.items() if expires < now]:
+                del self._authorized[stale]
+
+
+def get_session_buffer():
+    return current_app.extensions['session_buffer']
+
+
+def authorize(booking_id, user):
+    """True if `user` may write to the session room of a paid booking"""
+    buffer = get_session_buffer()
+    if buffer.authorized_user(booking_id) == user.id:
+        return True
+
+    booking = db.session.get(Booking, booking_id)
+    if booking is None or booking.payment_status != 'succeeded':
+        return False
+    if booking.user_id != user.id and not user.is_admin:
+        return False
+    buffer.remember_authorized(booking_id, user.id, booking.duration * 60 + AUTHORIZATION_GRACE)
+    return True
+
+
+def parse_messages(payload):
+    """(sender, body) pairs from a single `message` or a batched `messages` payload"""
+    raw = payload.get('messages')
+    if raw is None:
+        raw = [payload.get('message')]
+    if not isinstance(raw, list) or len(raw) > MAX_BATCH_MESSAGES:
+        raise ValueError(f'messages must be a list of at most {MAX_BATCH_MESSAGES} items')
+
+    messages = []
+    for item in raw:
+        sender = 'user'
+        if isinstance(item, dict):
+            sender = item.get('sender') if item.get('sender') in ('user', 'system') else 'user'
+            item = item.get('message', item.get('body'))
+        if not isinstance(item, str) or not item.strip():
+            continue
+        if len(item) > MAX_MESSAGE_LENGTH:
+            raise ValueError(f'Messages are limited to {MAX_MESSAGE_LENGTH} characters')
+        messages.append((sender, item.strip()))
+    return messages
+
+
+def start(booking_id):
+    """Note when the session room was first opened; written with the next flush"""
+    get_session_buffer().start(booking_id)
+
+
+def record_messages(booking_id, messages):
+    """Buffer chat messages; flushes this booking inline once enough have piled up"""
+    if messages and get_session_buffer().add_messages(booking_id, messages):
+        flush([booking_id])
+
+
+def save_notes(booking_id, notes):
+    if len(notes) > MAX_NOTES_LENGTH:
+        raise ValueError(f'Notes are limited to {MAX_NOTES_LENGTH} characters')
+    get_session_buffer().set_notes(booking_id, notes)
+
+
+def complete(booking_id, rating=None, feedback=None):
+    """End a session: write everything buffered for it and mark the booking completed"""
+    get_session_buffer().end(booking_id, rating, feedback)
+    flush([booking_id])
+
+
+def flush(booking_ids=None):
+    """Write buffered messages and session logs, in one transaction when possible; returns messages written
+
+    When the batch fails, each booking is written on its own, so one bad entry
+    can't hold back the rest. Entries that still fail go back in the buffer
+    until they have failed MAX_FLUSH_ATTEMPTS flushes, then they are dropped.
+    A database outage keeps everything buffered and re-raises.
+    """
+    buffer = get_session_buffer()
+    taken = buffer.take(booking_ids)
+    if not taken:
+        return 0
+
+    try:
+        return _write(taken)
+    except OperationalError:
+        db.session.rollback()
+        buffer.restore(taken)
+        raise
+    except Exception:
+        db.session.rollback()
+        if len(taken) == 1:
+            _flush_failed(buffer, taken)
+            return 0
+
+    written = 0
+    for booking_id, entry in taken.items():
+        try:
+            written += _write({booking_id: entry})
+        except Exception:
+            db.session.rollback()
+            _flush_failed(buffer, {booking_id: entry})
+    return written
+
+
+def _flush_failed(buffer, taken):
+    """Put back writes a flush couldn't store, or drop them once they have failed too often"""
+    (booking_id, entry), = taken.items()
+    entry.failed_flushes += 1
+    if entry.failed_flushes >= MAX_FLUSH_ATTEMPTS:
+        logger.exception('Dropping %d messages and the session log update for booking %s after %d failed flushes',
+                         len(entry.messages), booking_id, entry.failed_flushes)
+    else:
+        logger.warning('Could not flush session writes for booking %s; will retry', booking_id, exc_info=True)
+        buffer.restore(taken)
+
+
+def _create_log(booking_id, started_at):
+    """Insert a booking's session log, or return the one another process inserted first"""
+    log = SessionLog(booking_id=booking_id, session_started_at=started_at)
+    try:
+        with db.session.begin_nested():
+            db.session.add(log)
+    except IntegrityError:
+        log = SessionLog.query.filter_by(booking_id=booking_id).one()
+    return log
+
+
+def _write(taken):
+    """Store taken writes in one transaction; returns messages written"""
+    logs = {log.booking_id: log
+            for log in SessionLog.query.filter(SessionLog.booking_id.in_(list(taken)))}
+
+    rows = []
+    completed = []
+    for booking_id, entry in taken.items():
+        rows.extend({'booking_id': booking_id, 'sender': sender, 'body': body, 'sent_at': sent_at}
+                    for sender, body, sent_at in entry.messages)
+
+        log = logs.get(booking_id)
+        if log is None:
+            log = _create_log(booking_id, entry.started_at or datetime.utcnow())
+        if entry.notes is not None:
+            log.session_notes = entry.notes
+        if entry.ended_at is not None:
+            log.session_ended_at = entry.ended_at
+            log.actual_duration = round((entry.ended_at - log.session_started_at).total_seconds() / 60)
+            completed.append(booking_id)
+        if entry.rating is not None:
+            log.user_rating = entry.rating
+        if entry.feedback is not None:
+            log.user_feedback = entry.feedback
+
+    if rows:
+        db.session.execute(insert(SessionMessage), rows)
+    if completed:
+        Booking.query.filter(Booking.id.in_(completed)).update(
+            {Booking.status: 'completed'}, synchronize_session=False)
+    db.session.commit()
+    return len(rows)
+
+
+session_log_flusher = PeriodicWorker('session-log-flusher', DEFAULT_FLUSH_INTERVAL, flush)
+
+
+def init_app(app):
+    """Install the session buffer and its periodic flusher"""
+    app.extensions['session_buffer'] = SessionBuffer(
+        max_pending_messages=app.config.get('SESSION_LOG_MAX_PENDING', DEFAULT_MAX_PENDING_MESSAGES)
+    )
+    session_log_flusher.interval = app.config.get('SESSION_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+    register_worker(app, session_log_flusher)
@@ -0,0 +1,123 @@
+"""Local SMTP server that accepts and keeps every message, for development and load tests.
+
+    python -m app.smtp_sink --port 8025 --latency 0.05 --fail-rate 0.1
+    SMTP_HOST=127.0.0.1 SMTP_PORT=8025 flask run
+
+Messages are printed as they arrive. --fail-rate answers that fraction of
+messages with a temporary 451, to exercise the dispatcher's retries.
+"""
+import argparse
+import email
+import random
+import socketserver
+import threading
+import time
+from email import policy
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 smtp-sink ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-smtp-sink')
+                self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.receive(sender, recipients)
+                sender, recipients = None, []
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def receive(self, sender, recipients):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line in (b'.\r\n', b'.\n'):
+                break
+            lines.append(line[1:] if line.startswith(b'..') else line)
+
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.fail_rate:
+            return self.reply('451 Simulated temporary failure')
+
+        message = email.message_from_bytes(b''.join(lines), policy=policy.default)
+        with server.lock:
+            server.messages.append(message)
+        if server.verbose:
+            print(f'--- {sender} -> {", ".join(recipients)}: {message["Subject"]}', flush=True)
+        self.reply('250 OK: queued')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(port=0, latency=0.0, fail_rate=0.0, verbose=False):
+    server = SMTPSink(('127.0.0.1', port), SMTPSinkHandler)
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.verbose = verbose
+    server.messages = []
+    server.connections = 0
+    server.lock = threading.Lock()
+    return server
+
+
+def start_in_background(**options):
+    """Start a sink on a free port; returns (server, port). Call server.shutdown() to stop."""
+    server = make_server(**options)
+    threading.Thread(target=server.serve_forever, name='smtp-sink', daemon=True).start()
+    return server, server.server_address[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every message')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of messages answered with 451')
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency, args.fail_rate, verbose=True)
+    print(f'SMTP sink listening on 127.0.0.1:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
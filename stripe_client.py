@@ -0,0 +1,136 @@
+import itertools
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+from app import metrics
+
+PaymentIntent = namedtuple('PaymentIntent', 'id client_secret status amount')
+
+# Intent states in which the customer can still complete payment
+REUSABLE_STATUSES = {'requires_payment_method', 'requires_confirmation', 'requires_action'}
+
+
+class StripeClientError(Exception):
+    """Raised when Stripe rejects a request or can't be reached
+
+    `code` is Stripe's error code, e.g. 'idempotency_key_in_use', when it sent one.
+    """
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class StripeClient:
+    """The subset of the Stripe API the app uses"""
+
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key=None):
+        raise NotImplementedError
+
+    def retrieve_payment_intent(self, intent_id):
+        raise NotImplementedError
+
+
+class LiveStripeClient(StripeClient):
+    """Talks to api.stripe.com through the official library"""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    @staticmethod
+    def _wrap(intent):
+        return PaymentIntent(intent.id, intent.client_secret, intent.status, intent.amount)
+
+    @metrics.external_call('stripe', 'create_payment_intent')
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key=None):
+        import stripe
+        try:
+            return self._wrap(stripe.PaymentIntent.create(
+                amount=amount,
+                currency=currency,
+                metadata=metadata,
+                idempotency_key=idempotency_key,
+                api_key=self.api_key
+            ))
+        except stripe.error.StripeError as e:
+            raise StripeClientError(str(e), code=e.code)
+
+    @metrics.external_call('stripe', 'retrieve_payment_intent')
+    def retrieve_payment_intent(self, intent_id):
+        import stripe
+        try:
+            return self._wrap(stripe.PaymentIntent.retrieve(intent_id, api_key=self.api_key))
+        except stripe.error.StripeError as e:
+            raise StripeClientError(str(e), code=e.code)
+
+
+class FakeStripeClient(StripeClient):
+    """In-memory stand-in for offline development, benchmarks and load tests
+
+    `latency` (seconds) is slept on every call to mimic the Stripe round trip.
+    Like Stripe, it rejects a create while another with the same idempotency
+    key is still in flight.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.intents = {}
+        self.calls = 0
+        self._idempotent = {}
+        self._in_flight = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @metrics.external_call('stripe', 'create_payment_intent')
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key=None):
+        if idempotency_key:
+            with self._lock:
+                if idempotency_key in self._in_flight:
+                    raise StripeClientError('There is currently another in-progress request using this '
+                                            'idempotency key', code='idempotency_key_in_use')
+                self._in_flight.add(idempotency_key)
+        self._round_trip()
+        with self._lock:
+            self._in_flight.discard(idempotency_key)
+            if idempotency_key in self._idempotent:
+                return self.intents[self._idempotent[idempotency_key]]
+            intent_id = f'pi_fake_{next(self._ids)}'
+            intent = PaymentIntent(intent_id, f'{intent_id}_secret_{secrets.token_hex(8)}',
+                                   'requires_payment_method', amount)
+            self.intents[intent_id] = intent
+            if idempotency_key:
+                self._idempotent[idempotency_key] = intent_id
+            return intent
+
+    @metrics.external_call('stripe', 'retrieve_payment_intent')
+    def retrieve_payment_intent(self, intent_id):
+        self._round_trip()
+        try:
+            return self.intents[intent_id]
+        except KeyError:
+            raise StripeClientError(f'No such payment_intent: {intent_id}')
+
+    def set_status(self, intent_id, status):
+        """Move a fake intent to another state, e.g. 'succeeded'"""
+        self.intents[intent_id] = self.intents[intent_id]._replace(status=status)
+
+
+def get_stripe_client():
+    """Client for the current app, chosen by the STRIPE_CLIENT setting ('live' or 'fake')"""
+    client = current_app.extensions.get('stripe_client')
+    if client is None:
+        if current_app.config.get('STRIPE_CLIENT', 'live') == 'fake':
+            client = FakeStripeClient(latency=current_app.config.get('FAKE_STRIPE_LATENCY', 0.0))
+        else:
+            client = LiveStripeClient(current_app.config.get('STRIPE_SECRET_KEY'))
+        client = current_app.extensions.setdefault('stripe_client', client)
+    return client
@@ -0,0 +1,174 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import pytz
+
+BUSINESS_ZONE = 'US/Central'  # slot times are wall-clock times here
+SECONDS_PER_DAY = 24 * 60 * 60
+MAX_UTC_OFFSET = 15 * 60 * 60  # no zone is further than this from UTC
+TABLE_MARGIN_DAYS = 2  # a year's table reaches into its neighbours for conversions near New Year
+MAX_LABEL_DAYS = 4096  # (zone, date) label sets kept
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class UnknownTimezone(ValueError):
+    """Raised for a zone name that isn't in the IANA database"""
+
+
+def is_known(zone):
+    return zone in pytz.all_timezones_set
+
+
+def label_zone(zone):
+    """`zone` if it's a known IANA name, else BUSINESS_ZONE"""
+    return zone if zone and is_known(zone) else BUSINESS_ZONE
+
+
+def _epoch(value):
+    """Seconds since the epoch for a naive datetime, read as UTC"""
+    return ((value.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY
+            + value.hour * 3600 + value.minute * 60 + value.second)
+
+
+def _wall(day, minute):
+    """A date and minutes after midnight as epoch seconds on the zone's wall clock"""
+    return (day.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY + minute * 60
+
+
+class ZoneYear:
+    """UTC offsets of one zone through one year, as a sorted table of transitions
+
+    Built once from the tz database; converting an instant is then a bisect
+    instead of a pytz localize()/astimezone() per value.
+    """
+
+    def __init__(self, zone, year):
+        tzinfo = pytz.timezone(zone)
+        start = datetime(year, 1, 1) - timedelta(days=TABLE_MARGIN_DAYS)
+        end = datetime(year + 1, 1, 1) + timedelta(days=TABLE_MARGIN_DAYS)
+
+        self.starts, self.offsets, self.dst, self.names = [], [], [], []
+        transitions = getattr(tzinfo, '_utc_transition_times', None)
+        if not transitions:
+            # Fixed-offset zones such as UTC
+            offset = tzinfo.utcoffset(start)
+            self._add(_epoch(start), offset, timedelta(0), tzinfo.tzname(start))
+            return
+
+        first = max(bisect_right(transitions, start) - 1, 0)
+        for index in range(first, len(transitions)):
+            if transitions[index] >= end:
+                break
+            offset, dst, name = tzinfo._transition_info[index]
+            self._add(_epoch(max(transitions[index], start)), offset, dst, name)
+
+    def _add(self, start, offset, dst, name):
+        self.starts.append(start)
+        self.offsets.append(int(offset.total_seconds()))
+        self.dst.append(bool(dst))
+        self.names.append(name)
+
+    def _entry(self, instant):
+        return max(bisect_right(self.starts, instant) - 1, 0)
+
+    def from_utc(self, instant):
+        """(wall-clock epoch seconds, abbreviation) for a UTC instant"""
+        index = self._entry(instant)
+        return instant + self.offsets[index], self.names[index]
+
+    def to_utc(self, wall):
+        """UTC instant for a wall-clock time, resolved as pytz localize() does
+
+        A time repeated when clocks go back is read as standard time; a time
+        skipped when they go forward is read with the offset from before the gap.
+        """
+        first = self._entry(wall - MAX_UTC_OFFSET)
+        last = self._entry(wall + MAX_UTC_OFFSET)
+        valid = []
+        before_gap = None
+        for index in range(first, last + 1):
+            instant = wall - self.offsets[index]
+            if instant < self.starts[index]:
+                continue
+            before_gap = instant
+            if index == last or instant < self.starts[index + 1]:
+                valid.append((self.dst[index], instant))
+        if valid:
+            return min(valid)[1]  # standard time first
+        return before_gap if before_gap is not None else wall - self.offsets[first]
+
+
+@lru_cache(maxsize=256)
+def zone_year(zone, year):
+    if not is_known(zone):
+        raise UnknownTimezone(zone)
+    return ZoneYear(zone, year)
+
+
+def to_utc(day, minutes, zone=BUSINESS_ZONE):
+    """UTC instants (epoch seconds) for wall-clock minutes of one day in `zone`"""
+    table = zone_year(zone, day.year)
+    return [table.to_utc(_wall(day, minute)) for minute in minutes]
+
+
+def convert(day, minutes, zone, source=BUSINESS_ZONE):
+    """Convert a day's slot starts from `source` wall time to `zone`, in one batch
+
+    Returns (local date, local minutes after midnight, abbreviation) per slot.
+    """
+    target = zone_year(zone, day.year)
+    converted = []
+    for instant in to_utc(day, minutes, source):
+        wall, name = target.from_utc(instant)
+        local_day, seconds = divmod(wall, SECONDS_PER_DAY)
+        converted.append((date.fromordinal(local_day + _EPOCH_ORDINAL), seconds // 60, name))
+    return converted
+
+
+def format_label(local_day, minute, name, day=None):
+    """'05:30 PM CST', prefixed with the weekday when the slot falls on another local date"""
+    hour = minute // 60
+    label = f'{hour % 12 or 12:02d}:{minute % 60:02d} {"PM" if hour >= 12 else "AM"} {name}'
+    if day is not None and local_day != day:
+        label = f'{local_day.strftime("%a")} {label}'
+    return label
+
+
+class LabelCache:
+    """Formatted slot labels per (zone, date); the tz rules for a date never change"""
+
+    def __init__(self, max_days=MAX_LABEL_DAYS):
+        self.max_days = max_days
+        self._days = OrderedDict()  # (zone, date) -> {minute: label}
+        self._lock = threading.Lock()
+
+    def labels(self, day, minutes, zone=BUSINESS_ZONE):
+        key = (zone, day)
+        with self._lock:
+            known = self._days.get(key)
+            if known is not None:
+                self._days.move_to_end(key)
+        known = known or {}
+
+        missing = [minute for minute in minutes if minute not in known]
+        if missing:
+            known = dict(known)
+            for minute, (local_day, local_minute, name) in zip(missing, convert(day, missing, zone)):
+                known[minute] = format_label(local_day, local_minute, name, day)
+            with self._lock:
+                self._days[key] = known
+                self._days.move_to_end(key)
+                while len(self._days) > self.max_days:
+                    self._days.popitem(last=False)
+        return [known[minute] for minute in minutes]
+
+
+label_cache = LabelCache()
+
+
+def slot_labels(day, minutes, zone=BUSINESS_ZONE):
+    """Display labels for a day's slot starts (minutes after midnight, business time) in `zone`"""
+    return label_cache.labels(day, minutes, zone)
@@ -0,0 +1,222 @@
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Booking, Payment, StripeEvent
+from app.workers import PeriodicWorker, register_worker
+from app import payments
+
+logger = logging.getLogger(__name__)
+
+HANDLED_EVENTS = {
+    'payment_intent.succeeded': 'succeeded',
+    'payment_intent.payment_failed': 'failed',
+}
+DRAIN_BATCH_SIZE = 100
+MAX_EVENT_ATTEMPTS = 5  # failed applications before an event is set aside
+DEFAULT_DRAIN_INTERVAL = 5  # seconds; ingest wakes the worker, this is only the safety net
+
+
+class InvalidWebhook(Exception):
+    """Raised when a webhook payload can't be parsed or its signature doesn't verify"""
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header for a payload, for local testing without Stripe"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    signed = f'{timestamp}.'.encode('utf-8') + payload
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def ingest(payload, sig_header):
+    """Verify and persist a raw webhook event; returns False for a duplicate delivery"""
+    import stripe
+
+    try:
+        event = stripe.Webhook.construct_event(
+            payload, sig_header, current_app.config.get('STRIPE_WEBHOOK_SECRET') or ''
+        )
+    except (ValueError, stripe.error.SignatureVerificationError) as e:
+        raise InvalidWebhook(str(e))
+
+    try:
+        db.session.add(StripeEvent(
+            event_id=event['id'],
+            event_type=event['type'],
+            payload=payload.decode('utf-8') if isinstance(payload, bytes) else payload
+        ))
+        db.session.commit()
+    except IntegrityError:
+        # Stripe retried an event we already have
+        db.session.rollback()
+        return False
+
+    webhook_worker.wake()
+    return True
+
+
+def _pending(query):
+    query = query.filter(
+        StripeEvent.processed_at == None,  # noqa: E711
+        StripeEvent.failed_at == None  # noqa: E711
+    )
+    if db.engine.dialect.name == 'postgresql':
+        # Let several worker processes drain side by side without sharing rows
+        query = query.with_for_update(skip_locked=True)
+    return query
+
+
+def _pending_events(batch_size):
+    return _pending(StripeEvent.query).order_by(StripeEvent.id).limit(batch_size).all()
+
+
+def _apply_batch(events):
+    """Coalesce a batch of events into at most one transition per booking"""
+    parsed = []
+    for event in events:
+        outcome = HANDLED_EVENTS.get(event.event_type)
+        if outcome is None:
+            continue
+        try:
+            intent = json.loads(event.payload)['data']['object']
+        except (ValueError, KeyError, TypeError):
+            logger.warning('Skipping malformed Stripe event %s', event.event_id)
+            continue
+        booking_id = (intent.get('metadata') or {}).get('booking_id')
+        parsed.append((outcome, intent.get('id'), int(booking_id) if str(booking_id).isdigit() else None))
+
+    if not parsed:
+        return 0
+
+    # One query each for bookings (by id, then by intent) and their payments
+    booking_ids = {booking_id for _, _, booking_id in parsed if booking_id}
+    intent_ids = {intent_id for _, intent_id, _ in parsed if intent_id}
+    # Marking a booking paid reads its slot hold, so load those with the bookings. The
+    # row locks serialize with payment_success marking the same booking paid
+    bookings_query = Booking.query.options(db.selectinload(Booking.slot_claims)).with_for_update(of=Booking)
+    bookings = {booking.id: booking for booking in bookings_query.filter(Booking.id.in_(booking_ids))} if booking_ids else {}
+    by_intent = {}
+    unresolved = {intent_id for _, intent_id, booking_id in parsed if booking_id not in bookings and intent_id}
+    if unresolved:
+        for booking in bookings_query.filter(Booking.stripe_payment_intent_id.in_(unresolved)):
+            bookings[booking.id] = booking
+            by_intent[booking.stripe_payment_intent_id] = booking
+    existing_payments = {
+        payment.stripe_payment_intent_id: payment
+        for payment in Payment.query.filter(Payment.stripe_payment_intent_id.in_(intent_ids))
+    } if intent_ids else {}
+
+    # Later events win, except that a success is final
+    final = {}
+    for outcome, intent_id, booking_id in parsed:
+        booking = bookings.get(booking_id) or by_intent.get(intent_id)
+        if booking is None:
+            logger.warning('Stripe event for unknown booking (intent %s)', intent_id)
+            continue
+        if final.get(booking.id, ('',))[0] != 'succeeded':
+            final[booking.id] = (outcome, intent_id)
+
+    applied = 0
+    for booking_id, (outcome, intent_id) in final.items():
+        transition = payments.mark_paid if outcome == 'succeeded' else payments.mark_failed
+        # Payments were fetched for every intent above; don't look each one up again
+        existing = existing_payments.get(intent_id, payments.NO_PAYMENT) if intent_id else None
+        applied += transition(bookings[booking_id], intent_id, existing)
+    return applied
+
+
+def _apply(events):
+    """Apply events and mark them processed in one transaction"""
+    _apply_batch(events)
+    StripeEvent.query.filter(
+        StripeEvent.id.in_([event.id for event in events])
+    ).update({StripeEvent.processed_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+
+
+def _apply_each(event_ids):
+    """Apply events one per transaction, so one that fails can't hold back the rest; returns how many applied"""
+    applied = 0
+    for event_id in event_ids:
+        event = _pending(StripeEvent.query.filter(StripeEvent.id == event_id)).first()
+        if event is None:
+            continue  # another worker process took it meanwhile
+        try:
+            _apply([event])
+            applied += 1
+        except Exception as e:
+            db.session.rollback()
+            _event_failed(event_id, e)
+    return applied
+
+
+def _event_failed(event_id, error):
+    event = db.session.get(StripeEvent, event_id)
+    event.attempts += 1
+    event.last_error = str(error)
+    if event.attempts >= MAX_EVENT_ATTEMPTS:
+        event.failed_at = datetime.utcnow()
+        logger.error('Setting Stripe event %s aside after %d failed attempts: %s',
+                     event.event_id, event.attempts, error, exc_info=error)
+    else:
+        logger.warning('Applying Stripe event %s failed (attempt %d): %s', event.event_id, event.attempts, error)
+    db.session.commit()
+
+
+def drain(batch_size=DRAIN_BATCH_SIZE):
+    """Apply every pending webhook event, one transaction per batch
+
+    If a batch fails, its events are applied one at a time instead; an event
+    that keeps failing is set aside after MAX_EVENT_ATTEMPTS tries.
+    """
+    processed = 0
+    while True:
+        events = _pending_events(batch_size)
+        if not events:
+            break
+
+        try:
+            _apply(events)
+        except Exception:
+            db.session.rollback()
+            logger.warning('Stripe event batch failed; applying its %d events one at a time', len(events),
+                           exc_info=True)
+            # Events that fail again wait for the next run rather than being retried right away
+            return processed + _apply_each([event.id for event in events])
+
+        processed += len(events)
+        if len(events) < batch_size:
+            break
+    return processed
+
+
+webhook_worker = PeriodicWorker('stripe-webhooks', DEFAULT_DRAIN_INTERVAL, drain)
+
+
+def init_app(app):
+    """Register the webhook worker and its CLI command"""
+    app.config.setdefault('STRIPE_WEBHOOK_SECRET', None)
+    webhook_worker.interval = app.config.get('WEBHOOK_DRAIN_INTERVAL', DEFAULT_DRAIN_INTERVAL)
+    register_worker(app, webhook_worker)
+
+    @app.cli.command('drain-webhooks')
+    def drain_webhooks_command():
+        """Apply stored Stripe webhook events that haven't been processed yet."""
+        print(f'Processed {drain()} webhook events')
+
+    @app.cli.command('retry-webhooks')
+    def retry_webhooks_command():
+        """Queue Stripe webhook events that were set aside after failing again."""
+        retried = StripeEvent.query.filter(StripeEvent.failed_at != None).update(  # noqa: E711
+            {StripeEvent.failed_at: None, StripeEvent.attempts: 0}, synchronize_session=False)
+        db.session.commit()
+        print(f'Queued {retried} webhook events again')
@@ -0,0 +1,76 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """Daemon thread that runs a job inside an app context every `interval` seconds"""
+
+    def __init__(self, name, interval, job):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Run the job now instead of waiting for the next interval"""
+        self._wake.set()
+
+    def run_once(self, app):
+        with app.app_context():
+            try:
+                return self.job()
+            except Exception:
+                logger.exception('Background job %s failed', self.name)
+            finally:
+                # Each run gets a fresh session; never leak one across iterations
+                from app.models import db
+                db.session.remove()
+
+    def _run(self, app):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once(app)
+
+
+def register_worker(app, worker):
+    """Start `worker` lazily in each serving process on its first request"""
+    workers = app.extensions.setdefault('background_workers', {})
+    workers[worker.name] = worker
+
+    if app.extensions.get('background_workers_hooked'):
+        return
+    app.extensions['background_workers_hooked'] = True
+    started = {'pid': None}
+    lock = threading.Lock()
+
+    @app.before_request
+    def _start_background_workers():
+        # Threads don't survive fork, so start them per process after the server forks
+        if started['pid'] == os.getpid() or not app.config.get('BACKGROUND_WORKERS_ENABLED', True):
+            return
+        with lock:
+            if started['pid'] != os.getpid():
+                for registered in app.extensions['background_workers'].values():
+                    registered.start(app)
+                started['pid'] = os.getpid()